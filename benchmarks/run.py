@@ -0,0 +1,159 @@
+#! ./venv/bin/python
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+sys.path.append('./')
+
+from benchmarks.synthetic import make_synthetic_bids
+from utils.argparsers import BaseArgParser
+from utils.bash.generators import BashGroupsGenerator, BashScriptGenerator, BashSequenceGenerator
+from utils.bids import BidsIndex
+from utils.path import save_script
+from utils.subjects import parse_selection
+
+
+def timeit(func, setup=None, repeat: int = 3) -> dict:
+    """
+    Time a function, running an untimed setup before every repetition.
+
+    Args:
+        func (Callable): The function to time.
+        setup (Callable, optional): A function to run before every repetition. Defaults to None.
+        repeat (int, optional): How many times to run the function. Defaults to 3.
+
+    Returns:
+        dict: The best and every measured time, in seconds.
+
+    """
+    times = []
+
+    for _ in range(repeat):
+        if setup:
+            setup()
+
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return {'best_s': min(times), 'times_s': times}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(project_dir: str, params: argparse.Namespace) -> dict:
+    """
+    Build a synthetic project and time the stages of the script generation on it.
+
+    Args:
+        project_dir (str): An empty directory for the synthetic project.
+        params (argparse.Namespace): The size of the cohort (`subjects`, `sessions`, `runs`, `fmaps`), `jobs`, `group_size` and `repeat`.
+
+    Returns:
+        dict: The timing of every stage.
+
+    """
+    dir_bids = os.path.join(project_dir, 'data')
+    dir_work = os.path.join(project_dir, 'fmriprep_work')
+    sessions = [f'ses-{s:02d}' for s in range(1, params.sessions + 1)]
+
+    def build():
+        shutil.rmtree(project_dir, ignore_errors=True)
+        return make_synthetic_bids(dir_bids, params.subjects, params.sessions, params.runs, params.fmaps)
+
+    subjects = build()
+    gen_args = argparse.Namespace(
+        subjects=subjects,
+        sessions=sessions,
+        project_dir=project_dir,
+        jobs=params.jobs,
+        group_size=params.group_size,
+        force=True
+    )
+
+    def drop_index_cache():
+        if os.path.exists(os.path.join(dir_work, 'bids_index.json')):
+            os.remove(os.path.join(dir_work, 'bids_index.json'))
+
+    def index():
+        os.makedirs(dir_work, exist_ok=True)
+        BidsIndex(dir_bids, os.path.join(dir_work, 'bids_index.json')).refresh().save()
+
+    def patch():
+        BashScriptGenerator(gen_args).patch_sidecars()
+
+    results = {}
+    results['synthetic_bids'] = timeit(build, repeat=1)
+    results['bids_index_cold'] = timeit(index, drop_index_cache, params.repeat)
+    results['bids_index_warm'] = timeit(index, repeat=params.repeat)
+    results['patch_sidecars_cold'] = timeit(patch, build, params.repeat)
+    results['patch_sidecars_warm'] = timeit(patch, repeat=params.repeat)
+
+    for name, cls in (('longline', BashScriptGenerator), ('sequence', BashSequenceGenerator), ('groups', BashGroupsGenerator)):
+        results[f'generate_{name}'] = timeit(lambda: cls(gen_args).generate(), repeat=params.repeat)
+
+    results['plan'] = timeit(lambda: BashGroupsGenerator(gen_args).plan(), repeat=params.repeat)
+
+    width = max(2, len(str(params.subjects)))
+    # every subject, without the even ones
+    included = [f'sub-{1:0{width}d}:{params.subjects:0{width}d}']
+    excluded = [f'sub-{2:0{width}d}:{params.subjects:0{width}d}:2']
+    results['parse_selection'] = timeit(lambda: list(parse_selection(included, excluded)), repeat=params.repeat)
+
+    scripts = BashSequenceGenerator(gen_args).generate()
+    dir_scripts = os.path.join(project_dir, 'scripts')
+
+    def write():
+        for subject, script in zip(subjects, scripts):
+            save_script(os.path.join(dir_scripts, f'run_fmriprep_{subject}.sh'), script)
+
+    results['write_scripts'] = timeit(write, lambda: os.makedirs(dir_scripts, exist_ok=True), params.repeat)
+    return results
+
+
+if __name__ == '__main__':
+    parser = BaseArgParser('Times the script generation on a synthetic BIDS cohort and prints the results as JSON.')
+    parser.add_argument('--subjects', type=int, default=100, help='number of subjects (default 100)')
+    parser.add_argument('--sessions', type=int, default=2, help='sessions per subject (default 2)')
+    parser.add_argument('--runs', type=int, default=10, help='BOLD runs per session (default 10)')
+    parser.add_argument('--fmaps', type=int, default=3, help='field map pairs per session (default 3)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='workers used to patch the sidecars (default 1)')
+    parser.add_argument('-gs', '--groupsize', dest='group_size', type=int, default=3, help='participants per group script (default 3)')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions of every measurement (default 3)')
+    parser.add_argument('--tmpdir', type=str, default=None, help='where to build the synthetic project (default: system temp dir)')
+    parser.add_argument('--output', type=str, default=None, help='file to write the JSON results to (default: stdout)')
+    args = parser.parse_args()
+
+    # the generators log every subject, which would weigh on the timings
+    if args.loglevel == 'info':
+        logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(dir=args.tmpdir) as tmp:
+        results = run_benchmarks(os.path.join(tmp, 'project'), args)
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'params': {key: getattr(args, key) for key in ('subjects', 'sessions', 'runs', 'fmaps', 'jobs', 'group_size', 'repeat')},
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
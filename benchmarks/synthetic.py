@@ -0,0 +1,133 @@
+import gzip
+import json
+import os
+import struct
+
+
+def nifti1_header(shape: tuple, datatype: int = 4, bitpix: int = 16, pixdim: tuple = (2.0, 2.0, 2.0, 2.0)) -> bytes:
+    """
+    Build a NIfTI-1 header (plus the 4 empty extension bytes) for an image without data.
+
+    Args:
+        shape (tuple): The image dimensions (x, y, z[, t]).
+        datatype (int, optional): The NIfTI datatype code. Defaults to 4 (int16).
+        bitpix (int, optional): Bits per voxel. Defaults to 16.
+        pixdim (tuple, optional): The voxel sizes (and TR). Defaults to 2 mm and 2 s.
+
+    Returns:
+        bytes: The 352 header bytes.
+
+    """
+    header = bytearray(352)
+    dims = (len(shape), *shape) + (1,) * (7 - len(shape))
+    struct.pack_into('<i', header, 0, 348)
+    struct.pack_into('<8h', header, 40, *dims)
+    struct.pack_into('<hh', header, 70, datatype, bitpix)
+    struct.pack_into('<8f', header, 76, 1.0, *pixdim, *(1.0,) * (7 - len(pixdim)))
+    struct.pack_into('<f', header, 108, 352.0)
+    header[344:348] = b'n+1\0'
+    return bytes(header)
+
+
+def write_json(path: str, data: dict):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=4)
+
+
+def write_nifti(path: str, shape: tuple):
+    with gzip.open(path, 'wb') as f:
+        f.write(nifti1_header(shape))
+
+
+def fmap_dict(n_runs: int, n_fmaps: int) -> dict:
+    """
+    Map the runs evenly onto the field maps, in the format of the generators' `fmap_dict`.
+
+    Args:
+        n_runs (int): The number of BOLD runs per session.
+        n_fmaps (int): The number of field maps per session.
+
+    Returns:
+        dict: The field map number for a list of run numbers.
+
+    """
+    out = {}
+
+    for run in range(1, n_runs + 1):
+        fmap = (run - 1) * n_fmaps // n_runs + 1
+        out.setdefault(f'{fmap:02d}', []).append(f'{run:02d}')
+
+    return out
+
+
+def make_synthetic_bids(
+    root: str,
+    n_subjects: int,
+    n_sessions: int = 2,
+    n_runs: int = 10,
+    n_fmaps: int = 3,
+    n_volumes: int = 200
+) -> list[str]:
+    """
+    Build a synthetic BIDS dataset with realistic sidecars and header-only NIfTI files.
+
+    Every session gets `n_runs` BOLD runs, `n_fmaps` pairs of AP/PA field maps acquired before the runs they cover, and a T1w image.
+    Subject labels are zero-padded to at least two digits.
+
+    Args:
+        root (str): The directory to create the dataset in (the `data` directory of a project).
+        n_subjects (int): The number of subjects.
+        n_sessions (int, optional): The number of sessions per subject. Defaults to 2.
+        n_runs (int, optional): The number of BOLD runs per session. Defaults to 10.
+        n_fmaps (int, optional): The number of field map pairs per session. Defaults to 3.
+        n_volumes (int, optional): The number of volumes of every BOLD run. Defaults to 200.
+
+    Returns:
+        list[str]: The subjects of the dataset.
+
+    """
+    width = max(2, len(str(n_subjects)))
+    subjects = [f'sub-{i:0{width}d}' for i in range(1, n_subjects + 1)]
+    os.makedirs(root, exist_ok=True)
+    write_json(os.path.join(root, 'dataset_description.json'), {'Name': 'synthetic', 'BIDSVersion': '1.8.0'})
+    mapping = {run: fmap for fmap, runs in fmap_dict(n_runs, n_fmaps).items() for run in runs}
+
+    for subject in subjects:
+        for s in range(1, n_sessions + 1):
+            session = f'ses-{s:02d}'
+            prefix = f'{subject}_{session}'
+            base = os.path.join(root, subject, session)
+
+            for datatype in ('anat', 'func', 'fmap'):
+                os.makedirs(os.path.join(base, datatype), exist_ok=True)
+
+            write_nifti(os.path.join(base, 'anat', f'{prefix}_T1w.nii.gz'), (176, 256, 256))
+            write_json(os.path.join(base, 'anat', f'{prefix}_T1w.json'), {'RepetitionTime': 2.3})
+
+            for f in range(1, n_fmaps + 1):
+                minute = 60 * (f - 1) // n_fmaps
+
+                for direction, pe in (('AP', 'j-'), ('PA', 'j')):
+                    name = f'{prefix}_dir-{direction}_run-{f:02d}_epi'
+                    write_nifti(os.path.join(base, 'fmap', f'{name}.nii.gz'), (104, 104, 72, 1))
+                    write_json(os.path.join(base, 'fmap', f'{name}.json'), {
+                        'PhaseEncodingDirection': pe,
+                        'TotalReadoutTime': 0.05,
+                        'AcquisitionTime': f'10:{minute:02d}:00.000000'
+                    })
+
+            for r in range(1, n_runs + 1):
+                run = f'{r:02d}'
+                fmap = int(mapping[run])
+                minute = 60 * (fmap - 1) // n_fmaps + 1 + r % 5
+                name = f'{prefix}_task-rest_run-{run}_bold'
+                write_nifti(os.path.join(base, 'func', f'{name}.nii.gz'), (104, 104, 72, n_volumes))
+                write_json(os.path.join(base, 'func', f'{name}.json'), {
+                    'RepetitionTime': 2.0,
+                    'TaskName': 'rest',
+                    'PhaseEncodingDirection': 'j-',
+                    'TotalReadoutTime': 0.05,
+                    'AcquisitionTime': f'10:{minute:02d}:{r:02d}.000000'
+                })
+
+    return subjects
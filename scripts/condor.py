@@ -0,0 +1,98 @@
+#! ./venv/bin/python
+
+import logging
+import subprocess
+import sys
+sys.path.append('./')
+
+from utils.path import ScriptWriter
+from utils.argparsers.bashgenparser import BashGenArgParser
+from utils.bash.generators import CondorGenerator
+from utils.condor import parse_dag, parse_submit
+
+
+def dry_run(submit_path: str, dag_path: str = None):
+    """
+    Expands the written submit description (and DAG) into job ads and logs them, without a Condor pool.
+
+    Args:
+        submit_path (str): The path of the submit description.
+        dag_path (str, optional): The path of the DAG. Defaults to None.
+    """
+    with open(submit_path, 'r') as f:
+        submit = f.read()
+
+    if dag_path is None:
+        ads = parse_submit(submit)
+    else:
+        with open(dag_path, 'r') as f:
+            nodes, edges = parse_dag(f.read())
+
+        ads = [ad for _, macros in nodes.values() for ad in parse_submit(submit, macros)]
+        logging.info(f'DAG: {len(nodes)} nodes, {len(edges)} edges')
+
+    for ad in ads:
+        logging.info(f'{ad["executable"]}: cpus={ad["request_cpus"]} memory={ad["request_memory"]} disk={ad["request_disk"]}')
+
+    logging.info(f'Dry run OK: {len(ads)} jobs')
+
+
+if __name__ == '__main__':
+    parser = BashGenArgParser()
+    parser.add_argument(
+        '--dag',
+        dest='dag',
+        action='store_true',
+        help='write a DAGMan file that runs the subjects of every group in sequence'
+    )
+    parser.add_argument(
+        '-gs', '--groupsize',
+        dest='group_size',
+        type=int,
+        default=3,
+        help='how many participants per DAG chain (default 3)'
+    )
+    parser.add_argument(
+        '--balance',
+        dest='balance',
+        action='store_true',
+        help='balance the DAG chains by estimated runtime'
+    )
+    parser.add_argument(
+        '-ng', '--ngroups',
+        dest='n_groups',
+        type=int,
+        default=None,
+        help='number of balanced DAG chains (default: number of subjects / group size)'
+    )
+    parser.add_argument(
+        '--dry-run',
+        dest='dry_run',
+        action='store_true',
+        help='parse the written files and list the jobs they would queue'
+    )
+    parser.add_argument(
+        '--submit',
+        dest='submit',
+        action='store_true',
+        help='submit the jobs with condor_submit (or condor_submit_dag with --dag)'
+    )
+    args = parser.parse_args()
+    bashgen = CondorGenerator(args)
+    bashgen.validate_dirs()
+    scripts = {}
+
+    with ScriptWriter(bashgen.dir_code, f'{bashgen.stage_name}_condor_manifest.json') as writer:
+        for subject, script in bashgen.stream():
+            scripts[subject] = writer.write(f'run_{bashgen.stage_name}_{subject}.sh', script, subjects=[subject])
+
+        submit_path = writer.write(f'{bashgen.stage_name}.sub', bashgen.submit_description(scripts, queue=not args.dag))
+        dag_path = writer.write(f'{bashgen.stage_name}.dag', bashgen.dag_description(scripts, submit_path)) if args.dag else None
+
+    if args.dry_run:
+        dry_run(submit_path, dag_path)
+
+    if args.submit:
+        command = ['condor_submit_dag', dag_path] if args.dag else ['condor_submit', submit_path]
+        logging.info(f'Running {" ".join(command)}')
+        sys.exit(subprocess.call(command))
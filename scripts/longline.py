@@ -16,6 +16,6 @@ if __name__ == '__main__':
     bash_script = bashgen.generate()
 
     save_script(
-        os.path.join(bashgen.dir_code, 'run_fmriprep.sh'),
+        os.path.join(bashgen.dir_code, f'run_{bashgen.stage_name}.sh'),
         bash_script
     )
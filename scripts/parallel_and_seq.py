@@ -1,37 +1,11 @@
 #! ./venv/bin/python
 
-import os
 import sys
 sys.path.append('./')
 
-from utils.path import save_script
+from utils.path import ScriptWriter
 from utils.argparsers.bashgenparser import BashGenArgParser
-from utils.bash.generators import BashScriptGenerator
-from utils.parse import find_in_string
-import argparse
-
-
-class BashGroupsGenerator(BashScriptGenerator):
-    def __init__(self, args: argparse.Namespace):
-        super().__init__(args)
-        self.group_size = args.group_size
-
-    def generate(self) -> list[str]:
-        '''
-        Generates bash script for every group of participants based on group size input
-
-        Returns:
-            list[str]: A list of bash script for every group of participants
-        '''
-        all_scripts = [bash_str for bash_str in self]
-        group_scripts = self.split_list(all_scripts)
-        group_scripts = [''.join(group_script) for group_script in group_scripts]
-        group_scripts = [self.kernel + group_script for group_script in group_scripts]
-
-        return group_scripts
-
-    def split_list(self, lst: list[str]) -> list[list[str]]:
-        return [lst[i:i+self.group_size] for i in range(0, len(lst), self.group_size)]
+from utils.bash.generators import BashGroupsGenerator
 
 
 if __name__ == '__main__':
@@ -43,19 +17,39 @@ if __name__ == '__main__':
         default=3,
         help='how many participants per bash script (default 3)'
     )
+    parser.add_argument(
+        '--balance',
+        dest='balance',
+        action='store_true',
+        help='balance the groups by estimated runtime (run count, BOLD file sizes) instead of slicing the sorted subjects'
+    )
+    parser.add_argument(
+        '-ng', '--ngroups',
+        dest='n_groups',
+        type=int,
+        default=None,
+        help='number of balanced groups (default: number of subjects / group size)'
+    )
+    parser.add_argument(
+        '-ps', '--parallel-subjects',
+        dest='parallel_subjects',
+        type=int,
+        default=1,
+        help='how many subjects of a group run concurrently (default 1, one after another)'
+    )
+    parser.add_argument(
+        '--batch',
+        dest='batch',
+        action='store_true',
+        help='run every group as a single fMRIPrep invocation with a shared working directory, so fMRIPrep interleaves the subjects on the cores; '
+             'with --instrument, the invocations are recorded per group in fmriprep_work/metrics/fmriprep_batches.jsonl '
+             '(scripts/report.py --metrics <file> summarises them) instead of per subject in fmriprep_runs.jsonl'
+    )
     args = parser.parse_args()
-    args.subjects = sorted(args.subjects)
     bashgen = BashGroupsGenerator(args)
-    bash_script = bashgen.generate()
-    subject_groups = bashgen.split_list(args.subjects)
-    pattern = r'-?(\d+)'
-    subject_groups = [f'{group[0]}:{find_in_string(group[-1], pattern)}' if len(group) > 1 else group[0] for group in subject_groups]
+    bashgen.validate_dirs()
+    groups = dict(zip(bashgen.group_names, bashgen.groups))
 
-    for grup, script in zip(subject_groups, bash_script):
-        save_script(
-            os.path.join(
-                bashgen.dir_code,
-                f'run_fmriprep_group_{grup}.sh'
-            ),
-            script
-        )
+    with ScriptWriter(bashgen.dir_code, f'{bashgen.stage_name}_groups_manifest.json') as writer:
+        for grup, script in bashgen.stream():
+            writer.write(f'run_{bashgen.stage_name}_group_{grup}.sh', script, subjects=groups[grup])
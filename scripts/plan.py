@@ -0,0 +1,74 @@
+#! ./venv/bin/python
+
+import json
+import logging
+import os
+import sys
+sys.path.append('./')
+
+from utils.argparsers.bashgenparser import BashGenArgParser
+from utils.bash.generators import BashGroupsGenerator
+from utils.path import write_atomic
+
+
+if __name__ == '__main__':
+    parser = BashGenArgParser('Estimates the CPU-hours and disk footprint of the cohort from the NIfTI headers, per subject, per group and in total.')
+    parser.add_argument(
+        '-gs', '--groupsize',
+        dest='group_size',
+        type=int,
+        default=3,
+        help='how many participants per group (default 3)'
+    )
+    parser.add_argument(
+        '--balance',
+        dest='balance',
+        action='store_true',
+        help='balance the groups by estimated CPU-hours instead of slicing the sorted subjects'
+    )
+    parser.add_argument(
+        '-ng', '--ngroups',
+        dest='n_groups',
+        type=int,
+        default=None,
+        help='number of balanced groups (default: number of subjects / group size)'
+    )
+    parser.add_argument(
+        '-ps', '--parallel-subjects',
+        dest='parallel_subjects',
+        type=int,
+        default=1,
+        help='how many subjects of a group run concurrently (default 1, one after another)'
+    )
+    parser.add_argument('--json', dest='json', action='store_true', help='print the plan as JSON')
+    args = parser.parse_args()
+    bashgen = BashGroupsGenerator(args)
+    plan = bashgen.plan()
+    plan_path = os.path.join(bashgen.dir_work, 'plan.json')
+    write_atomic(plan_path, json.dumps(plan, indent=4))
+    logging.info(f'Plan written to {plan_path}')
+
+    if args.json:
+        print(json.dumps(plan, indent=4))
+        sys.exit(0)
+
+    print(f'{"Subject":<20} {"Runs":>5} {"Volumes":>8} {"Input GB":>9} {"CPU-h":>7} {"Work GB":>8} {"Output GB":>10}')
+
+    for p in plan['subjects']:
+        print(f'{p["subject"]:<20} {p["runs"]:>5} {p["volumes"]:>8} {p["input_gb"]:>9.2f} {p["cpu_hours"]:>7.1f} {p["work_gb"]:>8.1f} {p["output_gb"]:>10.1f}')
+
+    print(f'\n{"Group":<30} {"Subjects":>8} {"CPU-h":>7} {"Work GB":>8} {"Output GB":>10}')
+
+    for g in plan['groups']:
+        print(f'{g["group"]:<30} {len(g["subjects"]):>8} {g["cpu_hours"]:>7.1f} {g["work_gb"]:>8.1f} {g["output_gb"]:>10.1f}')
+
+    total = plan['total']
+    print(
+        f'\nCohort:           {total["subjects"]} subjects, {total["runs"]} runs, {total["input_gb"]:.1f} GB of input\n'
+        f'CPU time:         {total["cpu_hours"]:.1f} h\n'
+        f'Peak work disk:   {total["work_gb"]:.1f} GB (all groups at once)\n'
+        f'Derivatives:      {total["output_gb"]:.1f} GB'
+    )
+
+    if total['unreadable']:
+        logging.warning(f'{total["unreadable"]} NIfTI headers could not be read, their runs only count with the base estimates')
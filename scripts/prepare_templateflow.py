@@ -0,0 +1,33 @@
+#! ./venv/bin/python
+
+import logging
+import os
+import subprocess
+import sys
+sys.path.append('./')
+
+from utils.argparsers.prepareparser import PrepareArgParser
+from utils.bash import FMRIPREP_OPTIONS, prefetch_templateflow
+from utils.path import join_or_make, save_script
+from utils.templateflow import missing_templates, required_templates
+
+
+if __name__ == '__main__':
+    parser = PrepareArgParser()
+    args = parser.parse_args()
+    cache = os.path.join(args.project_dir, 'templateflow')
+    templates = required_templates(FMRIPREP_OPTIONS)
+    missing = missing_templates(cache, templates)
+
+    if not missing:
+        logging.info(f'TemplateFlow cache {cache} already holds {templates}')
+        sys.exit(0)
+
+    script_path = os.path.join(join_or_make(args.project_dir, 'code', 'preprocessing', 'fmriprep'), 'prepare_templateflow.sh')
+    save_script(script_path, '#! /bin/bash\n\nset -e\n' + prefetch_templateflow(cache, templates))
+    logging.info(f'Templates to fetch: {missing}')
+
+    if args.run:
+        sys.exit(subprocess.call(['bash', script_path]))
+
+    logging.info(f'Run {script_path} once on a node with network access, then generate the scripts with --templateflow')
@@ -0,0 +1,51 @@
+#! ./venv/bin/python
+
+import json
+import logging
+import os
+import sys
+sys.path.append('./')
+
+from utils.argparsers.reportparser import ReportArgParser
+from utils.metrics import load_records, summarise, summarise_attempts
+
+
+if __name__ == '__main__':
+    parser = ReportArgParser()
+    args = parser.parse_args()
+    dir_metrics = os.path.join(args.project_dir, 'fmriprep_work', 'metrics')
+    metrics = args.metrics or os.path.join(dir_metrics, 'fmriprep_runs.jsonl')
+    attempts = args.attempts or os.path.join(dir_metrics, 'attempts.jsonl')
+
+    if not os.path.exists(metrics) and not os.path.exists(attempts):
+        logging.error(f'Neither {metrics} nor {attempts} exists, generate the scripts with --instrument or --resume')
+        sys.exit(1)
+
+    summary = summarise(load_records(metrics)) if os.path.exists(metrics) else {}
+    retried = {}
+
+    if os.path.exists(attempts):
+        jobs = summarise_attempts(load_records(attempts))
+        retried = {label: job for label, job in jobs.items() if job['failures']}
+        summary['attempts'] = jobs
+
+    if args.json:
+        print(json.dumps(summary, indent=4))
+        sys.exit(0)
+
+    if 'runs' in summary:
+        print(
+            f'Runs:             {summary["runs"]} ({summary["succeeded"]} succeeded, {summary["failed"]} failed)\n'
+            f'Subjects:         {summary["subjects"]}\n'
+            f'Throughput:       {summary["subjects_per_hour"]:.2f} subjects/hour over {summary["span_h"]:.1f} h\n'
+            f'Runtime p50/p95:  {summary["runtime_p50_h"]:.2f} h / {summary["runtime_p95_h"]:.2f} h\n'
+            f'CPU time:         {summary["cpu_h"]:.1f} h\n'
+            f'Peak memory:      {summary["peak_memory_mb"]:.0f} MB'
+        )
+
+    if 'attempts' in summary:
+        print(f'Retried jobs:     {len(retried)} of {len(summary["attempts"])}')
+
+        for label, job in retried.items():
+            status = 'succeeded' if job['succeeded'] else 'failing'
+            print(f'  {label:<24} {job["failures"]}/{job["attempts"]} attempts failed, {status} (hosts: {", ".join(job["hosts"])})')
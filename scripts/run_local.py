@@ -0,0 +1,69 @@
+#! ./venv/bin/python
+
+import os
+import re
+import shlex
+import sys
+sys.path.append('./')
+
+from utils.argparsers.runnerparser import RunnerArgParser
+from utils.bids import BidsIndex
+from utils.cost import estimate_subject_resources
+from utils.runner import Job, LocalRunner
+
+
+def script_subjects(script: str) -> list[tuple[str, list[str]]]:
+    """
+    Get the subjects a generated script processes, from its `echo "Subject: ..."` lines.
+
+    Args:
+        script (str): The path of the script.
+
+    Returns:
+        list[tuple[str, list[str]]]: The subjects of the script, each with the sessions it is restricted to (empty for all sessions).
+    """
+    with open(script, 'r') as f:
+        return [
+            (subject, sessions.split())
+            for subject, sessions in re.findall(r'echo "Subject: (sub-[^"\s]+)(?: \(([^)]*)\))?"', f.read())
+        ]
+
+
+if __name__ == '__main__':
+    parser = RunnerArgParser()
+    args = parser.parse_args()
+    index = None
+
+    if args.project_dir:
+        index = BidsIndex(
+            os.path.join(args.project_dir, 'data'),
+            os.path.join(args.project_dir, 'fmriprep_work', 'bids_index.json')
+        ).refresh()
+
+    jobs = []
+
+    for script in args.scripts:
+        subjects = [(s, sessions) for s, sessions in script_subjects(script) if index and s in index.table]
+        footprints = [estimate_subject_resources(index, subject, sessions or None) for subject, sessions in subjects]
+        jobs.append(Job(
+            os.path.splitext(os.path.basename(script))[0],
+            shlex.split(args.command.format(script=shlex.quote(os.path.abspath(script)))),
+            max((f['cpus'] for f in footprints), default=args.job_cpus),
+            max((f['memory_mb'] for f in footprints), default=args.job_memory_mb)
+        ))
+
+    if args.log_dir:
+        dir_log = args.log_dir
+    elif args.project_dir:
+        dir_log = os.path.join(args.project_dir, 'fmriprep_work', 'run_logs')
+    else:
+        dir_log = 'run_logs'
+
+    runner = LocalRunner(args.cpus, args.memory_mb, dir_log, args.poll_interval)
+
+    try:
+        exit_codes = runner.run(jobs)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+    sys.exit(int(any(code != 0 for code in exit_codes.values())))
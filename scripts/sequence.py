@@ -1,10 +1,9 @@
 #! ./venv/bin/python
 
-import os
 import sys
 sys.path.append('./')
 
-from utils.path import save_script
+from utils.path import ScriptWriter
 from utils.argparsers.bashgenparser import BashGenArgParser
 from utils.bash.generators import BashSequenceGenerator
 
@@ -13,13 +12,8 @@ if __name__ == '__main__':
     parser = BashGenArgParser()
     args = parser.parse_args()
     bashgen = BashSequenceGenerator(args)
-    bash_script = bashgen.generate()
+    bashgen.validate_dirs()
 
-    for subject, script in zip(args.subjects, bash_script):
-        save_script(
-            os.path.join(
-                bashgen.dir_code,
-                f'run_fmriprep_{subject}.sh'
-            ),
-            script
-        )
+    with ScriptWriter(bashgen.dir_code, f'{bashgen.stage_name}_sequence_manifest.json') as writer:
+        for subject, script in bashgen.stream():
+            writer.write(f'run_{bashgen.stage_name}_{subject}.sh', script, subjects=[subject])
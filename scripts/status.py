@@ -0,0 +1,47 @@
+#! ./venv/bin/python
+
+import json
+import logging
+import os
+import sys
+import time
+sys.path.append('./')
+
+from utils.argparsers.statusparser import StatusArgParser
+from utils.ledger import Ledger
+
+
+if __name__ == '__main__':
+    parser = StatusArgParser()
+    args = parser.parse_args()
+    path = args.ledger or os.path.join(args.project_dir, 'fmriprep_work', 'ledger.sqlite')
+
+    if not os.path.exists(path):
+        logging.error(f'{path} does not exist, generate the scripts with --ledger')
+        sys.exit(1)
+
+    ledger = Ledger(path)
+    status = ledger.summary(args.window_h)
+    ledger.close()
+
+    if args.json:
+        print(json.dumps(status, indent=4))
+        sys.exit(0)
+
+    counts = status['counts']
+    rate = f'{status["jobs_per_hour"]:.2f} jobs/hour' if status['jobs_per_hour'] else 'n/a'
+    eta = f'{status["eta_h"]:.1f} h' if status['eta_h'] is not None else 'n/a'
+    print(
+        f'Backlog:          {counts["queued"]} queued\n'
+        f'In flight:        {counts["running"]}\n'
+        f'Done:             {counts["done"]} ({status["done_in_window"]} in the last {status["window_h"]:g} h)\n'
+        f'Failed:           {counts["failed"]}\n'
+        f'Completion rate:  {rate}\n'
+        f'ETA:              {eta}'
+    )
+
+    for job in status['running']:
+        print(f'  running  {job["stage"]:<14} {job["label"]:<24} on {job["host"]} for {(time.time() - job["started"]) / 3600:.1f} h')
+
+    for job in status['failed']:
+        print(f'  failed   {job["stage"]:<14} {job["label"]:<24} on {job["host"]} with exit status {job["exit_status"]}')
@@ -0,0 +1,123 @@
+#! ./venv/bin/python
+
+import logging
+import os
+import signal
+import sys
+import time
+sys.path.append('./')
+
+from utils.path import ScriptWriter, join_or_make
+from utils.argparsers.bashgenparser import BashGenArgParser
+from utils.bash.generators import BashWatchGenerator
+from utils.cost import estimate_subject_resources
+from utils.resources import machine_cpus, machine_memory_mb
+from utils.runner import Job, LocalRunner
+
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+if __name__ == '__main__':
+    parser = BashGenArgParser()
+    parser.add_argument(
+        '--quiet-period',
+        dest='quiet_period',
+        type=float,
+        default=600,
+        help='seconds without writes to the func/fmap files of a subject before it is enqueued (default 600)'
+    )
+    parser.add_argument(
+        '--poll-interval',
+        dest='poll_interval',
+        type=float,
+        default=60,
+        help='seconds between scans of the BIDS tree (default 60)'
+    )
+    parser.add_argument(
+        '--queue-dir',
+        dest='queue_dir',
+        type=str,
+        default=None,
+        help='directory to write the scripts of ready subjects to (default: code/preprocessing/fmriprep/queue in the project)'
+    )
+    parser.add_argument(
+        '--run',
+        dest='run',
+        action='store_true',
+        help='also run the enqueued scripts on this machine, within --machine-cpus and --machine-memory-mb (default: the whole machine)'
+    )
+    parser.add_argument(
+        '--once',
+        dest='once',
+        action='store_true',
+        help='scan once and exit (after the started scripts finished with --run), e.g. to run from cron'
+    )
+    args = parser.parse_args()
+
+    if args.shard:
+        parser.parser.error('--shard splits the jobs known up front, give every watcher its own subjects instead')
+
+    bashgen = BashWatchGenerator(args)
+    bashgen.validate_dirs()
+    dir_queue = args.queue_dir or join_or_make(bashgen.dir_code, 'queue')
+    os.makedirs(dir_queue, exist_ok=True)
+    runner, pending = None, []
+
+    if args.run:
+        runner = LocalRunner(
+            args.machine_cpus or machine_cpus(),
+            args.machine_memory_mb or machine_memory_mb(),
+            join_or_make(bashgen.dir_work, 'run_logs')
+        )
+
+    logging.info(f'Watching {bashgen.dir_bids} for {bashgen.subject_set} every {args.poll_interval:g} s, enqueuing to {dir_queue}')
+    signal.signal(signal.SIGTERM, interrupt)
+
+    try:
+        while True:
+            rendered = []
+
+            for subject in bashgen.poll():
+                try:
+                    scripts = bashgen.enqueue(subject)
+                except (OSError, ValueError, RuntimeError) as e:
+                    logging.error(f'Could not enqueue {subject}, retrying once its files change: {e}')
+                    continue
+
+                logging.info(f'{subject}: {len(scripts)} scripts enqueued' if scripts else f'{subject}: up to date')
+                rendered.extend((unit, script, bashgen.unit_sessions[unit]) for unit, script in scripts)
+
+            if rendered:
+                with ScriptWriter(dir_queue, f'{bashgen.stage_name}_watch_{time.strftime("%Y%m%d_%H%M%S")}_manifest.json') as writer:
+                    for unit, script, (subject, sessions) in rendered:
+                        path = writer.write(f'run_{bashgen.stage_name}_{unit}.sh', script, subjects=[unit])
+
+                        if runner:
+                            name = os.path.splitext(os.path.basename(path))[0]
+
+                            # the new script supersedes one still waiting; one still running is let finish first (see LocalRunner.step)
+                            if any(job.name == name for job in pending):
+                                logging.info(f'{name}: replacing the enqueued script that has not started yet')
+                                pending = [job for job in pending if job.name != name]
+
+                            pending.append(Job(
+                                name,
+                                ['bash', path],
+                                **{k: v for k, v in estimate_subject_resources(bashgen.index, subject, sessions).items() if k != 'disk_mb'}
+                            ))
+
+            if runner:
+                pending = runner.step(pending)
+
+            if args.once and not (pending or (runner and runner.running)):
+                break
+
+            time.sleep(args.poll_interval)
+    except KeyboardInterrupt:
+        if runner:
+            logging.warning(f'Interrupted, terminating {runner.running} running scripts; {len(pending)} enqueued scripts were not started')
+            runner.terminate()
+
+        sys.exit(130)
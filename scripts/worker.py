@@ -0,0 +1,27 @@
+#! ./venv/bin/python
+
+import sys
+sys.path.append('./')
+
+from utils.path import ScriptWriter
+from utils.argparsers.bashgenparser import BashGenArgParser
+from utils.bash.generators import BashWorkerGenerator
+
+
+if __name__ == '__main__':
+    parser = BashGenArgParser()
+    parser.add_argument(
+        '--claim-ttl',
+        dest='claim_ttl',
+        type=int,
+        default=900,
+        help='seconds without a heartbeat after which the claim of a job is taken over by another worker; '
+             'must exceed the clock skew between the nodes (default 900)'
+    )
+    args = parser.parse_args()
+    bashgen = BashWorkerGenerator(args)
+    bashgen.validate_dirs()
+
+    with ScriptWriter(bashgen.dir_code, f'{bashgen.stage_name}_worker_manifest.json') as writer:
+        for name, script in bashgen.stream():
+            writer.write(f'run_{bashgen.stage_name}_{name}.sh', script, subjects=bashgen.units)
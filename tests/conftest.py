@@ -0,0 +1,48 @@
+import argparse
+import os
+import sys
+from typing import Union
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import make_synthetic_bids
+
+
+@pytest.fixture
+def project(tmp_path) -> argparse.Namespace:
+    """
+    A synthetic project of two subjects with one short session each, as the command line arguments of the generators.
+    """
+    subjects = make_synthetic_bids(str(tmp_path / 'project' / 'data'), 2, n_sessions=1, n_runs=2, n_fmaps=1)
+    return argparse.Namespace(subjects=subjects, sessions=['ses-01'], project_dir=str(tmp_path / 'project'))
+
+
+@pytest.fixture
+def singularity(tmp_path, monkeypatch):
+    """
+    Puts a stub `singularity` first on the PATH that appends its pid to `<tmp_path>/singularity_pids` and exits with the status written to `<tmp_path>/singularity_status`, or sleeps for a minute if the status is 'sleep'.
+
+    Returns:
+        Callable[[Union[int, str]], None]: Sets the exit status of the stub.
+    """
+    dir_bin = tmp_path / 'bin'
+    dir_bin.mkdir()
+    status = tmp_path / 'singularity_status'
+    stub = dir_bin / 'singularity'
+    stub.write_text(
+        '#! /bin/bash\n' +
+        f'echo $$ >> {tmp_path}/singularity_pids\n' +
+        f'status=$(cat {status})\n' +
+        '[ "$status" = sleep ] && exec sleep 60\n' +
+        'exit $status\n'
+    )
+    stub.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{dir_bin}{os.pathsep}{os.environ["PATH"]}')
+
+    def set_status(code: Union[int, str]):
+        status.write_text(str(code))
+
+    set_status(0)
+    return set_status
@@ -0,0 +1,81 @@
+import os
+import signal
+import subprocess
+import time
+
+from utils.bash import claim_worker
+
+# claim TTL of the workers, in seconds; the heartbeat runs every ttl / 4 s
+TTL = 4
+
+
+def toy_blocks(dir_claims: str, n_jobs: int, seconds: int, fail: str = None) -> dict:
+    """
+    Build job blocks that record which worker ran them in `<dir_claims>/runs.log`, sleep and succeed (or fail with 3).
+    """
+    return {
+        f'job{k}': f'    echo "job{k} $$" >> {dir_claims}/runs.log\n' +
+                   f'    sleep {seconds}\n' +
+                   f'    fmriprep_status={3 if f"job{k}" == fail else 0}\n'
+        for k in range(n_jobs)
+    }
+
+
+def write_worker(tmp_path, name: str, blocks: dict, dir_claims: str) -> str:
+    path = tmp_path / f'{name}.sh'
+    path.write_text(claim_worker(blocks, dir_claims, TTL))
+    return str(path)
+
+
+def start_worker(script: str, log: str) -> subprocess.Popen:
+    with open(log, 'a') as f:
+        return subprocess.Popen(['bash', script], stdout=f, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def runs(dir_claims: str) -> list:
+    path = os.path.join(dir_claims, 'runs.log')
+
+    if not os.path.exists(path):
+        return []
+
+    with open(path, 'r') as f:
+        return [line.split() for line in f]
+
+
+def test_every_job_runs_exactly_once(tmp_path):
+    dir_claims = str(tmp_path / 'claims')
+    blocks = toy_blocks(dir_claims, 8, 1, fail='job1')
+    script = write_worker(tmp_path, 'worker', blocks, dir_claims)
+    workers = [start_worker(script, str(tmp_path / f'worker_{i}.log')) for i in range(3)]
+    codes = [worker.wait(timeout=60) for worker in workers]
+
+    assert sorted(run[0] for run in runs(dir_claims)) == sorted(blocks)
+
+    for job in blocks:
+        assert os.path.exists(os.path.join(dir_claims, f'{job}.failed' if job == 'job1' else f'{job}.done'))
+
+    with open(os.path.join(dir_claims, 'job1.failed'), 'r') as f:
+        assert f.read().strip() == '3'
+
+    # only the worker that ran job1 fails
+    assert sorted(codes) == [0, 0, 1]
+
+
+def test_expired_claim_is_taken_over(tmp_path):
+    dir_claims = str(tmp_path / 'claims')
+    script = write_worker(tmp_path, 'worker', toy_blocks(dir_claims, 1, 3 * TTL), dir_claims)
+    first = start_worker(script, str(tmp_path / 'first.log'))
+    deadline = time.monotonic() + 10
+
+    while not runs(dir_claims) and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    # a dead node: neither the job nor the heartbeat get to clean up
+    os.killpg(first.pid, signal.SIGKILL)
+    first.wait()
+    second = start_worker(script, str(tmp_path / 'second.log'))
+
+    assert second.wait(timeout=10 * TTL) == 0
+    assert 'Taking over the expired claim of job0' in (tmp_path / 'second.log').read_text()
+    assert [run[0] for run in runs(dir_claims)] == ['job0', 'job0']
+    assert os.path.exists(os.path.join(dir_claims, 'job0.done'))
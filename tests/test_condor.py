@@ -0,0 +1,20 @@
+from utils.bash.generators import CondorGenerator
+from utils.condor import parse_submit
+from utils.resources import MEMORY_HEADROOM
+
+
+def test_fmriprep_gets_the_resources_of_its_slot(project, tmp_path):
+    project.force = True
+    project.group_size = 1
+    bashgen = CondorGenerator(project)
+    scripts = dict(bashgen.stream())
+    ads = parse_submit(bashgen.submit_description({unit: f'run_{unit}.sh' for unit in scripts}))
+
+    assert len(ads) == len(scripts) == 2
+
+    for ad in ads:
+        script = scripts[ad['executable'][len('run_'):-len('.sh')]]
+        memory_mb = int(ad['request_memory'].rstrip('M'))
+
+        assert f'--nthreads {ad["request_cpus"]} ' in script
+        assert f'--mem-mb {int(memory_mb * MEMORY_HEADROOM)} ' in script
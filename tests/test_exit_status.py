@@ -0,0 +1,47 @@
+import subprocess
+
+import pytest
+
+from utils.bash.generators import BashGroupsGenerator, BashScriptGenerator, BashSequenceGenerator
+
+
+def run(script: str, tmp_path) -> int:
+    path = tmp_path / 'script.sh'
+    path.write_text(script)
+    return subprocess.run(['bash', str(path)], capture_output=True).returncode
+
+
+@pytest.mark.parametrize('code', [0, 1])
+def test_sequence_script_exits_with_fmriprep_status(project, singularity, tmp_path, code):
+    singularity(code)
+    project.force = True
+    scripts = BashSequenceGenerator(project).generate()
+
+    assert [run(script, tmp_path) for script in scripts] == [code, code]
+
+
+@pytest.mark.parametrize('code, expected', [(0, 0), (2, 1)])
+def test_longline_script_exits_with_failed(project, singularity, tmp_path, code, expected):
+    singularity(code)
+    project.force = True
+
+    assert run(BashScriptGenerator(project).generate(), tmp_path) == expected
+
+
+@pytest.mark.parametrize('parallel_subjects', [1, 2])
+def test_group_script_fails_when_a_subject_fails(project, singularity, tmp_path, parallel_subjects):
+    singularity(1)
+    project.force = True
+    project.group_size = 2
+    project.parallel_subjects = parallel_subjects
+
+    assert [run(script, tmp_path) for script in BashGroupsGenerator(project).generate()] == [1]
+
+
+def test_batch_script_fails_when_a_subject_fails(project, singularity, tmp_path):
+    singularity(1)
+    project.force = True
+    project.group_size = 2
+    project.batch = True
+
+    assert [run(script, tmp_path) for script in BashGroupsGenerator(project).generate()] == [1]
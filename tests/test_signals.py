@@ -0,0 +1,70 @@
+import os
+import signal
+import subprocess
+import time
+
+import pytest
+
+from utils.bash.generators import BashGroupsGenerator, BashSequenceGenerator
+
+
+def alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+
+    # a zombie has exited, only its parent did not reap it yet
+    with open(f'/proc/{pid}/stat', 'r') as f:
+        return f.read().split(') ', 1)[1][0] != 'Z'
+
+
+def terminate_while_running(script: str, tmp_path, n_running: int) -> list[int]:
+    """
+    Start a script, send SIGTERM to its shell once `n_running` fMRIPrep calls are running, and return their pids.
+    """
+    path = tmp_path / 'script.sh'
+    path.write_text(script)
+    pids = tmp_path / 'singularity_pids'
+    proc = subprocess.Popen(['bash', str(path)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + 20
+
+    while not (pids.exists() and len(pids.read_text().split()) == n_running) and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    running = [int(pid) for pid in pids.read_text().split()]
+    proc.send_signal(signal.SIGTERM)
+
+    try:
+        assert proc.wait(timeout=20) == 143
+    finally:
+        if proc.poll() is None:
+            os.killpg(proc.pid, signal.SIGKILL)
+
+    return running
+
+
+@pytest.mark.parametrize('resume', [False, True])
+def test_sequence_script_stops_fmriprep(project, singularity, tmp_path, resume):
+    singularity('sleep')
+    project.force = True
+    project.resume = resume
+    script = BashSequenceGenerator(project).generate()[0]
+
+    assert not any(alive(pid) for pid in terminate_while_running(script, tmp_path, 1))
+
+
+@pytest.mark.parametrize('scratch', [None, 'scratch'])
+def test_concurrent_group_script_stops_fmriprep(project, singularity, tmp_path, scratch):
+    singularity('sleep')
+    project.force = True
+    project.group_size = 2
+    project.parallel_subjects = 2
+    project.scratch = str(tmp_path / scratch) if scratch else None
+
+    if scratch:
+        os.makedirs(project.scratch)
+
+    script = BashGroupsGenerator(project).generate()[0]
+
+    assert not any(alive(pid) for pid in terminate_while_running(script, tmp_path, 2))
@@ -0,0 +1,15 @@
+from utils.shard import assign_shards
+from utils.subjects import SubjectSet
+
+
+def test_resolve_orders_unpadded_subjects_by_number():
+    found, missing = SubjectSet.parse(['sub-1:12', 'sub-pilot']).resolve(['sub-10', 'sub-2', 'sub-pilot', 'sub-1', 'sub-11'])
+
+    assert found == ['sub-1', 'sub-2', 'sub-10', 'sub-11', 'sub-pilot']
+    assert str(missing) == 'sub-3:9 sub-12'
+
+
+def test_shards_are_dealt_by_subject_number():
+    shards = assign_shards(['sub-10_ses-01', 'sub-2_ses-02', 'sub-2_ses-01', 'sub-1_ses-01'], 2)
+
+    assert shards == {'sub-1_ses-01': 1, 'sub-2_ses-01': 2, 'sub-2_ses-02': 1, 'sub-10_ses-01': 2}
@@ -0,0 +1,91 @@
+import os
+from typing import Iterable, List, Optional
+
+
+# the anatomical outputs fMRIPrep needs to skip its anatomical workflow (see --anat-derivatives)
+ANAT_OUTPUTS = [
+    'desc-preproc_T1w.nii.gz',
+    'desc-brain_mask.nii.gz',
+    'dseg.nii.gz',
+    'label-CSF_probseg.nii.gz',
+    'label-GM_probseg.nii.gz',
+    'label-WM_probseg.nii.gz'
+]
+# output spaces that are not standard templates and need no transforms
+NONSTANDARD_SPACES = {'T1w', 'anat', 'func', 'run', 'fsnative', 'fsaverage', 'fsaverage5', 'fsaverage6'}
+
+
+def standard_spaces(options: str) -> List[str]:
+    """
+    Get the standard template spaces requested with `--output-spaces` in fMRIPrep options.
+
+    Args:
+        options (str): The fMRIPrep options (e.g. '--output-spaces T1w MNI152NLin6Asym:res-2').
+
+    Returns:
+        List[str]: The template names (e.g. ['MNI152NLin6Asym']).
+
+    """
+    tokens = options.split()
+
+    if '--output-spaces' not in tokens:
+        return []
+
+    spaces = []
+
+    for token in tokens[tokens.index('--output-spaces') + 1:]:
+        if token.startswith('--'):
+            break
+
+        template = token.split(':')[0]
+
+        if template not in NONSTANDARD_SPACES and template not in spaces:
+            spaces.append(template)
+
+    return spaces
+
+
+def missing_anat_outputs(dir_out: str, subject: str, spaces: List[str]) -> List[str]:
+    """
+    List the anatomical outputs of a subject that are missing from an fMRIPrep output directory.
+
+    Besides the preprocessed T1w, brain mask and tissue segmentations, the transforms from and to every standard space are required.
+
+    Args:
+        dir_out (str): The fMRIPrep output directory.
+        subject (str): The subject.
+        spaces (List[str]): The standard spaces the transforms are needed for.
+
+    Returns:
+        List[str]: The missing file names, empty if the anatomical outputs are complete.
+
+    """
+    dir_anat = os.path.join(dir_out, subject, 'anat')
+    names = set(os.listdir(dir_anat)) if os.path.isdir(dir_anat) else set()
+    required = [f'{subject}_{output}' for output in ANAT_OUTPUTS]
+
+    for space in spaces:
+        required.append(f'{subject}_from-T1w_to-{space}_mode-image_xfm.h5')
+        required.append(f'{subject}_from-{space}_to-T1w_mode-image_xfm.h5')
+
+    return [name for name in required if name not in names]
+
+
+def find_anat_derivatives(candidates: Iterable[str], subject: str, spaces: List[str]) -> Optional[str]:
+    """
+    Find the first output directory holding complete anatomical derivatives of a subject.
+
+    Args:
+        candidates (Iterable[str]): The fMRIPrep output directories to search, in order of preference.
+        subject (str): The subject.
+        spaces (List[str]): The standard spaces the transforms are needed for.
+
+    Returns:
+        Optional[str]: The output directory, or None if no candidate is complete.
+
+    """
+    for candidate in candidates:
+        if not missing_anat_outputs(candidate, subject, spaces):
+            return candidate
+
+    return None
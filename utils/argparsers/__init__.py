@@ -1,7 +1,19 @@
 import argparse
 import logging
 
-from utils.parse import parse_subjects_subset
+
+def setup_logging(loglevel: str):
+    """
+    Configures the root logger for the command line tools.
+
+    Args:
+        loglevel (str): The logging level, one of info, debug, error or critical.
+    """
+    logging.basicConfig(
+        level={'info': logging.INFO, 'debug': logging.DEBUG, 'error': logging.ERROR, 'critical': logging.CRITICAL}[loglevel],
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
 
 
 class BaseArgParser:
@@ -18,7 +30,7 @@ class BaseArgParser:
             Adds an argument to the parser. Accepts the same parameters as `argparse.ArgumentParser.add_argument`.
 
         parse_args():
-            Parses the command line arguments passed to the script and returns an object containing the arguments and their values.
+            Parses the command line arguments passed to the script, configures logging with `--loglevel`, and returns an object containing the arguments and their values.
 
         setup():
             A method intended to be overridden in subclasses to define specific arguments. By default, it does nothing.
@@ -32,6 +44,13 @@ class BaseArgParser:
         """
         self.parser = argparse.ArgumentParser(description=description)
         self.setup()
+        self.add_argument(
+            '--loglevel',
+            dest='loglevel',
+            type=str,
+            default='info',
+            help='Logging level to use. Can be info, debug, error or critical. Default is info.'
+        )
 
     def add_argument(self, *args, **kwargs):
         """
@@ -47,14 +66,16 @@ class BaseArgParser:
 
     def parse_args(self):
         """
-        Parses the command line arguments.
+        Parses the command line arguments and configures logging.
 
-        This method parses the arguments provided to the command line, using the configuration defined by calls to `add_argument`.
+        This method parses the arguments provided to the command line, using the configuration defined by calls to `add_argument`, and sets up logging with the `--loglevel` every parser has.
 
         Returns:
             argparse.Namespace: An object containing the parsed command line arguments. Each argument is accessible as an attribute of this object.
         """
-        return self.parser.parse_args()
+        args = self.parser.parse_args()
+        setup_logging(args.loglevel)
+        return args
 
     def setup(self):
         """
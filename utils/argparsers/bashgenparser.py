@@ -1,6 +1,6 @@
-import logging
 from utils.argparsers import BaseArgParser
-from utils.parse import parse_subjects_subset
+from utils.shard import parse_shard
+from utils.subjects import parse_selection
 
 
 class BashGenArgParser(BaseArgParser):
@@ -14,7 +14,7 @@ class BashGenArgParser(BaseArgParser):
             Defines the command-line arguments specific to the bash script generation process.
 
         parse_args():
-            Parses the command line arguments, sets up logging based on the specified log level, and processes the subject lists for inclusion and exclusion. It also hardcodes a field map dictionary for demonstration purposes.
+            Parses the command line arguments, sets up logging based on the specified log level, and processes the subject lists for inclusion and exclusion (see `utils.subjects.SubjectSet`). Field maps are matched to runs by the generator (see `--fmap-override`).
     """
     def __init__(
         self,
@@ -35,52 +35,178 @@ class BashGenArgParser(BaseArgParser):
         This method overrides the `setup` method of `BaseArgParser` to add arguments for specifying subjects, sessions to process, project directory, and logging level.
         """
         self.add_argument('subjects', metavar='SUBJECT', type=str, nargs='+',
-                          help='subjects to include in the bash script (e.g. sub-01 sub-02 sub-03 or sub-01:03)')
+                          help='subjects to include in the bash script (e.g. sub-01 sub-02 sub-03, sub-01:03, or sub-0001:1000:2 for every second); '
+                               'the zero-padding is taken from the input')
         self.add_argument(
             '--exclude',
             dest='exclude',
             type=str,
             nargs='+',
             default=list(),
-            help='list of subjects to exclude (e.g. sub-01 sub-02 sub-03 or sub-01:03)'
+            help='list of subjects or ranges to exclude (e.g. sub-01 sub-02 sub-03 or sub-01:03)'
         )
         self.add_argument('--sessions', dest='sessions', type=str, nargs='+', default=['ses-01', 'ses-02'],
                           help='list of sessions to process (default: ses-01 ses-02)')
         self.add_argument('--project-dir', dest='project_dir', type=str, default='/data/pt_02703/fMRIprep',
                           help='project directory path (default: /data/pt_02703/fMRIprep)')
         self.add_argument(
-            '--loglevel',
-            dest='loglevel',
+            '-j', '--jobs',
+            dest='jobs',
+            type=int,
+            default=1,
+            help='number of parallel workers used to patch the JSON sidecars (default 1)'
+        )
+        self.add_argument(
+            '--instrument',
+            dest='instrument',
+            action='store_true',
+            help='record wall time, CPU time, peak memory and exit status of every fMRIPrep call in fmriprep_work/metrics/fmriprep_runs.jsonl'
+        )
+        self.add_argument(
+            '--scratch',
+            dest='scratch',
             type=str,
-            default='info',
-            help='Logging level to use. Can be info, debug, error or critical. Default is info.'
+            nargs='?',
+            const='${TMPDIR:-/tmp}',
+            default=None,
+            help='run fMRIPrep in a node-local scratch directory and copy back only the derivatives '
+                 '(default when given without a path: $TMPDIR, or /tmp)'
+        )
+        self.add_argument(
+            '--machine-cpus',
+            dest='machine_cpus',
+            type=int,
+            default=None,
+            help='cores of the machine the scripts run on; with it, every fMRIPrep call gets --nthreads/--omp-nthreads for its share'
+        )
+        self.add_argument(
+            '--machine-memory-mb',
+            dest='machine_memory_mb',
+            type=int,
+            default=None,
+            help='memory in MB of the machine the scripts run on; with it, every fMRIPrep call gets --mem-mb for its share'
+        )
+        self.add_argument(
+            '--concurrent-jobs',
+            dest='concurrent_jobs',
+            type=int,
+            default=None,
+            help='how many scripts run side by side on the machine (default 1, or the number of groups for group scripts)'
+        )
+        self.add_argument(
+            '--low-mem-threshold-mb',
+            dest='low_mem_threshold_mb',
+            type=int,
+            default=None,
+            help='pass --low-mem to fMRIPrep when its memory share is below this many MB'
+        )
+        self.add_argument(
+            '--force',
+            dest='force',
+            action='store_true',
+            help='also process subjects whose derivatives are complete and were computed from their current inputs'
+        )
+        self.add_argument(
+            '--reuse-anat',
+            dest='reuse_anat',
+            action='store_true',
+            help='pass complete anatomical derivatives (from the --anat-only stage or a previous run) to fMRIPrep instead of recomputing them'
+        )
+        self.add_argument(
+            '--anat-only',
+            dest='anat_only',
+            action='store_true',
+            help='generate the anatomical-only first stage, writing to data/derivatives/fmriprep_anat'
+        )
+        self.add_argument(
+            '--templateflow',
+            dest='templateflow',
+            action='store_true',
+            help='bind the project TemplateFlow cache (<project-dir>/templateflow, see scripts/prepare_templateflow.py) read-only into every container'
+        )
+        self.add_argument(
+            '--stage-image',
+            dest='stage_image',
+            type=str,
+            nargs='?',
+            const='/tmp',
+            default=None,
+            help='copy the fMRIPrep image to node-local disk once per node and run the copy (default when given without a path: /tmp)'
+        )
+        self.add_argument(
+            '--split-sessions',
+            dest='split_sessions',
+            action='store_true',
+            help='run every session of a subject as its own fMRIPrep job with a BIDS filter file and work directory; '
+                 'the anatomical derivatives of the --anat-only stage are reused when present'
+        )
+        self.add_argument(
+            '--async-cleanup',
+            dest='async_cleanup',
+            action='store_true',
+            help='move working directories to fmriprep_work/trash and delete them with a low-priority background process '
+                 'instead of waiting for rm -rf before and after every subject'
+        )
+        self.add_argument(
+            '--resume',
+            dest='resume',
+            action='store_true',
+            help='keep the working directory of a failed fMRIPrep run and retry it, reusing the cached results; '
+                 'the working directory is only removed after a verified success (not with --scratch)'
+        )
+        self.add_argument(
+            '--retries',
+            dest='retries',
+            type=int,
+            default=2,
+            help='retries of a failed fMRIPrep run with --resume (default: 2)'
+        )
+        self.add_argument(
+            '--retry-delay',
+            dest='retry_delay',
+            type=int,
+            default=600,
+            help='seconds before the first retry with --resume, doubled for every further retry (default: 600)'
+        )
+        self.add_argument(
+            '--ledger',
+            dest='ledger',
+            action='store_true',
+            help='register the jobs in the SQLite ledger fmriprep_work/ledger.sqlite and mark them running, done or failed from the scripts '
+                 '(see scripts/status.py)'
+        )
+        self.add_argument(
+            '--shard',
+            dest='shard',
+            type=parse_shard,
+            default=None,
+            help='generate shard i of N of the jobs (e.g. 2/4), dealt round-robin from the sorted subjects so that every node '
+                 'given the same subjects gets a disjoint share; with scripts/worker.py the shard is only tried first'
+        )
+        self.add_argument(
+            '--fmap-override',
+            dest='fmap_override',
+            type=str,
+            default=None,
+            help='JSON or YAML file mapping field maps to runs, per subject_session, subject or "*" for all subjects; '
+                 'the other runs get the nearest preceding field map by AcquisitionTime'
         )
 
     def parse_args(self):
         """
         Parses the command line arguments and configures logging.
 
-        This method extends `parse_args` from `BaseArgParser` to include additional processing for the bash script generation tool. It sets up logging based on the specified log level, processes the subject lists for inclusion and exclusion, and hardcodes a field map dictionary for demonstration purposes.
+        This method extends `parse_args` from `BaseArgParser` to include additional processing for the bash script generation tool. It sets up logging based on the specified log level, and processes the subject lists for inclusion and exclusion.
+        The selection is kept as `subject_set`; the generators only expand the subjects of it that are present in the dataset.
 
         Returns:
             argparse.Namespace: An object containing the parsed command line arguments, with additional processing applied.
         """
         args = super().parse_args()
-        logging.basicConfig(
-            level={'info': logging.INFO, 'debug': logging.DEBUG, 'error': logging.ERROR, 'critical': logging.CRITICAL}[args.loglevel],
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        pattern = r'sub-\d{2}:\d{2}'
-        subjects = parse_subjects_subset(args.subjects, pattern)
-        excluded = parse_subjects_subset(args.exclude, pattern)
 
-        subjects = list(set(subjects) - set(excluded))
-        args.subjects = subjects
-        # FIXME: it is hardcode
-        args.fmap_dict = {
-            '01': ['01','02','03'],
-            '02': ['04','05','06'],
-            '03': ['07','08','09','10']
-        }
+        try:
+            args.subject_set = parse_selection(args.subjects, args.exclude)
+        except ValueError as e:
+            self.parser.error(str(e))
+
         return args
\ No newline at end of file
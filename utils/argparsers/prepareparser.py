@@ -0,0 +1,31 @@
+from utils.argparsers import BaseArgParser
+
+
+class PrepareArgParser(BaseArgParser):
+    """
+    An argument parser for preparing the shared resources of the fMRIPrep jobs of a project.
+
+    Methods:
+        setup():
+            Defines the command-line arguments of the preparation step.
+    """
+    def __init__(
+        self,
+        description='Writes the script that fills the project TemplateFlow cache for the fMRIPrep output spaces.'
+    ):
+        """
+        Initializes the PrepareArgParser with a default description.
+
+        Args:
+            description (str, optional): A brief description of the tool. Defaults to a predefined string explaining its purpose.
+        """
+        super().__init__(description)
+
+    def setup(self):
+        """
+        Sets up command line arguments for the project directory and whether to run the script right away.
+        """
+        self.add_argument('--project-dir', dest='project_dir', type=str, default='/data/pt_02703/fMRIprep',
+                          help='project directory path (default: /data/pt_02703/fMRIprep)')
+        self.add_argument('--run', dest='run', action='store_true',
+                          help='run the script right away (needs network access)')
@@ -0,0 +1,35 @@
+from utils.argparsers import BaseArgParser
+
+
+class ReportArgParser(BaseArgParser):
+    """
+    An argument parser for summarising the recorded fMRIPrep runs of a project.
+
+    Methods:
+        setup():
+            Defines the command-line arguments of the report.
+    """
+    def __init__(
+        self,
+        description='Summarises throughput, runtime and memory use of the instrumented fMRIPrep runs of a project.'
+    ):
+        """
+        Initializes the ReportArgParser with a default description.
+
+        Args:
+            description (str, optional): A brief description of the tool. Defaults to a predefined string explaining its purpose.
+        """
+        super().__init__(description)
+
+    def setup(self):
+        """
+        Sets up command line arguments for the project directory, the metrics and attempts files and the output format.
+        """
+        self.add_argument('--project-dir', dest='project_dir', type=str, default='/data/pt_02703/fMRIprep',
+                          help='project directory path (default: /data/pt_02703/fMRIprep)')
+        self.add_argument('--metrics', dest='metrics', type=str, default=None,
+                          help='metrics file (default: <project-dir>/fmriprep_work/metrics/fmriprep_runs.jsonl)')
+        self.add_argument('--attempts', dest='attempts', type=str, default=None,
+                          help='attempts file of resumable runs (default: <project-dir>/fmriprep_work/metrics/attempts.jsonl)')
+        self.add_argument('--json', dest='json', action='store_true',
+                          help='print the summary as JSON')
@@ -0,0 +1,46 @@
+from utils.argparsers import BaseArgParser
+from utils.resources import machine_cpus, machine_memory_mb
+
+
+class RunnerArgParser(BaseArgParser):
+    """
+    An argument parser for running generated bash scripts locally within a CPU-core and memory budget.
+
+    Methods:
+        setup():
+            Defines the command-line arguments of the local runner.
+    """
+    def __init__(
+        self,
+        description='Runs generated fMRIPrep bash scripts on this machine without oversubscribing its cores or memory.'
+    ):
+        """
+        Initializes the RunnerArgParser with a default description.
+
+        Args:
+            description (str, optional): A brief description of the tool. Defaults to a predefined string explaining its purpose.
+        """
+        super().__init__(description)
+
+    def setup(self):
+        """
+        Sets up command line arguments for the scripts to run, the resource budget and the per-job footprint.
+        """
+        self.add_argument('scripts', metavar='SCRIPT', type=str, nargs='+',
+                          help='bash scripts to run (e.g. run_fmriprep_sub-01.sh run_fmriprep_sub-02.sh)')
+        self.add_argument('--cpus', dest='cpus', type=int, default=machine_cpus(),
+                          help='CPU cores the jobs may use in total (default: all cores of this machine)')
+        self.add_argument('--memory-mb', dest='memory_mb', type=int, default=machine_memory_mb(),
+                          help='memory the jobs may use in total, in MB (default: all memory of this machine)')
+        self.add_argument('--project-dir', dest='project_dir', type=str, default=None,
+                          help='project directory, used to estimate the footprint of every subject from its input data')
+        self.add_argument('--job-cpus', dest='job_cpus', type=int, default=8,
+                          help='CPU cores per job when no estimate is available (default 8)')
+        self.add_argument('--job-memory-mb', dest='job_memory_mb', type=int, default=16000,
+                          help='memory per job in MB when no estimate is available (default 16000)')
+        self.add_argument('--log-dir', dest='log_dir', type=str, default=None,
+                          help='directory for the job logs and exit codes (default: <project-dir>/fmriprep_work/run_logs, or ./run_logs)')
+        self.add_argument('--command', dest='command', type=str, default='bash {script}',
+                          help='command template used to run every script, e.g. to run a stub instead (default: "bash {script}")')
+        self.add_argument('--poll-interval', dest='poll_interval', type=float, default=5.0,
+                          help='seconds between checks of the running jobs (default 5)')
@@ -0,0 +1,35 @@
+from utils.argparsers import BaseArgParser
+
+
+class StatusArgParser(BaseArgParser):
+    """
+    An argument parser for querying the job ledger of a project.
+
+    Methods:
+        setup():
+            Defines the command-line arguments of the status query.
+    """
+    def __init__(
+        self,
+        description='Reports the backlog, the jobs in flight, the completion rate and the ETA from the job ledger of a project.'
+    ):
+        """
+        Initializes the StatusArgParser with a default description.
+
+        Args:
+            description (str, optional): A brief description of the tool. Defaults to a predefined string explaining its purpose.
+        """
+        super().__init__(description)
+
+    def setup(self):
+        """
+        Sets up command line arguments for the project directory, the ledger, the rate window and the output format.
+        """
+        self.add_argument('--project-dir', dest='project_dir', type=str, default='/data/pt_02703/fMRIprep',
+                          help='project directory path (default: /data/pt_02703/fMRIprep)')
+        self.add_argument('--ledger', dest='ledger', type=str, default=None,
+                          help='ledger file (default: <project-dir>/fmriprep_work/ledger.sqlite)')
+        self.add_argument('--window-h', dest='window_h', type=float, default=24,
+                          help='hours of finished jobs the completion rate is computed over (default: 24)')
+        self.add_argument('--json', dest='json', action='store_true',
+                          help='print the status as JSON')
@@ -1,36 +1,741 @@
+import os
+import sys
+from typing import Dict, List
+
+from utils.templateflow import TEMPLATEFLOW_HOME
+
+FMRIPREP_IMAGE = '/data/p_SoftwareServiceLinux_sc/fmriprep/22.0.1/1'
+# the fMRIPrep options that determine the outputs
+FMRIPREP_OPTIONS = '--use-aroma --output-spaces T1w MNI152NLin6Asym --dummy-scans 0'
+INSTRUMENT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instrument.py')
+LEDGER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ledger.py')
+
+
+def instrument_command(command: str, subject: str, metrics: str) -> str:
+    """
+    Wrap a command with `utils/instrument.py` so its resource usage is appended to a JSON lines file.
+
+    Every record holds the subject, host, start time (epoch seconds), wall time, user and system CPU time, peak resident set size (of the largest process) and exit status.
+
+    Args:
+        command (str): The command to wrap.
+        subject (str): Subject ID.
+        metrics (str): The JSON lines file to append the record to.
+
+    Returns:
+        str: The wrapped command.
+
+    """
+    return f'{sys.executable} {INSTRUMENT} --metrics {metrics} --subject {subject} -- {command}'
+
+
+def ledger_command(ledger: str, action: str, stage: str, label: str, status: str = None) -> str:
+    """
+    Generate the command that records the start or end of a job in the project ledger with `utils/ledger.py`.
+
+    A ledger that cannot be updated does not fail the job.
+
+    Args:
+        ledger (str): The SQLite ledger file.
+        action (str): start or finish.
+        stage (str): The stage of the job (e.g. fmriprep).
+        label (str): The job label.
+        status (str, optional): The exit status of the job, for finish (e.g. "$fmriprep_status"). Defaults to None.
+
+    Returns:
+        str: The command, followed by a newline.
+
+    """
+    return f'{sys.executable} {LEDGER} --ledger {ledger} --stage {stage} {action} {label}' +\
+        (f' --status {status}' if status else '') +\
+        ' || echo "Could not update the ledger"\n'
+
+
+def budget_args(budget: dict) -> str:
+    """
+    Generate the fMRIPrep arguments for a CPU and memory budget.
+
+    Args:
+        budget (dict): The `nthreads`, `omp_nthreads`, `mem_mb` and `low_mem` of the invocation (see `utils.resources.compute_budget`).
+
+    Returns:
+        str: The arguments, each followed by a space.
+
+    """
+    out = ''
+
+    if budget.get('nthreads'):
+        out += f'--nthreads {budget["nthreads"]} --omp-nthreads {budget["omp_nthreads"]} '
+
+    if budget.get('mem_mb'):
+        out += f'--mem-mb {budget["mem_mb"]} '
+
+    if budget.get('low_mem'):
+        out += '--low-mem '
+
+    return out
+
+
+def stage_image_block(stage_dir: str) -> str:
+    """
+    Generate bash that copies the fMRIPrep image to node-local disk once per node and sets `fmriprep_image` to the copy.
+
+    Concurrent jobs on the same node serialise on a lock file, so only the first one copies the image; a copy older than the shared image is replaced.
+    If the copy fails, `fmriprep_image` falls back to the shared image.
+
+    Args:
+        stage_dir (str): The node-local directory to copy the image to (e.g. /tmp).
+
+    Returns:
+        str: Generated bash.
+
+    """
+    staged = f'{stage_dir}/fmriprep_image/{FMRIPREP_IMAGE.strip("/").replace("/", "_")}'
+    return f'fmriprep_image={staged}\n' +\
+        'mkdir -p "$(dirname "$fmriprep_image")"\n' +\
+        '(\n' +\
+        '    flock 9\n' +\
+        f'    if [ ! -e "$fmriprep_image" ] || [ {FMRIPREP_IMAGE} -nt "$fmriprep_image" ]; then\n' +\
+        '        echo "Staging fmriprep image in $fmriprep_image..."\n' +\
+        '        rm -rf "$fmriprep_image" "$fmriprep_image.tmp"\n' +\
+        f'        cp -a {FMRIPREP_IMAGE} "$fmriprep_image.tmp" && mv "$fmriprep_image.tmp" "$fmriprep_image"\n' +\
+        '    fi\n' +\
+        ') 9>"$fmriprep_image.lock"\n' +\
+        f'[ -e "$fmriprep_image" ] || fmriprep_image={FMRIPREP_IMAGE}\n\n'
+
+
+def trash_block(path: str, dir_trash: str) -> str:
+    """
+    Generate bash that moves a directory to a trash directory and empties the trash in the background.
+
+    The move is a rename on the same filesystem, so it returns at once however many files the directory holds.
+    The trash is emptied by a single low-priority (`nice`, and `ionice` idle class where available) process: a deleter started while another holds the lock exits, and the running one loops until the trash is empty, so deletions never pile up.
+
+    Args:
+        path (str): The directory to remove.
+        dir_trash (str): The trash directory, on the same filesystem as `path`.
+
+    Returns:
+        str: Generated bash.
+
+    """
+    return f'if [ -e {path} ]; then\n' +\
+        f'    mkdir -p {dir_trash}\n' +\
+        f'    mv {path} "$(mktemp -u {dir_trash}/$(basename {path}).XXXXXX)" || rm -rf {path}\n' +\
+        'fi\n' +\
+        '(\n' +\
+        '    flock -n 9 || exit 0\n' +\
+        '    ionice=$(command -v ionice >/dev/null && echo "ionice -c3")\n' +\
+        f'    while [ -n "$(ls {dir_trash} 2>/dev/null)" ]; do\n' +\
+        f'        nice -n 19 $ionice rm -rf {dir_trash}/* || break\n' +\
+        '    done\n' +\
+        f') 9>{dir_trash}.lock >/dev/null 2>&1 </dev/null &\n\n'
+
+
+def forward_signals() -> str:
+    """
+    Generate bash that passes SIGTERM and SIGINT on to the background jobs of the shell, waits for them and exits with 143 or 130.
+
+    Bash only runs a trap once the foreground command has returned, so a long command has to run in the background with `wait` for the signal to reach it; the traps are set again in every subshell that runs such a command.
+
+    Returns:
+        str: Generated bash.
+
+    """
+    return 'trap \'kill $(jobs -p) 2>/dev/null; wait; exit 143\' TERM\n' +\
+        'trap \'kill $(jobs -p) 2>/dev/null; wait; exit 130\' INT\n'
+
+
+def report_written(subject: str, dir_deriv: str) -> str:
+    """
+    Generate a bash condition that holds when fMRIPrep wrote the HTML report of a subject since the file `$started` was created.
+
+    Args:
+        subject (str): Subject ID.
+        dir_deriv (str): Derivatives directory path.
+
+    Returns:
+        str: The condition.
+
+    """
+    return f'{{ [ {dir_deriv}/{subject}.html -nt "$started" ] || [ {dir_deriv}/fmriprep/{subject}.html -nt "$started" ]; }}'
+
+
+def retry_block(label: str, command: str, verify: str, resume: dict) -> str:
+    """
+    Generate bash that runs a command until it succeeds or runs out of retries, and records every attempt.
+
+    An attempt succeeds when the command exits with 0 and the `verify` condition holds.
+    Every attempt appends `{"subject", "attempt", "host", "start", "end", "exit_status"}` to the JSON lines file `resume['attempts']`.
+    Failed attempts are retried after an exponential back-off (`delay`, `2 * delay`, ...); interrupted attempts (SIGINT, SIGTERM) are not.
+    The command runs in the background, so the caller's `forward_signals` traps reach it.
+    The block sets `fmriprep_status` to the status of the last attempt and leaves the file `$started`, created at its start, for the caller to remove.
+
+    Args:
+        label (str): The subject (or subject-session) of the records.
+        command (str): The command to run.
+        verify (str): A bash condition that holds when the outputs of the command are complete (see `report_written`).
+        resume (dict): The `retries`, `delay` (seconds) and `attempts` file.
+
+    Returns:
+        str: Generated bash.
+
+    """
+    return f'mkdir -p {os.path.dirname(resume["attempts"])}\n' +\
+        'attempt=0\n' +\
+        'while :; do\n' +\
+        '    attempt=$((attempt + 1))\n' +\
+        f'    echo "Attempt $attempt of {resume["retries"] + 1}..."\n' +\
+        '    start=$(date +%s)\n' +\
+        '    rm -f "$started"\n' +\
+        '    started=$(mktemp)\n' +\
+        f'    {command} &\n' +\
+        '    wait $!\n' +\
+        '    fmriprep_status=$?\n' +\
+        f'    if [ "$fmriprep_status" -eq 0 ] && ! {verify}; then\n' +\
+        '        echo "Fmriprep exited with 0 but wrote no report"\n' +\
+        '        fmriprep_status=1\n' +\
+        '    fi\n' +\
+        f'    echo "{{\\"subject\\": \\"{label}\\", \\"attempt\\": $attempt, \\"host\\": \\"$(hostname)\\", ' +\
+        '\\"start\\": $start, \\"end\\": $(date +%s), \\"exit_status\\": $fmriprep_status}" ' +\
+        f'>> {resume["attempts"]}\n' +\
+        '    case $fmriprep_status in\n' +\
+        '        0|130|143) break ;;\n' +\
+        '    esac\n' +\
+        f'    [ "$attempt" -gt {resume["retries"]} ] && break\n' +\
+        f'    delay=$(({resume["delay"]} * 2 ** (attempt - 1)))\n' +\
+        '    echo "Fmriprep failed with exit status $fmriprep_status, keeping the working directory and retrying in $delay s..."\n' +\
+        '    sleep $delay\n' +\
+        'done\n\n'
+
+
+def claim_worker(blocks: Dict[str, str], dir_claims: str, ttl: int) -> str:
+    """
+    Generate bash for a worker that claims jobs one at a time through lock directories shared by all workers.
+
+    Every node runs the same worker; each job is run by the first worker that creates `<dir_claims>/<job>.lock` (`mkdir` is atomic, also on NFS).
+    While a job runs, its worker touches the lock every `ttl / 4` seconds; a lock not touched for `ttl` seconds belongs to a dead worker and is taken over, one taker at a time.
+    A finished job gets `<job>.done`, or `<job>.failed` holding the exit status, and is not claimed again (remove the `.failed` file to retry it).
+    The worker keeps polling until no job is left unfinished, so the jobs of workers that die are picked up; it exits with 1 if one of its own jobs failed.
+
+    Args:
+        blocks (Dict[str, str]): The bash block of every job, in the order the worker tries them; each block sets `fmriprep_status`.
+        dir_claims (str): The directory of the lock and result files, on a filesystem all workers share.
+        ttl (int): Seconds without a heartbeat after which a claim expires; must exceed the clock skew between the nodes.
+
+    Returns:
+        str: Generated bash.
+
+    """
+    out = f'claims={dir_claims}\n' +\
+        f'ttl={ttl}\n' +\
+        'mkdir -p $claims\n\n' +\
+        'age() {\n' +\
+        '    echo $(( $(date +%s) - $(stat -c %Y "$1" 2>/dev/null || date +%s) ))\n' +\
+        '}\n\n' +\
+        'finished() {\n' +\
+        '    [ -e $claims/$1.done ] || [ -e $claims/$1.failed ]\n' +\
+        '}\n\n' +\
+        'claim() {\n' +\
+        '    local lock=$claims/$1.lock steal=$claims/$1.steal status=1\n' +\
+        '    if ! mkdir $lock 2>/dev/null; then\n' +\
+        '        [ "$(age $lock)" -gt $ttl ] || return 1\n' +\
+        '        [ "$(age $steal)" -gt $ttl ] && rmdir $steal 2>/dev/null\n' +\
+        '        mkdir $steal 2>/dev/null || return 1\n' +\
+        '        if [ "$(age $lock)" -gt $ttl ]; then\n' +\
+        '            echo "Taking over the expired claim of $1 ($(cat $lock/owner 2>/dev/null))"\n' +\
+        '            rm -rf $lock\n' +\
+        '            mkdir $lock 2>/dev/null && status=0\n' +\
+        '        fi\n' +\
+        '        rmdir $steal\n' +\
+        '        [ $status -eq 0 ] || return 1\n' +\
+        '    fi\n' +\
+        '    # the job may have finished between the check and the claim\n' +\
+        '    if finished $1; then\n' +\
+        '        rm -rf $lock\n' +\
+        '        return 1\n' +\
+        '    fi\n' +\
+        '    echo "$(hostname) $$" > $lock/owner\n' +\
+        '}\n\n'
+
+    for k, block in enumerate(blocks.values()):
+        out += f'job_{k}() {{\n{block}}}\n\n'
+
+    out += f'jobs=({" ".join(blocks)})\n' +\
+        'failed=0\n' +\
+        'while :; do\n' +\
+        '    pending=0 ran=0\n' +\
+        '    for k in "${!jobs[@]}"; do\n' +\
+        '        job=${jobs[$k]}\n' +\
+        '        finished $job && continue\n' +\
+        '        pending=1\n' +\
+        '        claim $job || continue\n' +\
+        '        ran=1\n' +\
+        '        unset fmriprep_status\n' +\
+        '        ( while sleep $((ttl / 4)); do kill -0 $$ 2>/dev/null || exit; touch $claims/$job.lock; done ) &\n' +\
+        '        heartbeat=$!\n' +\
+        '        job_$k\n' +\
+        '        kill $heartbeat 2>/dev/null\n' +\
+        '        if [ "${fmriprep_status:-1}" -eq 0 ]; then\n' +\
+        '            touch $claims/$job.done\n' +\
+        '        else\n' +\
+        '            echo ${fmriprep_status:-1} > $claims/$job.failed\n' +\
+        '            failed=1\n' +\
+        '        fi\n' +\
+        '        rm -rf $claims/$job.lock\n' +\
+        '    done\n' +\
+        '    [ $pending -eq 0 ] && break\n' +\
+        '    # wait for the jobs claimed by other workers, to take them over if their worker dies\n' +\
+        '    [ $ran -eq 1 ] || sleep $((ttl / 4))\n' +\
+        'done\n' +\
+        'exit $failed\n'
+    return out
+
+
+def prefetch_templateflow(cache: str, templates: List[str]) -> str:
+    """
+    Generate bash that downloads TemplateFlow templates into a cache with the TemplateFlow client of the fMRIPrep image.
+
+    It has to run on a node with network access, once per project.
+
+    Args:
+        cache (str): The TemplateFlow home directory to fill.
+        templates (List[str]): The template names (see `utils.templateflow.required_templates`).
+
+    Returns:
+        str: Generated bash.
+
+    """
+    return f'mkdir -p {cache}\n' +\
+        f'export SINGULARITYENV_TEMPLATEFLOW_HOME={TEMPLATEFLOW_HOME}\n' +\
+        f'singularity exec --cleanenv -B {cache}/:{TEMPLATEFLOW_HOME} {FMRIPREP_IMAGE} ' +\
+        f'python -c "from templateflow.api import get; get({templates!r})"\n'
+
+
+def scratch_block(subject: str, command: str, dir_deriv: str, dir_work: str, scratch: str) -> str:
+    """
+    Generate bash that runs a command in a node-local scratch directory.
+
+    The block runs in a background subshell with its own traps: the scratch directory is created under `scratch`, the derivatives are copied back on success, the crash files are copied to `<dir_work>/crash/<subject>` on failure, and the scratch directory is always removed.
+    The script waits for the subshell and forwards SIGTERM and SIGINT to it, so the cleanup also happens when the job is killed (but not with SIGKILL).
+    The command is expected to write its derivatives to `"$scratch/deriv"` and its working files to `"$scratch/work"`.
+
+    Args:
+        subject (str): Subject ID.
+        command (str): The command to run.
+        dir_deriv (str): Derivatives directory path the results are copied to.
+        dir_work (str): Working directory path the crash files are copied to.
+        scratch (str): The node-local directory to create the scratch directory in (e.g. ${TMPDIR:-/tmp}).
+
+    Returns:
+        str: Generated bash.
+
+    """
+    return forward_signals() +\
+        '(\n' +\
+        f'scratch=$(mktemp -d "{scratch}/fmriprep_{subject}.XXXXXX") || exit 1\n' +\
+        'cleanup() {\n' +\
+        '    status=$?\n' +\
+        '    if [ $status -ne 0 ]; then\n' +\
+        '        echo "Fmriprep failed, copying crash files..."\n' +\
+        f'        mkdir -p {dir_work}/crash/{subject}\n' +\
+        f'        find "$scratch" -name "crash-*" -exec cp {{}} {dir_work}/crash/{subject}/ \\;\n' +\
+        '    fi\n' +\
+        '    echo "Removing scratch directory..."\n' +\
+        '    rm -rf "$scratch"\n' +\
+        '    exit $status\n' +\
+        '}\n' +\
+        'trap cleanup EXIT\n' +\
+        'trap \'kill $(jobs -p) 2>/dev/null; wait; exit 143\' TERM\n' +\
+        'mkdir -p "$scratch/work" "$scratch/deriv"\n\n' +\
+        f'{command} &\n' +\
+        'wait $! || exit $?\n\n' +\
+        'echo "Fmriprep done. Copying derivatives..."\n' +\
+        f'cp -a "$scratch/deriv/." {dir_deriv}/\n' +\
+        ') &\n' +\
+        'wait $!\n' +\
+        'fmriprep_status=$?\n\n'
+
+
+def concurrent_blocks(blocks: Dict[str, str], dir_logs: str, limit: int) -> str:
+    """
+    Generate bash that runs the blocks of several subjects concurrently.
+
+    At most `limit` blocks run at the same time (a job semaphore with `wait -n`, which needs bash 4.3).
+    The output of every block goes to `<dir_logs>/<subject>.log` and its exit status (the `fmriprep_status` it sets) to `<dir_logs>/<subject>.exit`.
+    The generated bash exits with a non-zero status if any subject failed.
+    SIGTERM and SIGINT are passed on to the running blocks, and by them to their fMRIPrep calls (see `forward_signals`).
+
+    Args:
+        blocks (Dict[str, str]): The bash block of every subject (see `generate_bash_for_subject`).
+        dir_logs (str): The directory for the per-subject logs and exit statuses.
+        limit (int): The maximum number of subjects running at the same time.
+
+    Returns:
+        str: Generated bash.
+
+    """
+    out = f'mkdir -p {dir_logs}\n' +\
+        f'rm -f {dir_logs}/*.exit\n' +\
+        forward_signals() + '\n'
+
+    for subject, block in blocks.items():
+        out += f'while [ "$(jobs -rp | wc -l)" -ge {limit} ]; do wait -n; done\n' +\
+            '(\n' +\
+            forward_signals() +\
+            '{\n' +\
+            block +\
+            f'}} > {dir_logs}/{subject}.log 2>&1\n' +\
+            f'echo "${{fmriprep_status:-1}}" > {dir_logs}/{subject}.exit\n' +\
+            ') &\n' +\
+            f'echo "Started {subject}, log: {dir_logs}/{subject}.log"\n\n'
+
+    out += 'wait\n\n' +\
+        'failed=0\n' +\
+        f'for subject in {" ".join(blocks)}; do\n' +\
+        f'    status=$(cat {dir_logs}/$subject.exit 2>/dev/null || echo 1)\n' +\
+        '    echo "$subject finished with exit status $status"\n' +\
+        '    [ "$status" -eq 0 ] || failed=1\n' +\
+        'done\n' +\
+        'exit $failed\n'
+    return out
+
+
+def container_setup(templateflow: str = None, stage_image: str = None) -> tuple[str, str]:
+    """
+    Generate the extra container binds and the bash environment for a TemplateFlow cache and a staged image.
+
+    Args:
+        templateflow (str, optional): Pre-filled TemplateFlow cache to bind read-only into the container (see `prefetch_templateflow`). Defaults to None.
+        stage_image (str, optional): Node-local directory to copy the fMRIPrep image to (see `stage_image_block`). Defaults to None.
+
+    Returns:
+        tuple[str, str]: The binds, each followed by a comma, and the bash to run before the container.
+
+    """
+    binds, env = '', ''
+
+    if templateflow:
+        binds += f'{templateflow}/:{TEMPLATEFLOW_HOME}:ro,'
+        env = f'export SINGULARITYENV_TEMPLATEFLOW_HOME={TEMPLATEFLOW_HOME}\n' +\
+            'export SINGULARITYENV_TEMPLATEFLOW_AUTOUPDATE=0\n'
+
+    if stage_image:
+        env += stage_image_block(stage_image)
+
+    return binds, env
+
+
+def fmriprep_command(
+    subjects: List[str],
+    dir_bids: str,
+    dir_deriv: str,
+    dir_out: str,
+    dir_work: str,
+    dir_sub_work: str,
+    binds: str = '',
+    stage_image: str = None,
+    budget: dict = None,
+    anat_derivatives: str = None,
+    anat_only: bool = False,
+    bids_filter: str = None,
+    clean_workdir: bool = True,
+    stop_on_first_crash: bool = True
+) -> str:
+    """
+    Generate the fMRIPrep container call.
+
+    Args:
+        subjects (List[str]): The subjects to process, passed together to `--participant-label`.
+        dir_bids (str): BIDS directory path.
+        dir_deriv (str): Derivatives directory path, bound into the container.
+        dir_out (str): The fMRIPrep output directory.
+        dir_work (str): Working directory path, bound into the container.
+        dir_sub_work (str): The fMRIPrep working directory (`-w`).
+        binds (str, optional): Extra binds, each followed by a comma. Defaults to ''.
+        stage_image (str, optional): Run the staged image `"$fmriprep_image"` (see `stage_image_block`). Defaults to None (the shared image).
+        budget (dict, optional): CPU and memory budget of the invocation (see `budget_args`). Defaults to None.
+        anat_derivatives (str, optional): fMRIPrep output directory with the anatomical derivatives (`--anat-derivatives`), bound into the container. Defaults to None.
+        anat_only (bool, optional): Only run the anatomical workflow (`--anat-only`). Defaults to False.
+        bids_filter (str, optional): BIDS filter file (`--bids-filter-file`). Defaults to None.
+        clean_workdir (bool, optional): Pass `--clean-workdir`. Defaults to True.
+        stop_on_first_crash (bool, optional): Pass `--stop-on-first-crash`. Defaults to True.
+
+    Returns:
+        str: The command.
+
+    """
+    if anat_derivatives and os.path.normpath(anat_derivatives) != os.path.normpath(dir_deriv):
+        binds += f'{anat_derivatives}/,'
+
+    return 'singularity run --cleanenv -B ' +\
+        f'{dir_bids}/,{dir_deriv}/,{dir_work}/,{binds}' +\
+        '/afs/cbs/software/freesurfer/ ' +\
+        ('"$fmriprep_image" ' if stage_image else f'{FMRIPREP_IMAGE} ') +\
+        f'{dir_bids}/ {dir_out} ' +\
+        f'participant --participant-label {" ".join(subject.split("-")[1] for subject in subjects)} ' +\
+        f'{FMRIPREP_OPTIONS} --fs-license-file /afs/cbs/software/freesurfer/licensekeys ' +\
+        budget_args(budget or {}) +\
+        (f'--anat-derivatives {anat_derivatives}/ ' if anat_derivatives else '') +\
+        ('--anat-only ' if anat_only else '') +\
+        (f'--bids-filter-file {bids_filter} ' if bids_filter else '') +\
+        f'--fs-no-reconall -w {dir_sub_work} ' +\
+        ('--clean-workdir ' if clean_workdir else '') +\
+        '--write-graph ' +\
+        ('--stop-on-first-crash ' if stop_on_first_crash else '') +\
+        '--notrack --verbose --skip-bids-validation'
+
+
 def generate_bash_for_subject(
     subject: str,
     dir_bids: str,
     dir_deriv: str,
     dir_work: str,
-    dir_sub_work: str
+    dir_sub_work: str,
+    metrics: str = None,
+    scratch: str = None,
+    budget: dict = None,
+    on_success: list[str] = None,
+    anat_derivatives: str = None,
+    anat_only: bool = False,
+    templateflow: str = None,
+    stage_image: str = None,
+    bids_filter: str = None,
+    sessions: list[str] = None,
+    trash: str = None,
+    resume: dict = None,
+    label: str = None,
+    ledger: str = None
 ) -> str:
     """
     Generate bash script for processing a subject.
 
+    The block sets `fmriprep_status` to the exit status of fMRIPrep, and `failed` to 1 if it is not 0, so a script running several blocks can end with `exit $failed`.
+    fMRIPrep runs in the background of the shell running the block, which passes SIGTERM and SIGINT on to it (see `forward_signals`).
+
     Args:
         subject (str): Subject ID.
         dir_bids (str): BIDS directory path.
         dir_deriv (str): Derivatives directory path.
         dir_work (str): Working directory path.
         dir_sub_work (str): Subject's working directory path.
+        metrics (str, optional): JSON lines file to record the runtime and memory use of the container call in. Defaults to None (no instrumentation).
+        scratch (str, optional): Node-local directory to put the fMRIPrep working and output directories in (see `scratch_block`). Defaults to None (work directly on the project directories).
+        budget (dict, optional): CPU and memory budget of the invocation (see `budget_args`). Defaults to None (let fMRIPrep use the whole machine).
+        on_success (list[str], optional): Commands to run when fMRIPrep succeeded. Defaults to None.
+        anat_derivatives (str, optional): fMRIPrep output directory with the subject's anatomical derivatives, passed as `--anat-derivatives` and bound into the container. Defaults to None (compute the anatomical workflow).
+        anat_only (bool, optional): Only run the anatomical workflow (`--anat-only`). Defaults to False.
+        templateflow (str, optional): Pre-filled TemplateFlow cache to bind read-only into the container (see `prefetch_templateflow`). Defaults to None (the container's own cache).
+        stage_image (str, optional): Node-local directory to copy the fMRIPrep image to before running it (see `stage_image_block`). Defaults to None (run the shared image).
+        bids_filter (str, optional): BIDS filter file selecting the data to process (`--bids-filter-file`), inside a bound directory. Defaults to None (all data of the subject).
+        sessions (list[str], optional): The sessions the filter selects, shown next to the subject. Defaults to None.
+        trash (str, optional): Trash directory to move the working directory to instead of deleting it in the foreground (see `trash_block`). Ignored with `scratch`. Defaults to None (`rm -rf`).
+        resume (dict, optional): Keep the working directory between attempts and retry failures (see `retry_block`); it is only removed after a verified success. Ignored with `scratch`. Defaults to None (a single attempt in a clean working directory).
+        label (str, optional): The job label of the attempt and ledger records. Defaults to None (the subject).
+        ledger (str, optional): SQLite ledger to mark the job running and done or failed in (see `ledger_command`). Defaults to None.
 
     Returns:
         str: Generated bash script.
 
     """
-    return f'echo "Subject: {subject}"\n' +\
-        'echo "Clearing fmriprep working directory..."\n' +\
-        f'rm -rf {dir_sub_work}\n\n' +\
-        'singularity run --cleanenv -B ' +\
-        f'{dir_bids}/,{dir_deriv}/,{dir_work}/,' +\
-        '/afs/cbs/software/freesurfer/ ' +\
-        '/data/p_SoftwareServiceLinux_sc/fmriprep/22.0.1/1 ' +\
-        f'{dir_bids}/ {dir_deriv}/ ' +\
-        f'participant --participant-label {subject.split("-")[1]} ' +\
-        '--use-aroma --output-spaces T1w MNI152NLin6Asym ' +\
-        '--dummy-scans 0 --fs-license-file /afs/cbs/software/freesurfer/licensekeys ' +\
-        f'--fs-no-reconall -w {dir_sub_work} --clean-workdir ' +\
-        '--write-graph --stop-on-first-crash --notrack --verbose --skip-bids-validation\n\n' +\
-        'echo "Fmriprep done. Removing fmriprep working directory..."\n' +\
-        f'rm -rf {dir_sub_work}\n\n'
\ No newline at end of file
+    dir_out, scratch_binds = f'{dir_deriv}/', ''
+
+    if scratch:
+        dir_out, dir_sub_work, scratch_binds = '"$scratch/deriv"', '"$scratch/work"', '"$scratch",'
+        resume = None
+
+    binds, env = container_setup(templateflow, stage_image)
+    # a resumed run keeps the cached nodes, and lets the other branches finish after a crash
+    command = fmriprep_command(
+        [subject],
+        dir_bids,
+        dir_deriv,
+        dir_out,
+        dir_work,
+        dir_sub_work,
+        scratch_binds + binds,
+        stage_image,
+        budget,
+        anat_derivatives,
+        anat_only,
+        bids_filter,
+        clean_workdir=not resume,
+        stop_on_first_crash=not resume
+    )
+
+    if metrics:
+        command = instrument_command(command, subject, metrics)
+
+    header = f'echo "Subject: {subject}"\n' if not sessions else f'echo "Subject: {subject} ({" ".join(sessions)})"\n'
+
+    if ledger:
+        stage = 'fmriprep_anat' if anat_only else 'fmriprep'
+        header += ledger_command(ledger, 'start', stage, label or subject)
+
+    if scratch:
+        out = header + env + scratch_block(subject, command, dir_deriv, dir_work, scratch)
+    elif resume:
+        remove = trash_block(dir_sub_work, trash) if trash else f'rm -rf {dir_sub_work}\n\n'
+        out = header +\
+            forward_signals() +\
+            env +\
+            f'echo "Reusing fmriprep working directory {dir_sub_work}"\n' +\
+            retry_block(label or subject, command, report_written(subject, dir_deriv), resume) +\
+            'rm -f "$started"\n' +\
+            'if [ "$fmriprep_status" -eq 0 ]; then\n' +\
+            '    echo "Fmriprep done. Removing fmriprep working directory..."\n' +\
+            ''.join(f'    {line}\n' for line in remove.strip().split('\n')) +\
+            'else\n' +\
+            f'    echo "Fmriprep failed, keeping {dir_sub_work} for the next run"\n' +\
+            'fi\n\n'
+    else:
+        remove = trash_block(dir_sub_work, trash) if trash else f'rm -rf {dir_sub_work}\n\n'
+        out = header +\
+            forward_signals() +\
+            env +\
+            'echo "Clearing fmriprep working directory..."\n' +\
+            remove +\
+            f'{command} &\n' +\
+            'wait $!\n' +\
+            'fmriprep_status=$?\n\n' +\
+            'echo "Fmriprep done. Removing fmriprep working directory..."\n' +\
+            remove
+
+    if on_success:
+        out += 'if [ "$fmriprep_status" -eq 0 ]; then\n' +\
+            ''.join(f'    {line}\n' for line in on_success) +\
+            'fi\n\n'
+
+    if ledger:
+        out += ledger_command(ledger, 'finish', stage, label or subject, '"$fmriprep_status"') + '\n'
+
+    return out + '[ "$fmriprep_status" -eq 0 ] || failed=1\n\n'
+
+
+def generate_bash_for_batch(
+    name: str,
+    subjects: List[str],
+    dir_bids: str,
+    dir_deriv: str,
+    dir_work: str,
+    dir_batch_work: str,
+    metrics: str = None,
+    budget: dict = None,
+    on_success: Dict[str, List[str]] = None,
+    anat_derivatives: str = None,
+    anat_only: bool = False,
+    templateflow: str = None,
+    stage_image: str = None,
+    trash: str = None,
+    resume: dict = None,
+    ledger: str = None
+) -> str:
+    """
+    Generate bash script for processing several subjects in a single fMRIPrep invocation with a shared working directory.
+
+    fMRIPrep builds one workflow for all the subjects, so its scheduler can run the nodes of different subjects side by side.
+    The run is not stopped at the first crash; once it ends, every subject counts as done when fMRIPrep succeeded, or when it wrote the subject's report and no crash file of the subject since the start of the run.
+    Done subjects get their `on_success` commands and ledger record, and with `resume` their part of the working directory (`fmriprep_*_wf/single_subject_<label>_wf`) is removed; the other subjects are reported as failed.
+    The block sets `fmriprep_status`, and `failed` as `generate_bash_for_subject` does, to 1 if any subject failed.
+
+    Args:
+        name (str): The name of the batch (e.g. the group name), used for the metrics and attempt records.
+        subjects (List[str]): Subject IDs.
+        dir_bids (str): BIDS directory path.
+        dir_deriv (str): Derivatives directory path.
+        dir_work (str): Working directory path.
+        dir_batch_work (str): The fMRIPrep working directory shared by the subjects.
+        metrics (str, optional): JSON lines file to record the runtime and memory use of the container call in, under the batch name; keep it apart from the per-subject records. Defaults to None (no instrumentation).
+        budget (dict, optional): CPU and memory budget of the invocation (see `budget_args`). Defaults to None (let fMRIPrep use the whole machine).
+        on_success (Dict[str, List[str]], optional): Commands to run for every subject that succeeded. Defaults to None.
+        anat_derivatives (str, optional): fMRIPrep output directory with the anatomical derivatives of all the subjects (`--anat-derivatives`). Defaults to None (compute the anatomical workflows).
+        anat_only (bool, optional): Only run the anatomical workflow (`--anat-only`). Defaults to False.
+        templateflow (str, optional): Pre-filled TemplateFlow cache to bind read-only into the container (see `prefetch_templateflow`). Defaults to None (the container's own cache).
+        stage_image (str, optional): Node-local directory to copy the fMRIPrep image to before running it (see `stage_image_block`). Defaults to None (run the shared image).
+        trash (str, optional): Trash directory to move working directories to instead of deleting them in the foreground (see `trash_block`). Defaults to None (`rm -rf`).
+        resume (dict, optional): Keep the working directory between attempts and retry the batch until every subject has a report (see `retry_block`); it is only removed once all subjects succeeded. Defaults to None (a single attempt in a clean working directory).
+        ledger (str, optional): SQLite ledger to mark every subject running and done or failed in (see `ledger_command`). Defaults to None.
+
+    Returns:
+        str: Generated bash script.
+
+    """
+    on_success = on_success or {}
+    stage = 'fmriprep_anat' if anat_only else 'fmriprep'
+    binds, env = container_setup(templateflow, stage_image)
+    command = fmriprep_command(
+        subjects,
+        dir_bids,
+        dir_deriv,
+        f'{dir_deriv}/',
+        dir_work,
+        dir_batch_work,
+        binds,
+        stage_image,
+        budget,
+        anat_derivatives,
+        anat_only,
+        clean_workdir=False,
+        stop_on_first_crash=False
+    )
+
+    if metrics:
+        command = instrument_command(command, name, metrics)
+
+    remove = trash_block(dir_batch_work, trash) if trash else f'rm -rf {dir_batch_work}\n\n'
+    out = f'echo "Batch: {name} ({" ".join(subjects)})"\n'
+
+    if ledger:
+        out += ''.join(ledger_command(ledger, 'start', stage, subject) for subject in subjects)
+
+    out += forward_signals() + env
+
+    if resume:
+        out += f'echo "Reusing fmriprep working directory {dir_batch_work}"\n' +\
+            retry_block(name, command, '{ ' + ' && '.join(report_written(subject, dir_deriv) for subject in subjects) + '; }', resume)
+    else:
+        out += 'echo "Clearing fmriprep working directory..."\n' +\
+            remove +\
+            'started=$(mktemp)\n' +\
+            f'{command} &\n' +\
+            'wait $!\n' +\
+            'fmriprep_status=$?\n\n'
+
+    out += 'batch_status=0\n'
+
+    for subject in subjects:
+        logs = f'{dir_deriv}/{subject}/log {dir_deriv}/fmriprep/{subject}/log'
+        lines = list(on_success.get(subject, []))
+
+        if resume:
+            wf = f'{dir_batch_work}/fmriprep_*_wf/single_subject_{subject.split("-", 1)[1]}_wf'
+            lines += [f'for wf in {wf}; do', *(f'    {line}' for line in (trash_block('"$wf"', trash) if trash else 'rm -rf "$wf"').strip().split('\n')), 'done']
+
+        failed = [f'echo "{subject}: failed, see the crash files in its log directory"', 'batch_status=1']
+
+        if ledger:
+            lines.append(ledger_command(ledger, 'finish', stage, subject, '0').strip())
+            failed.append(ledger_command(ledger, 'finish', stage, subject, '"$fmriprep_status"').strip())
+
+        out += f'if [ "$fmriprep_status" -eq 0 ] || {{ {report_written(subject, dir_deriv)} && ' +\
+            f'[ -z "$(find {logs} -name \'crash-*\' -newer "$started" 2>/dev/null)" ]; }}; then\n' +\
+            f'    echo "{subject}: done"\n' +\
+            ''.join(f'    {line}\n' for line in lines) +\
+            'else\n' +\
+            ''.join(f'    {line}\n' for line in failed) +\
+            'fi\n'
+
+    out += 'rm -f "$started"\n\n'
+
+    if resume:
+        out += 'if [ "$batch_status" -eq 0 ]; then\n' +\
+            '    echo "Batch done. Removing fmriprep working directory..."\n' +\
+            ''.join(f'    {line}\n' for line in remove.strip().split('\n')) +\
+            'else\n' +\
+            f'    echo "Batch incomplete, keeping {dir_batch_work} for the next run"\n' +\
+            'fi\n\n'
+    else:
+        out += 'echo "Fmriprep done. Removing fmriprep working directory..."\n' + remove
+
+    return out + 'fmriprep_status=$batch_status\n' +\
+        '[ "$fmriprep_status" -eq 0 ] || failed=1\n\n'
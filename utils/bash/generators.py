@@ -1,14 +1,28 @@
 import argparse
-from glob import glob
 import json
 import logging
 import os
-from typing import Generator
+import time
+from typing import Dict, Generator, List, Optional
 
-from utils.bash import generate_bash_for_subject
-from utils.fmaps import get_fmap_by_run_num
-from utils.parse import find_in_string
+from utils.bash import FMRIPREP_IMAGE, FMRIPREP_OPTIONS, claim_worker, concurrent_blocks, generate_bash_for_batch, generate_bash_for_subject
+from utils.anat import find_anat_derivatives, missing_anat_outputs, standard_spaces
+from utils.bids import BidsIndex, session_filter
+from utils.completion import completion_status, input_fingerprint, stamp_paths, write_pending_stamp
+from utils.condor import render_dag, render_submit
+from utils.cost import balance_groups, estimate_subject_resources
+from utils.fmaps import acquisition_seconds, invert_fmap_dict, load_fmap_overrides, match_fmaps
+from utils.ledger import Ledger
+from utils.parallel import run_parallel
+from utils.parse import find_in_string, group_name
 from utils.path import join_or_make
+from utils.profiler import cohort_plan, profile_subject, subject_plan
+from utils.resources import compute_budget
+from utils.shard import assign_shards, shard_order
+from utils.sidecars import PatchStats, SidecarCache, SidecarManifest, update_json
+from utils.subjects import SubjectSet
+from utils.templateflow import missing_templates, required_templates
+from utils.watch import StabilityTracker, subject_snapshot
 
 
 class BashScriptGenerator:
@@ -28,15 +42,62 @@ class BashScriptGenerator:
             args (argparse.Namespace): Command line arguments containing subjects, sessions, project directory, and fmap dictionary.
             The expected properties of `args` include:
                 - subjects (list): A list of subject identifiers.
+                - subject_set (SubjectSet, optional): The selected subjects, which may hold ranges of subjects missing from the dataset; only the subjects present are expanded (see `resolve_subjects`). Defaults to the `subjects`.
                 - sessions (list): A list of session identifiers.
                 - project_dir (str): The root directory for the project.
-                - fmap_dict (dict): A dictionary mapping functional runs to field maps.
+                - fmap_dict (dict, optional): A dictionary mapping field maps to functional runs, used for all subjects. Defaults to None (match by acquisition time).
+                - fmap_override (str, optional): A JSON or YAML file of field map to run mappings per subject, session or for all subjects (see `utils.fmaps.load_fmap_overrides`). Defaults to None.
+                - jobs (int, optional): The number of workers used to patch the JSON sidecars. Defaults to 1.
+                - instrument (bool, optional): Record the runtime and memory use of every fMRIPrep call. Defaults to False.
+                - scratch (str, optional): Node-local directory for the fMRIPrep working directory. Defaults to None (use the project share).
+                - machine_cpus, machine_memory_mb (int, optional): The size of the machine the scripts run on, split between the concurrent fMRIPrep invocations. Defaults to None (no budget).
+                - concurrent_jobs (int, optional): How many scripts run side by side on the machine. Defaults to 1 (one per group for `BashGroupsGenerator`).
+                - low_mem_threshold_mb (int, optional): Enable `--low-mem` below this memory per invocation. Defaults to None.
+                - force (bool, optional): Process subjects whose derivatives are complete and current. Defaults to False.
+                - reuse_anat (bool, optional): Pass existing anatomical derivatives of a subject to fMRIPrep instead of recomputing them. Defaults to False.
+                - anat_only (bool, optional): Generate the anatomical-only stage, writing to `data/derivatives/fmriprep_anat`. Defaults to False.
+                - templateflow (bool, optional): Bind the project TemplateFlow cache (`<project_dir>/templateflow`) read-only into the container. Defaults to False.
+                - stage_image (str, optional): Node-local directory to copy the fMRIPrep image to once per node. Defaults to None (run the shared image).
+                - split_sessions (bool, optional): Run every session of a subject as its own fMRIPrep job, selected with a BIDS filter file. Defaults to False.
+                - async_cleanup (bool, optional): Move working directories to `fmriprep_work/trash` and delete them in the background. Defaults to False.
+                - resume (bool, optional): Keep the working directories of failed runs and retry them, recording every attempt in `fmriprep_work/metrics/attempts.jsonl`. Defaults to False.
+                - ledger (bool, optional): Register the jobs in the SQLite ledger `fmriprep_work/ledger.sqlite` and have the scripts update their state. Defaults to False.
+                - shard (tuple[int, int], optional): Only generate the jobs of shard i of N, dealt round-robin from the sorted jobs. Defaults to None (all jobs).
+                - retries, retry_delay (int, optional): The retries of a failed run and the seconds before the first one, doubled for every further retry. Default to 2 and 600.
         """
-        self.subjects = args.subjects
-        logging.info(f'subjects are: {self.subjects}')
+        subject_set = getattr(args, 'subject_set', None)
+        self.subject_set = SubjectSet.from_subjects(args.subjects) if subject_set is None else subject_set
+        logging.info(f'subjects are: {self.subject_set}')
+        # filled in by `resolve_subjects` once the dataset is indexed
+        self.subjects = []
         self.sessions = args.sessions
         self.project_dir = args.project_dir
-        self.fmap_dict = args.fmap_dict
+        self.fmap_dict = getattr(args, 'fmap_dict', None)
+        fmap_override = getattr(args, 'fmap_override', None)
+        self.fmap_overrides = load_fmap_overrides(fmap_override) if fmap_override else {}
+
+        if self.fmap_dict:
+            self.fmap_overrides.setdefault('*', invert_fmap_dict(self.fmap_dict))
+
+        self.jobs = getattr(args, 'jobs', 1)
+        self.instrument = getattr(args, 'instrument', False)
+        self.scratch = getattr(args, 'scratch', None)
+        self.machine_cpus = getattr(args, 'machine_cpus', None)
+        self.machine_memory_mb = getattr(args, 'machine_memory_mb', None)
+        self.concurrent_jobs = getattr(args, 'concurrent_jobs', None)
+        self.low_mem_threshold_mb = getattr(args, 'low_mem_threshold_mb', None)
+        self.force = getattr(args, 'force', False)
+        self.reuse_anat = getattr(args, 'reuse_anat', False)
+        self.anat_only = getattr(args, 'anat_only', False)
+        self.templateflow = getattr(args, 'templateflow', False)
+        self.stage_image = getattr(args, 'stage_image', None)
+        self.split_sessions = getattr(args, 'split_sessions', False)
+        self.async_cleanup = getattr(args, 'async_cleanup', False)
+        self.resume = getattr(args, 'resume', False)
+        self.use_ledger = getattr(args, 'ledger', False)
+        self.retries = getattr(args, 'retries', 2)
+        self.retry_delay = getattr(args, 'retry_delay', 600)
+        self.shard = getattr(args, 'shard', None)
         self.sub2num = {
             subject: find_in_string(subject, r'sub-(\d+)')
             for subject in self.subjects
@@ -45,8 +106,29 @@ class BashScriptGenerator:
             session: find_in_string(session, r'ses-(\d+)')
             for session in self.sessions
         }
+        self.unit_sessions = self.split_units()
+        self.units = list(self.unit_sessions)
         self._dirs_set = False
-        self.kernel = '#! /bin/bash\n\n'
+        self.stats = PatchStats()
+        self.kernel = '#! /bin/bash\n\nfailed=0\n\n'
+
+    def split_units(self) -> Dict[str, tuple[str, list[str]]]:
+        """
+        Splits the work into fMRIPrep jobs: one per subject, or one per subject and session with `split_sessions`.
+
+        The anatomical-only stage is never split, as the anatomical workflow uses the T1w images of all sessions.
+
+        Returns:
+            Dict[str, tuple[str, list[str]]]: The subject and sessions of every job, keyed by its label (e.g. sub-01 or sub-01_ses-01).
+        """
+        if not self.split_sessions or self.anat_only:
+            return {subject: (subject, self.sessions) for subject in self.subjects}
+
+        return {
+            f'{subject}_{session}': (subject, [session])
+            for subject in self.subjects
+            for session in self.sessions
+        }
 
     def validate_dirs(self):
         """
@@ -55,6 +137,11 @@ class BashScriptGenerator:
         if not self._dirs_set:
             self.setup_dirs()
             self._dirs_set = True
+            shards = assign_shards(self.units, self.shard[1]) if self.shard else None
+            self.select_subjects()
+
+            if shards:
+                self.apply_shard(shards)
 
     def setup_dirs(self):
         """
@@ -71,57 +158,336 @@ class BashScriptGenerator:
         self.dir_deriv = join_or_make(self.dir_bids, 'derivatives')
         self.dir_work = join_or_make(self.dir_proj, 'fmriprep_work')
 
-        self.sub_dir_work = {
-            subject: os.path.join(
-                self.dir_work,
-                'fmriprep_wf',
-                f'single_subject_{subject.split("-")[1]}_wf'
-            )
-            for subject in self.subjects
-        }
-
         join_or_make(self.dir_deriv, 'fmriprep')
-        join_or_make(self.dir_work, 'condor_log')
+        self.dir_anat = join_or_make(self.dir_deriv, 'fmriprep_anat')
+        self.dir_condor_log = join_or_make(self.dir_work, 'condor_log')
+        self.dir_stamps = join_or_make(self.dir_work, 'stamps')
+        self.dir_filters = join_or_make(self.dir_work, 'bids_filters') if self.split_sessions else None
+        self.dir_trash = os.path.join(self.dir_work, 'trash') if self.async_cleanup else None
+        self.metrics = os.path.join(join_or_make(self.dir_work, 'metrics'), 'fmriprep_runs.jsonl') if self.instrument else None
+        self.attempts = os.path.join(join_or_make(self.dir_work, 'metrics'), 'attempts.jsonl') if self.resume else None
+        self.ledger = os.path.join(self.dir_work, 'ledger.sqlite') if self.use_ledger else None
+        self.dir_templateflow = os.path.join(self.dir_proj, 'templateflow') if self.templateflow else None
         logging.debug(f'Directories set up')
 
-    def b0_field_source_to_json(self, subject: str):
+        if self.resume and self.scratch:
+            logging.warning('--resume needs the working directories on the project share, it has no effect with --scratch')
+
+        if self.templateflow:
+            missing = missing_templates(self.dir_templateflow, required_templates(FMRIPREP_OPTIONS))
+
+            if missing:
+                logging.warning(f'TemplateFlow cache {self.dir_templateflow} lacks {missing}, run scripts/prepare_templateflow.py first')
+
+        self.index = BidsIndex(self.dir_bids, os.path.join(self.dir_work, 'bids_index.json')).refresh()
+        self.index.save()
+        logging.info(f'BIDS index ready ({self.index.rescanned} directories rescanned)')
+        self.resolve_subjects()
+        self.sub_dir_work = {unit: self.unit_work_dir(unit) for unit in self.units}
+        self.manifest = SidecarManifest(os.path.join(self.dir_work, 'sidecar_manifest.json'))
+        self.sidecar_cache = SidecarCache(os.path.join(self.dir_work, 'sidecar_cache.json'))
+
+    def unit_work_dir(self, unit: str) -> str:
         """
-        Updates the B0 field source in the JSON files for a given subject.
+        Args:
+            unit (str): The label of the job (e.g. sub-01 or sub-01_ses-01).
 
-        For each functional run of the specified subject, this method updates the JSON file to include the correct B0 field source information.
-        This is necessary for correctly processing the MRI data with respect to field map correction.
+        Returns:
+            str: The fMRIPrep working directory of the job.
+        """
+        return os.path.join(self.dir_work, 'fmriprep_wf', f'single_subject_{unit.split("-", 1)[1]}_wf')
+
+    def resolve_subjects(self):
+        """
+        Matches the requested subjects against the BIDS index, and sets up the subjects and jobs.
+
+        Only the subjects of the dataset are tested for membership, so a large range is never expanded.
+        Subjects that are not in the dataset (typos, or gaps in a range) are reported and left out; the others take the labels of the dataset, so a range written with another zero-padding still matches.
+        """
+        found, missing = self.subject_set.resolve(self.index.subjects())
+
+        if missing:
+            listed = str(missing)
+            logging.warning(
+                f'{len(missing)} requested subjects are not in {self.dir_bids} and are left out: '
+                f'{listed if len(listed) <= 200 else listed[:200] + " ..."}'
+            )
+
+        self.subjects = found
+        self.sub2num = {subject: find_in_string(subject, r'sub-(\d+)') for subject in self.subjects}
+        self.unit_sessions = self.split_units()
+        self.units = list(self.unit_sessions)
+
+    @property
+    def fmriprep_options(self) -> str:
+        """
+        The fMRIPrep image and options that determine the outputs, part of the stamp of every subject.
+
+        Returns:
+            str: The image and options.
+        """
+        return f'{FMRIPREP_IMAGE} {FMRIPREP_OPTIONS} --fs-no-reconall'
+
+    def stamp_options(self, subject: str, sessions: list[str]) -> str:
+        """
+        The options that determine the outputs of a subject: the fMRIPrep image and options, and the field map overrides that apply to the subject.
+
+        The overrides decide the B0 fields the sidecars are patched with, so a changed mapping reruns a subject even though its sidecars were not patched yet when it is checked.
 
         Args:
-            subject (str): The name of the subject for which to update the B0 field source.
+            subject (str): The subject.
+            sessions (list[str]): The sessions of the job.
+
+        Returns:
+            str: The options, part of the stamp of the subject.
+        """
+        keys = [f'{subject}_{session}' for session in sessions] + [subject, '*']
+        overrides = {key: self.fmap_overrides[key] for key in keys if key in self.fmap_overrides}
+        return f'{self.fmriprep_options} {json.dumps(overrides, sort_keys=True)}' if overrides else self.fmriprep_options
+
+    @property
+    def stage_name(self) -> str:
+        """
+        The name of the stage the scripts are generated for, used to name the script files.
+
+        Returns:
+            str: 'fmriprep_anat' for the anatomical-only stage, 'fmriprep' otherwise.
+        """
+        return 'fmriprep_anat' if self.anat_only else 'fmriprep'
+
+    @property
+    def resume_options(self) -> Optional[dict]:
+        """
+        Returns:
+            Optional[dict]: The `retries`, `delay` and `attempts` file of resumable runs, or None without `resume`.
+        """
+        if not self.resume:
+            return None
+
+        return {'retries': self.retries, 'delay': self.retry_delay, 'attempts': self.attempts}
+
+    def anat_derivatives(self, subject: str) -> str:
+        """
+        Finds complete anatomical derivatives of a subject, from the anatomical-only stage or a previous full run.
+
+        Args:
+            subject (str): The subject.
+
+        Returns:
+            str: The fMRIPrep output directory holding them, or None if there are none.
+        """
+        return find_anat_derivatives(
+            [self.dir_anat, os.path.join(self.dir_deriv, 'fmriprep'), self.dir_deriv],
+            subject,
+            standard_spaces(FMRIPREP_OPTIONS)
+        )
+
+    def select_subjects(self):
+        """
+        Leaves out the subjects whose derivatives are complete and were computed from their current inputs and options, unless `force` is set.
+
+        For the anatomical-only stage, the subjects with complete anatomical derivatives are left out.
+        With `split_sessions`, every subject and session is checked on its own.
+        The subjects that are kept and skipped are logged with the reason.
+        """
+        if self.force:
+            logging.info('Forced: processing all subjects')
+            return
+
+        selected, skipped = [], []
+
+        for unit in self.units:
+            subject, sessions = self.unit_sessions[unit]
+
+            if self.anat_only:
+                missing = missing_anat_outputs(self.dir_anat, subject, standard_spaces(FMRIPREP_OPTIONS))
+                reason = f'missing {len(missing)} anatomical outputs (e.g. {missing[0]})' if missing else None
+            else:
+                reason = completion_status(
+                    self.index,
+                    self.dir_deriv,
+                    self.dir_stamps,
+                    subject,
+                    sessions,
+                    self.stamp_options(subject, sessions),
+                    stamp=unit
+                )
+
+            if reason is None:
+                logging.info(f'Skipping {unit}: outputs complete and up to date')
+                skipped.append(unit)
+            else:
+                logging.info(f'Processing {unit}: {reason}')
+                selected.append(unit)
+
+        logging.info(f'{len(selected)} {"subject-sessions" if self.split_sessions else "subjects"} to process, {len(skipped)} skipped as up to date (use --force to rerun them)')
+        self.units = selected
+        self.subjects = list(dict.fromkeys(self.unit_sessions[unit][0] for unit in selected))
+
+    def apply_shard(self, shards: Dict[str, int]):
+        """
+        Keeps the jobs of the generator's shard.
+
+        Args:
+            shards (Dict[str, int]): The shard of every requested job (see `utils.shard.assign_shards`).
+        """
+        index, count = self.shard
+        self.units = [unit for unit in self.units if shards[unit] == index]
+        self.subjects = list(dict.fromkeys(self.unit_sessions[unit][0] for unit in self.units))
+        logging.info(f'Shard {index}/{count}: {len(self.units)} jobs')
+
+    def acquisition(self, path: str) -> tuple[float, str]:
+        """
+        Reads the acquisition time and phase encoding direction of an image from its sidecar.
+
+        Args:
+            path (str): The path of the JSON sidecar.
+
+        Returns:
+            tuple[float, str]: The acquisition time in seconds since midnight and the phase encoding direction.
+
+        Raises:
+            ValueError: If the sidecar lacks one of the fields.
+        """
+        fields = self.sidecar_cache.get(path, ('AcquisitionTime', 'PhaseEncodingDirection'))
+        missing = [k for k, v in fields.items() if v is None]
+
+        if missing:
+            raise ValueError(f'No {" or ".join(missing)} in {path}, map its run in an fmap override file')
+
+        return acquisition_seconds(fields['AcquisitionTime']), fields['PhaseEncodingDirection']
+
+    def fmap_lookup(self, subject: str, session: str) -> Dict[str, str]:
+        """
+        Matches every functional run of a session to its field map.
+
+        Runs mapped in the overrides (for the session, the subject, or all subjects, in that order) keep that field map.
+        The other runs get the nearest preceding field map with a compatible phase encoding axis, from the `AcquisitionTime` and `PhaseEncodingDirection` of the sidecars (see `utils.fmaps.match_fmaps`).
+
+        Args:
+            subject (str): The name of the subject.
+            session (str): The session.
+
+        Returns:
+            Dict[str, str]: The field map number of every run number.
+        """
+        overrides = [self.fmap_overrides.get(key, {}) for key in (f'{subject}_{session}', subject, '*')]
+        lookup, unmatched = {}, {}
+
+        for func_json in self.index.get(subject, session, 'func', suffix='bold', extension='.json'):
+            fmap = next((override[func_json.run] for override in overrides if func_json.run in override), None)
+
+            if fmap is not None:
+                lookup[func_json.run] = fmap
+            else:
+                unmatched[func_json.run] = self.acquisition(func_json.path)
+
+        if unmatched:
+            fmaps = {}
+
+            for fmap_json in self.index.get(subject, session, 'fmap', suffix='epi', extension='.json'):
+                fmaps.setdefault(fmap_json.run, []).append(self.acquisition(fmap_json.path))
+
+            lookup.update(match_fmaps(unmatched, fmaps))
+
+        logging.debug(f'Field maps of {subject}/{session}: {lookup}')
+        return lookup
+
+    def b0_field_sources(self, subject: str, session: str) -> Dict[str, Dict[str, str]]:
+        """
+        Computes the B0 field source of every functional run of a session.
+
+        Args:
+            subject (str): The name of the subject.
+            session (str): The session.
+
+        Returns:
+            Dict[str, Dict[str, str]]: The `B0FieldSource` field for every `*_bold.json` path.
         """
-        logging.info(f'Getting B0 field source for {subject}')
         sub_num = self.sub2num[subject]
+        ses_num = self.ses2num[session]
+        func_jsons = self.index.get(subject, session, 'func', suffix='bold', extension='.json')
 
-        for session, ses_num in self.ses2num.items():
-            logging.info(f'\tSession: {session}')
-            dir_func = join_or_make(self.dir_bids, subject, session, 'func')
-            func_jsons = glob(dir_func + '/*_bold.json')
+        if len(func_jsons) == 0:
+            dir_func = os.path.join(self.dir_bids, subject, session, 'func')
+            raise OSError(f'No "*_bold.json" pattern in {dir_func}')
+
+        logging.debug(f'func_jsons are: {[f.path for f in func_jsons]}')
+        out = {}
+
+        for func_json in func_jsons:
+            if func_json.run is None:
+                raise ValueError(f'No run number in {func_json.path}')
+
+        fmaps = self.fmap_lookup(subject, session)
+
+        for func_json in func_jsons:
+            fmap_num = fmaps[func_json.run]
+            out[func_json.path] = {'B0FieldSource': f'pepolarfmap{sub_num}{ses_num}{fmap_num}'}
+
+        return out
+
+    def b0_field_identifiers(self, subject: str, session: str) -> Dict[str, Dict[str, str]]:
+        """
+        Computes the B0 field identifier of every field map of a session.
+
+        Args:
+            subject (str): The name of the subject.
+            session (str): The session.
+
+        Returns:
+            Dict[str, Dict[str, str]]: The `B0FieldIdentifier` field for every `*_epi.json` path.
+        """
+        sub_num = self.sub2num[subject]
+        ses_num = self.ses2num[session]
+        fmap_jsons = self.index.get(subject, session, 'fmap', suffix='epi', extension='.json')
 
-            if len(func_jsons) == 0:
-                raise OSError(f'No "*_bold.json" pattern in {dir_func}')
+        if len(fmap_jsons) == 0:
+            dir_fmap = os.path.join(self.dir_bids, subject, session, 'fmap')
+            raise OSError(f'No "*_epi.json" pattern in {dir_fmap}')
 
-            logging.debug(f'func_jsons are: {func_jsons}')
+        logging.debug(f'fmap_jsons are: {[f.path for f in fmap_jsons]}')
+        out = {}
 
-            for func_json in func_jsons:
-                run_num = find_in_string(func_json, r'run-(\d+)')
-                fmap_num = get_fmap_by_run_num(run_num, self.fmap_dict)
+        for fmap_json in fmap_jsons:
+            if fmap_json.run is None:
+                raise ValueError(f'No run number in {fmap_json.path}')
+
+            out[fmap_json.path] = {'B0FieldIdentifier': f'pepolarfmap{sub_num}{ses_num}{fmap_json.run}'}
+
+        return out
+
+    def update_sidecars(self, updates: Dict[str, Dict[str, str]]):
+        """
+        Writes fields to JSON sidecars, skipping the files that already hold the right values.
+
+        Args:
+            updates (Dict[str, Dict[str, str]]): The fields to set for every sidecar path.
+        """
+        for path, fields in updates.items():
+            rewritten = update_json(path, fields)
+            logging.debug(f'{"Rewrote" if rewritten else "Kept"} {path}: {fields}')
+            self.stats.add(checked=1, skipped=int(not rewritten), rewritten=int(rewritten))
 
-                with open(func_json, 'r') as f:
-                    data = json.load(f)
+    def b0_field_source_to_json(self, subject: str, sessions: list[str] = None):
+        """
+        Updates the B0 field source in the JSON files for a given subject.
 
-                data["B0FieldSource"] = f"pepolarfmap{sub_num}{ses_num}{fmap_num}"
+        For each functional run of the specified subject, this method updates the JSON file to include the correct B0 field source information.
+        This is necessary for correctly processing the MRI data with respect to field map correction.
+        Files that already hold the right value are left untouched.
 
-                logging.debug(f'B0 field source is: {data["B0FieldSource"]}')
+        Args:
+            subject (str): The name of the subject for which to update the B0 field source.
+            sessions (list[str], optional): The sessions to update. Defaults to all sessions.
+        """
+        logging.info(f'Getting B0 field source for {subject}')
 
-                with open(func_json, 'w') as f:
-                    json.dump(data, f, indent=4)
+        for session in sessions or self.sessions:
+            logging.info(f'\tSession: {session}')
+            self.update_sidecars(self.b0_field_sources(subject, session))
 
-    def b0_field_identifier_to_json(self, subject: str):
+    def b0_field_identifier_to_json(self, subject: str, sessions: list[str] = None):
         """
         Updates the B0 field identifier in the JSON files for a given subject.
 
@@ -130,53 +496,218 @@ class BashScriptGenerator:
 
         Args:
             subject (str): The name of the subject for which to update the B0 field identifier.
+            sessions (list[str], optional): The sessions to update. Defaults to all sessions.
         """
         logging.info(f'Getting B0 field identifier for {subject}')
-        sub_num = self.sub2num[subject]
 
-        for session, ses_num in self.ses2num.items():
+        for session in sessions or self.sessions:
             logging.info(f'\tSession: {session}')
-            dir_fmap = join_or_make(self.dir_bids, subject, session, 'fmap')
-            fmap_jsons = glob(dir_fmap + '/*_epi.json')
+            self.update_sidecars(self.b0_field_identifiers(subject, session))
+
+    def patch_session(self, subject: str, session: str):
+        """
+        Updates the B0 field source and identifier in the JSON files of a single session.
+
+        Sessions whose sidecars still match the manifest entry for the same field values are skipped without opening their files.
+
+        Args:
+            subject (str): The name of the subject.
+            session (str): The session to update.
+        """
+        updates = {
+            **self.b0_field_sources(subject, session),
+            **self.b0_field_identifiers(subject, session)
+        }
+        key = f'{subject}/{session}'
+
+        if self.manifest.is_current(key, updates):
+            logging.debug(f'Sidecars of {key} are up to date')
+            self.stats.add(checked=len(updates), skipped=len(updates))
+            return
+
+        logging.info(f'Patching sidecars of {key}')
+        self.update_sidecars(updates)
+        self.manifest.record(key, updates)
+
+    def patch_sidecars(self):
+        """
+        Updates the B0 field source and identifier in the JSON files of all subjects.
+
+        Every subject/session's `func` and `fmap` sidecars are patched concurrently with `self.jobs` worker threads.
+        Errors are collected and reported per subject once all sidecars have been processed.
+        Only files whose values differ are rewritten (atomically), and the manifest is saved for the next run.
+
+        Raises:
+            RuntimeError: If the sidecars of at least one subject could not be patched.
+        """
+        self.validate_dirs()
+        logging.info(f'Patching JSON sidecars of {len(self.subjects)} subjects with {self.jobs} jobs...')
+        self.stats = PatchStats()
+        tasks = [
+            (subject, (subject, session))
+            for subject in self.subjects
+            for session in self.sessions
+        ]
+        _, errors = run_parallel(self.patch_session, tasks, self.jobs)
+        self.manifest.save()
+        self.sidecar_cache.save()
+        logging.info(f'JSON sidecars: {self.stats}')
+
+        if errors:
+            for subject in sorted(errors):
+                for error in errors[subject]:
+                    logging.error(f'{subject}: {error}')
+
+            raise RuntimeError(f'Could not patch JSON sidecars of {len(errors)} subjects: {sorted(errors)}')
+
+        logging.info('JSON sidecars patched')
+
+    @property
+    def concurrency(self) -> int:
+        """
+        How many fMRIPrep invocations run at the same time on one machine.
+
+        Returns:
+            int: The number of concurrent invocations.
+        """
+        return self.concurrent_jobs or 1
+
+    @property
+    def budget(self) -> dict:
+        """
+        The CPU and memory budget of every fMRIPrep invocation.
+
+        Returns:
+            dict: The budget (see `utils.resources.compute_budget`).
+        """
+        if not hasattr(self, '_budget'):
+            self._budget = compute_budget(
+                self.machine_cpus,
+                self.machine_memory_mb,
+                self.concurrency,
+                self.low_mem_threshold_mb
+            )
+
+            if self.machine_cpus or self.machine_memory_mb:
+                logging.info(f'Budget of {self.concurrency} concurrent fMRIPrep invocations: {self._budget}')
+
+        return self._budget
+
+    def unit_budget(self, unit: str) -> dict:
+        """
+        The CPU and memory budget of the fMRIPrep invocation of a job, the same for every job (see `budget`).
 
-            if len(fmap_jsons) == 0:
-                raise OSError(f'No "*_epi.json" pattern in {dir_fmap}')
+        Args:
+            unit (str): The label of the job (e.g. sub-01 or sub-01_ses-01).
+
+        Returns:
+            dict: The budget (see `utils.resources.compute_budget`).
+        """
+        return self.budget
+
+    def write_bids_filter(self, unit: str) -> str:
+        """
+        Writes the BIDS filter file that restricts a split job to its session.
 
-            logging.debug(f'fmap_jsons are: {fmap_jsons}')
+        Args:
+            unit (str): The label of the job (e.g. sub-01_ses-01).
 
-            for fmap_json in fmap_jsons:
-                fmap_run_num = find_in_string(fmap_json, r'run-(\d+)')
+        Returns:
+            str: The path of the filter file.
+        """
+        _, sessions = self.unit_sessions[unit]
+        path = os.path.join(self.dir_filters, f'{unit}.json')
 
-                with open(fmap_json, 'r') as f:
-                    data = json.load(f)
+        with open(path, 'w') as f:
+            json.dump(session_filter(sessions), f, indent=4)
 
-                data["B0FieldIdentifier"] = f"pepolarfmap{sub_num}{ses_num}{fmap_run_num}"
+        return path
 
-                logging.debug(f'B0 field identifier is: {data["B0FieldIdentifier"]}')
+    def plan(self) -> dict:
+        """
+        Builds the plan report of the cohort, with the estimated CPU-hours and disk footprint per subject and in total.
 
-                with open(fmap_json, 'w') as f:
-                    json.dump(data, f, indent=4)
+        Returns:
+            dict: The plan (see `utils.profiler.cohort_plan`).
+        """
+        self.validate_dirs()
+        return cohort_plan(self.index, {unit: self.unit_sessions[unit] for unit in self.units})
 
-    def generate_bash(self, subject: str) -> str:
+    def generate_bash(self, unit: str) -> str:
         """
         Generates a bash script for a given subject.
 
         This method compiles the necessary commands into a bash script for processing a single subject's MRI data with fMRIPrep.
         It includes setting up the environment, running fMRIPrep with the correct parameters, and any additional processing steps required.
+        With `split_sessions`, the script processes one session of the subject, selected with a BIDS filter file, and reuses the anatomical derivatives of the subject when there are any.
 
         Args:
-            subject (str): The identifier of the subject for which to generate the bash script.
+            unit (str): The label of the job: the subject, or the subject and session with `split_sessions` (e.g. sub-01_ses-01).
 
         Returns:
             str: The generated bash script as a string.
         """
-        logging.debug(f'Generating bash for {subject}')
+        logging.debug(f'Generating bash for {unit}')
+        self.validate_dirs()
+        subject, sessions = self.unit_sessions[unit]
+
+        if self.anat_only:
+            return generate_bash_for_subject(
+                subject,
+                self.dir_bids,
+                self.dir_anat,
+                self.dir_work,
+                self.sub_dir_work[unit],
+                metrics=self.metrics,
+                scratch=self.scratch,
+                budget=self.unit_budget(unit),
+                anat_only=True,
+                templateflow=self.dir_templateflow,
+                stage_image=self.stage_image,
+                trash=self.dir_trash,
+                resume=self.resume_options,
+                label=unit,
+                ledger=self.ledger
+            )
+
+        anat_derivatives = None
+
+        if self.reuse_anat or self.split_sessions:
+            anat_derivatives = self.anat_derivatives(subject)
+
+            if anat_derivatives:
+                logging.info(f'{unit}: reusing anatomical derivatives in {anat_derivatives}')
+            elif self.split_sessions:
+                logging.warning(f'{unit}: no anatomical derivatives of {subject}, every session job computes them (generate the --anat-only stage first to share them)')
+            else:
+                logging.info(f'{unit}: no anatomical derivatives to reuse')
+
+        bids_filter = self.write_bids_filter(unit) if self.split_sessions else None
+        pending, final = stamp_paths(self.dir_stamps, unit)
+        write_pending_stamp(
+            self.dir_stamps,
+            unit,
+            input_fingerprint(self.index, subject, sessions, self.stamp_options(subject, sessions))
+        )
         return generate_bash_for_subject(
             subject,
             self.dir_bids,
             self.dir_deriv,
             self.dir_work,
-            self.sub_dir_work[subject]
+            self.sub_dir_work[unit],
+            metrics=self.metrics,
+            scratch=self.scratch,
+            budget=self.unit_budget(unit),
+            on_success=[f'mv {pending} {final}'],
+            anat_derivatives=anat_derivatives,
+            templateflow=self.dir_templateflow,
+            stage_image=self.stage_image,
+            bids_filter=bids_filter,
+            sessions=sessions if self.split_sessions else None,
+            trash=self.dir_trash,
+            resume=self.resume_options,
+            label=unit,
+            ledger=self.ledger
         )
 
     def __call__(self, subject: str) -> str:
@@ -195,7 +726,7 @@ class BashScriptGenerator:
         self.b0_field_source_to_json(subject)
         self.b0_field_identifier_to_json(subject)
 
-        return self.generate_bash(subject)
+        return ''.join(self.generate_bash(unit) for unit in self.units if self.unit_sessions[unit][0] == subject)
 
     def __iter__(self) -> Generator[str, None, None]:
         """
@@ -203,12 +734,31 @@ class BashScriptGenerator:
 
         This method allows the BashScriptGenerator to be used in a for-loop, yielding the generated bash script for each subject in turn.
         It facilitates batch processing of all subjects in the project.
+        The JSON sidecars of all subjects are patched up front (see `patch_sidecars`), except for the anatomical-only stage which does not read them; the scripts are then rendered in the order of `units`.
 
         Returns:
-            Generator[str, None, None]: A generator that yields bash scripts as strings for each subject.
+            Generator[str, None, None]: A generator that yields bash scripts as strings for each subject (or subject and session with `split_sessions`).
         """
-        for subject in self.subjects:
-            yield self(subject)
+        self.prepare()
+
+        for unit in self.units:
+            yield self.generate_bash(unit)
+
+    def prepare(self):
+        """
+        Sets up the directories and patches the JSON sidecars of all subjects, except for the anatomical-only stage which does not read them.
+        With a ledger, the jobs to render are registered as queued.
+        """
+        if self.anat_only:
+            self.validate_dirs()
+        else:
+            self.patch_sidecars()
+
+        if self.ledger:
+            ledger = Ledger(self.ledger)
+            ledger.register(self.units, self.stage_name)
+            ledger.close()
+            logging.info(f'{len(self.units)} jobs queued in {self.ledger}')
 
     def generate(self) -> str:
         """
@@ -216,11 +766,25 @@ class BashScriptGenerator:
 
         This method compiles the bash scripts for all subjects into a single string, each script separated by the bash kernel.
         It is useful for creating a comprehensive script for batch processing.
+        The script exits with 1 if any subject failed.
 
         Returns:
             str: A string containing all generated bash scripts for the project, concatenated together.
         """
-        return self.kernel + ''.join([bash_str for bash_str in self])
+        return self.kernel + ''.join([bash_str for bash_str in self]) + 'exit $failed\n'
+
+    def stream(self) -> Generator[tuple[str, str], None, None]:
+        """
+        Yields the bash script of every subject as soon as it is rendered, prefixed with the bash kernel.
+        Every script exits with the exit status of fMRIPrep.
+
+        Returns:
+            Generator[tuple[str, str], None, None]: The label (see `units`) and bash script of every subject.
+        """
+        self.prepare()
+
+        for unit in self.units:
+            yield unit, self.kernel + self.generate_bash(unit) + 'exit $fmriprep_status\n'
 
 
 class BashSequenceGenerator(BashScriptGenerator):
@@ -237,4 +801,500 @@ class BashSequenceGenerator(BashScriptGenerator):
         Returns:
             list[str]: A list of strings, each representing a bash script for a subject in the project.
         """
-        return [self.kernel + bash_str for bash_str in self]
\ No newline at end of file
+        return [script for _, script in self.stream()]
+
+
+class BashGroupsGenerator(BashScriptGenerator):
+    """
+    A class for generating one bash script per group of participants for fMRI preprocessing.
+    """
+    def __init__(self, args: argparse.Namespace):
+        """
+        Initializes the BashGroupsGenerator object.
+
+        Args:
+            args (argparse.Namespace): Command line arguments as for `BashScriptGenerator`, plus:
+                - group_size (int): How many participants per group.
+                - balance (bool, optional): Balance the groups by estimated runtime instead of slicing the sorted subjects. Defaults to False.
+                - n_groups (int, optional): The number of balanced groups. Defaults to as many as `group_size` implies.
+                - parallel_subjects (int, optional): How many subjects of a group run concurrently. Defaults to 1 (one after another).
+                - batch (bool, optional): Run every group as a single fMRIPrep invocation with a shared working directory (see `generate_batch`). Defaults to False.
+        """
+        super().__init__(args)
+        self.group_size = args.group_size
+        self.balance = getattr(args, 'balance', False)
+        self.n_groups = getattr(args, 'n_groups', None)
+        self.parallel_subjects = getattr(args, 'parallel_subjects', 1) or 1
+        self.batch = getattr(args, 'batch', False)
+
+        if self.batch and self.split_sessions and not self.anat_only:
+            logging.warning('--batch passes whole subjects to fMRIPrep, it has no effect with --split-sessions')
+            self.batch = False
+
+        if self.batch and self.scratch:
+            logging.warning('--batch runs on the project share, --scratch is ignored')
+
+        if self.batch and self.parallel_subjects > 1:
+            logging.warning('--batch runs the subjects of a group in one invocation, --parallel-subjects is ignored')
+            self.parallel_subjects = 1
+
+    @property
+    def groups(self) -> list[list[str]]:
+        """
+        The subjects of every group, either in fixed-size slices or balanced by estimated runtime.
+
+        Returns:
+            list[list[str]]: The subjects of every group.
+        """
+        self.validate_dirs()
+
+        if not hasattr(self, '_groups'):
+            if self.balance:
+                self._groups = self.balanced_groups()
+            else:
+                self._groups = self.split_list(self.units)
+
+        return self._groups
+
+    @property
+    def group_names(self) -> list[str]:
+        """
+        The name of every group (see `utils.parse.group_name`), numbered when balanced groups of per-session jobs would share one.
+
+        Returns:
+            list[str]: The name of every group.
+        """
+        names = [group_name(group) for group in self.groups]
+        return [name if names.count(name) == 1 else f'{name}_{i + 1}' for i, name in enumerate(names)]
+
+    @property
+    def concurrency(self) -> int:
+        """
+        How many fMRIPrep invocations run at the same time on one machine, by default one per group (times the subjects running concurrently in a group).
+        A batched group is a single invocation.
+
+        Returns:
+            int: The number of concurrent invocations.
+        """
+        per_group = 1 if self.batch else min(self.parallel_subjects, max((len(group) for group in self.groups), default=1))
+        return self.concurrent_jobs or len(self.groups) * per_group
+
+    def balanced_groups(self) -> list[list[str]]:
+        """
+        Assigns the subjects to groups with a longest-processing-time heuristic on their estimated CPU-hours, profiled from the NIfTI headers of their images (see `utils.profiler`), and logs the predicted load of every group.
+
+        Returns:
+            list[list[str]]: The subjects of every group.
+        """
+        self.validate_dirs()
+        n_groups = self.n_groups or -(-len(self.units) // self.group_size)
+        costs = {
+            unit: subject_plan(unit, profile_subject(self.index, *self.unit_sessions[unit]))['cpu_hours']
+            for unit in self.units
+        }
+        groups = balance_groups(costs, n_groups)
+
+        for group in groups:
+            logging.info(f'Group {group_name(group)}: {len(group)} subjects, predicted load {sum(costs[s] for s in group):.1f} CPU-h')
+
+        logging.info(f'Predicted load of the most loaded group: {max(sum(costs[s] for s in group) for group in groups):.1f} CPU-h')
+        return groups
+
+    def plan(self) -> dict:
+        """
+        Builds the plan report of the cohort, with the estimated CPU-hours and disk footprint per subject, per group and in total.
+
+        Returns:
+            dict: The plan (see `utils.profiler.cohort_plan`).
+        """
+        self.validate_dirs()
+        return cohort_plan(
+            self.index,
+            {unit: self.unit_sessions[unit] for unit in self.units},
+            dict(zip(self.group_names, self.groups)),
+            self.parallel_subjects
+        )
+
+    def generate(self) -> list[str]:
+        '''
+        Generates bash script for every group of participants based on group size input
+
+        Returns:
+            list[str]: A list of bash script for every group of participants
+        '''
+        return [script for _, script in self.stream()]
+
+    def stream(self) -> Generator[tuple[str, str], None, None]:
+        """
+        Yields the bash script of every group as soon as it is rendered, prefixed with the bash kernel.
+        Every script exits with 1 if any subject of the group failed.
+
+        Returns:
+            Generator[tuple[str, str], None, None]: The name (see `group_names`) and bash script of every group.
+        """
+        self.validate_dirs()
+        self.prepare()
+
+        for group, name in zip(self.groups, self.group_names):
+            if self.batch:
+                yield name, self.kernel + self.generate_batch(group, name) + 'exit $failed\n'
+                continue
+
+            blocks = {unit: self.generate_bash(unit) for unit in group}
+
+            if self.parallel_subjects > 1:
+                script = concurrent_blocks(blocks, os.path.join(self.dir_work, 'group_logs', name), self.parallel_subjects)
+            else:
+                script = ''.join(blocks.values()) + 'exit $failed\n'
+
+            yield name, self.kernel + script
+
+    def generate_batch(self, group: list[str], name: str) -> str:
+        """
+        Generates the bash script running a group of subjects as a single fMRIPrep invocation.
+
+        The subjects share the working directory `fmriprep_wf/batch_<name>`, and fMRIPrep interleaves their nodes on the cores of the invocation.
+        Every subject still gets its own stamp, ledger record and failure report (see `utils.bash.generate_bash_for_batch`).
+        With `instrument`, the invocation is recorded under the group name in `metrics/fmriprep_batches.jsonl`, apart from the per-subject records of `fmriprep_runs.jsonl`.
+        Anatomical derivatives are only reused when all subjects of the group have them in the same directory, as fMRIPrep takes a single `--anat-derivatives`.
+
+        Args:
+            group (list[str]): The subjects of the group.
+            name (str): The name of the group.
+
+        Returns:
+            str: The generated bash script.
+        """
+        logging.debug(f'Generating batched bash for {name}')
+        self.validate_dirs()
+        dir_batch_work = os.path.join(self.dir_work, 'fmriprep_wf', f'batch_{name}')
+        metrics = os.path.join(os.path.dirname(self.metrics), 'fmriprep_batches.jsonl') if self.metrics else None
+
+        if self.anat_only:
+            return generate_bash_for_batch(
+                name,
+                group,
+                self.dir_bids,
+                self.dir_anat,
+                self.dir_work,
+                dir_batch_work,
+                metrics=metrics,
+                budget=self.budget,
+                anat_only=True,
+                templateflow=self.dir_templateflow,
+                stage_image=self.stage_image,
+                trash=self.dir_trash,
+                resume=self.resume_options,
+                ledger=self.ledger
+            )
+
+        anat_derivatives = None
+
+        if self.reuse_anat:
+            found = {self.anat_derivatives(subject) for subject in group}
+
+            if len(found) == 1 and None not in found:
+                anat_derivatives = found.pop()
+                logging.info(f'{name}: reusing anatomical derivatives in {anat_derivatives}')
+            else:
+                logging.info(f'{name}: the subjects do not all have anatomical derivatives in one directory, none are reused')
+
+        on_success = {}
+
+        for unit in group:
+            subject, sessions = self.unit_sessions[unit]
+            pending, final = stamp_paths(self.dir_stamps, unit)
+            write_pending_stamp(
+                self.dir_stamps,
+                unit,
+                input_fingerprint(self.index, subject, sessions, self.stamp_options(subject, sessions))
+            )
+            on_success[unit] = [f'mv {pending} {final}']
+
+        return generate_bash_for_batch(
+            name,
+            group,
+            self.dir_bids,
+            self.dir_deriv,
+            self.dir_work,
+            dir_batch_work,
+            metrics=metrics,
+            budget=self.budget,
+            on_success=on_success,
+            anat_derivatives=anat_derivatives,
+            templateflow=self.dir_templateflow,
+            stage_image=self.stage_image,
+            trash=self.dir_trash,
+            resume=self.resume_options,
+            ledger=self.ledger
+        )
+
+    def split_list(self, lst: list[str]) -> list[list[str]]:
+        return [lst[i:i+self.group_size] for i in range(0, len(lst), self.group_size)]
+
+
+class CondorGenerator(BashGroupsGenerator):
+    """
+    A class for generating per-subject bash scripts together with an HTCondor submit description or DAG.
+
+    Every subject becomes one Condor job whose `request_cpus`, `request_memory` and `request_disk` are estimated from its input data.
+    fMRIPrep gets the same CPUs and memory as `--nthreads`, `--omp-nthreads` and `--mem-mb`, so it stays within its slot.
+    The DAG runs the subjects of a group in sequence and the groups side by side.
+    """
+    def job_resources(self, unit: str) -> Dict[str, int]:
+        """
+        Estimates the resources of the Condor job of a subject once (see `utils.cost.estimate_subject_resources`).
+
+        Args:
+            unit (str): The label of the job (e.g. sub-01 or sub-01_ses-01).
+
+        Returns:
+            Dict[str, int]: The `cpus`, `memory_mb` and `disk_mb` of the job.
+        """
+        if not hasattr(self, '_resources'):
+            self._resources = {}
+
+        if unit not in self._resources:
+            self._resources[unit] = estimate_subject_resources(self.index, *self.unit_sessions[unit])
+
+        return self._resources[unit]
+
+    def unit_budget(self, unit: str) -> dict:
+        """
+        The CPU and memory budget of the fMRIPrep invocation of a subject: the slot its Condor job requests.
+
+        Args:
+            unit (str): The label of the job (e.g. sub-01 or sub-01_ses-01).
+
+        Returns:
+            dict: The budget (see `utils.resources.compute_budget`).
+        """
+        resources = self.job_resources(unit)
+        return compute_budget(resources['cpus'], resources['memory_mb'], 1, self.low_mem_threshold_mb)
+
+    def generate(self) -> list[str]:
+        """
+        Generates the bash script of every subject, each prefixed with the bash kernel.
+
+        Returns:
+            list[str]: A list of strings, each representing a bash script for a subject in the project.
+        """
+        return [script for _, script in self.stream()]
+
+    def stream(self) -> Generator[tuple[str, str], None, None]:
+        """
+        Yields the bash script of every subject as soon as it is rendered, prefixed with the bash kernel.
+
+        Returns:
+            Generator[tuple[str, str], None, None]: The label (see `units`) and bash script of every subject.
+        """
+        yield from BashScriptGenerator.stream(self)
+
+    def condor_jobs(self, scripts: Dict[str, str]) -> Dict[str, Dict[str, str]]:
+        """
+        Builds the Condor job of every subject.
+
+        Args:
+            scripts (Dict[str, str]): The path of the bash script of every subject.
+
+        Returns:
+            Dict[str, Dict[str, str]]: The subject, script and resource requests of every subject's job.
+        """
+        self.validate_dirs()
+        return {
+            unit: {
+                'subject': unit,
+                'script': scripts[unit],
+                **self.job_resources(unit)
+            }
+            for unit in self.units
+        }
+
+    def submit_description(self, scripts: Dict[str, str], queue: bool = True) -> str:
+        """
+        Generates the submit description queuing one job per subject.
+
+        Args:
+            scripts (Dict[str, str]): The path of the bash script of every subject.
+            queue (bool, optional): Whether to queue the jobs in the description, or leave that to a DAG. Defaults to True.
+
+        Returns:
+            str: The submit description.
+        """
+        return render_submit(list(self.condor_jobs(scripts).values()), self.dir_condor_log, queue)
+
+    def dag_description(self, scripts: Dict[str, str], submit_path: str) -> str:
+        """
+        Generates a DAG that runs the subjects of every group in sequence.
+
+        Args:
+            scripts (Dict[str, str]): The path of the bash script of every subject.
+            submit_path (str): The path of the node submit description (see `submit_description` with `queue=False`).
+
+        Returns:
+            str: The DAG description.
+        """
+        jobs = self.condor_jobs(scripts)
+        return render_dag([[jobs[subject] for subject in group] for group in self.groups], submit_path)
+
+
+class BashWorkerGenerator(BashScriptGenerator):
+    """
+    A class for generating one worker script that every node sharing the project runs.
+
+    The workers claim the jobs one at a time through lock files in `fmriprep_work/claims` (see `utils.bash.claim_worker`), so nodes that run out of work take over the remaining jobs, and jobs of dead workers are taken over once their claim expires.
+    With a shard, the worker tries the jobs of its own shard first.
+    """
+    def __init__(self, args: argparse.Namespace):
+        """
+        Initializes the BashWorkerGenerator object.
+
+        Args:
+            args (argparse.Namespace): Command line arguments as for `BashScriptGenerator`, plus:
+                - claim_ttl (int, optional): Seconds without a heartbeat after which the claim of a job expires. Defaults to 900.
+        """
+        super().__init__(args)
+        self.claim_ttl = getattr(args, 'claim_ttl', 900)
+
+    def apply_shard(self, shards: Dict[str, int]):
+        """
+        Orders the jobs by shard, starting with the generator's, instead of leaving out the other shards.
+
+        Args:
+            shards (Dict[str, int]): The shard of every requested job (see `utils.shard.assign_shards`).
+        """
+        index, count = self.shard
+        self.units = shard_order(self.units, shards, index, count)
+        logging.info(f'Shard {index}/{count}: {sum(shards[unit] == index for unit in self.units)} of {len(self.units)} jobs first')
+
+    def stream(self) -> Generator[tuple[str, str], None, None]:
+        """
+        Yields the worker script, prefixed with the bash kernel.
+
+        Returns:
+            Generator[tuple[str, str], None, None]: The name ('worker', or 'worker_<i>' with a shard) and bash script of the worker.
+        """
+        self.validate_dirs()
+        self.prepare()
+        dir_claims = join_or_make(self.dir_work, 'claims', self.stage_name)
+
+        # the jobs to run again must not look finished to the workers
+        for unit in self.units:
+            for result in (f'{unit}.done', f'{unit}.failed'):
+                if os.path.exists(os.path.join(dir_claims, result)):
+                    os.remove(os.path.join(dir_claims, result))
+
+        blocks = {unit: self.generate_bash(unit) for unit in self.units}
+        name = f'worker_{self.shard[0]}' if self.shard else 'worker'
+        yield name, self.kernel + claim_worker(blocks, dir_claims, self.claim_ttl)
+
+
+class BashWatchGenerator(BashScriptGenerator):
+    """
+    A class for generating the scripts of subjects as their data arrive, for a long-running watcher.
+
+    The watcher starts without subjects; every `poll` refreshes the BIDS index and returns the requested subjects whose functional and field map data are complete and have not been written to for the quiet period (see `utils.watch`).
+    `enqueue` then patches their sidecars and renders their scripts like the other generators, skipping subjects whose derivatives are up to date.
+    A subject is enqueued again only when its files change afterwards, e.g. when a session is added.
+    The watch state is kept in `fmriprep_work/watch_state.json`.
+    """
+    def __init__(self, args: argparse.Namespace):
+        """
+        Initializes the BashWatchGenerator object.
+
+        Args:
+            args (argparse.Namespace): Command line arguments as for `BashScriptGenerator`, plus:
+                - quiet_period (float, optional): Seconds without writes after which the data of a subject count as stable. Defaults to 600.
+        """
+        super().__init__(args)
+        self.quiet_period = getattr(args, 'quiet_period', 600)
+
+        # the shards are dealt from the jobs known up front, which grow as the data arrive
+        if self.shard:
+            logging.warning('--shard has no effect when watching, give every watcher its own subjects instead')
+            self.shard = None
+
+    def setup_dirs(self):
+        """
+        Sets up the directories (see `BashScriptGenerator.setup_dirs`) and loads the watch state.
+        """
+        super().setup_dirs()
+        self.tracker = StabilityTracker(self.quiet_period, os.path.join(self.dir_work, 'watch_state.json'))
+
+    def resolve_subjects(self):
+        """
+        Starts without subjects, they are added by `enqueue` once their data are stable.
+        """
+        self.subjects, self.unit_sessions, self.units = [], {}, []
+
+    def select_subjects(self):
+        """
+        Leaves out the subjects whose derivatives are up to date, see `BashScriptGenerator.select_subjects`.
+        """
+        if self.units:
+            super().select_subjects()
+
+    def poll(self, now: float = None) -> List[str]:
+        """
+        Refreshes the BIDS index and finds the subjects that are ready to be processed.
+
+        Args:
+            now (float, optional): The current time. Defaults to None (time.time()).
+
+        Returns:
+            List[str]: The requested subjects whose data are complete and stable, and changed since they were last enqueued.
+        """
+        self.validate_dirs()
+        now = time.time() if now is None else now
+        self.index.refresh()
+        self.index.save()
+        ready = []
+
+        for subject in self.index.subjects():
+            if subject not in self.subject_set:
+                continue
+
+            reason, snapshot, newest = subject_snapshot(self.index, subject, self.sessions)
+
+            if self.tracker.is_enqueued(subject, snapshot):
+                continue
+
+            if reason:
+                logging.debug(f'Waiting for {subject}: {reason}')
+                self.tracker.forget(subject)
+            elif self.tracker.update(subject, snapshot, newest, now):
+                ready.append(subject)
+            else:
+                logging.debug(f'Waiting for {subject}: written within the last {self.quiet_period} s')
+
+        self.tracker.save()
+        return ready
+
+    def enqueue(self, subject: str) -> List[tuple[str, str]]:
+        """
+        Patches the sidecars of a ready subject and renders its scripts.
+
+        The subject is recorded with the snapshot of its files after patching, so the rewritten sidecars do not make it look changed; a subject whose sidecars cannot be patched is retried once its files change.
+
+        Args:
+            subject (str): The subject (see `poll`).
+
+        Returns:
+            List[tuple[str, str]]: The label (see `units`) and bash script of every job of the subject, none if its derivatives are up to date.
+
+        Raises:
+            RuntimeError: If the sidecars of the subject could not be patched.
+        """
+        self.validate_dirs()
+        self.subjects = [subject]
+        self.sub2num = {subject: find_in_string(subject, r'sub-(\d+)')}
+        self.unit_sessions = self.split_units()
+        self.units = list(self.unit_sessions)
+        self.sub_dir_work = {unit: self.unit_work_dir(unit) for unit in self.units}
+
+        try:
+            self.select_subjects()
+            return list(self.stream()) if self.units else []
+        finally:
+            self.tracker.mark_enqueued(subject, subject_snapshot(self.index, subject, self.sessions)[1])
+            self.tracker.save()
@@ -0,0 +1,273 @@
+from dataclasses import dataclass, field
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+
+CACHE_VERSION = 1
+
+
+@dataclass(frozen=True)
+class BidsFile:
+    """
+    A file in a BIDS dataset together with the entities parsed from its name.
+
+    Attributes:
+        path (str): The absolute path of the file.
+        subject (str): The subject label (e.g. sub-01).
+        session (Optional[str]): The session label (e.g. ses-01), or None for datasets without sessions.
+        datatype (str): The datatype directory the file lives in (e.g. func, fmap, anat).
+        suffix (str): The BIDS suffix (e.g. bold, epi, T1w).
+        extension (str): The file extension including the leading dot (e.g. .json, .nii.gz).
+        entities (Dict[str, str]): The key-value entities of the file name (e.g. {'task': 'rest', 'run': '01'}).
+    """
+    path: str
+    subject: str
+    session: Optional[str]
+    datatype: str
+    suffix: str
+    extension: str
+    entities: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def run(self) -> Optional[str]:
+        return self.entities.get('run')
+
+    @property
+    def task(self) -> Optional[str]:
+        return self.entities.get('task')
+
+    @property
+    def dir(self) -> Optional[str]:
+        return self.entities.get('dir')
+
+
+def parse_entities(filename: str) -> tuple[Dict[str, str], str, str]:
+    """
+    Parse the entities, suffix and extension of a BIDS file name.
+
+    Args:
+        filename (str): The file name (e.g. sub-01_ses-01_task-rest_run-01_bold.nii.gz).
+
+    Returns:
+        tuple[Dict[str, str], str, str]: The entities, the suffix and the extension.
+    """
+    stem, dot, extension = filename.partition('.')
+    *parts, suffix = stem.split('_')
+
+    if '-' in suffix:
+        parts.append(suffix)
+        suffix = ''
+
+    entities = dict(part.partition('-')[::2] for part in parts)
+    return entities, suffix, dot + extension
+
+
+def session_filter(sessions: List[str]) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Build an fMRIPrep BIDS filter that restricts the functional data and field maps to some sessions.
+
+    The anatomical queries are left alone, so the anatomical workflow still sees the T1w images of all sessions.
+
+    Args:
+        sessions (List[str]): The session labels (e.g. ['ses-01']).
+
+    Returns:
+        Dict[str, Dict[str, List[str]]]: The filter, to be written to the file passed with `--bids-filter-file`.
+    """
+    labels = [session.split('-', 1)[1] for session in sessions]
+    return {query: {'session': labels} for query in ('bold', 'sbref', 'fmap')}
+
+
+class BidsIndex:
+    """
+    A single-pass index of a BIDS dataset with a persistent on-disk cache.
+
+    The dataset is walked once with `os.scandir` and organised as subject -> session -> datatype -> files.
+    The listing of every visited directory is cached together with its modification time, so a refresh only rescans the directories that changed since the cache was written.
+    """
+    def __init__(self, dir_bids: str, cache_path: str = None):
+        """
+        Initializes the BidsIndex and loads the cache if there is one.
+
+        Args:
+            dir_bids (str): The root of the BIDS dataset.
+            cache_path (str, optional): Where to persist the index. Defaults to None (no cache).
+        """
+        self.dir_bids = dir_bids
+        self.cache_path = cache_path
+        self._dirs = {}
+        self.table = {}
+        self.rescanned = 0
+        self.load()
+
+    def load(self):
+        """
+        Loads the cached directory listings, ignoring caches that are unreadable or were built for another dataset.
+        """
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+
+        try:
+            with open(self.cache_path, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f'Ignoring unreadable BIDS index cache {self.cache_path}: {e}')
+            return
+
+        if cache.get('version') == CACHE_VERSION and cache.get('dir_bids') == self.dir_bids:
+            self._dirs = cache['dirs']
+
+    def save(self):
+        """
+        Writes the directory listings to the cache file.
+        """
+        if not self.cache_path:
+            return
+
+        tmp_path = f'{self.cache_path}.tmp'
+
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'dir_bids': self.dir_bids, 'dirs': self._dirs}, f)
+
+        os.replace(tmp_path, self.cache_path)
+        logging.debug(f'BIDS index written to {self.cache_path}')
+
+    def _listdir(self, rel: str, dirs: dict) -> dict:
+        """
+        Returns the listing of a directory, from the cache if its modification time did not change.
+
+        Args:
+            rel (str): The directory path relative to the dataset root.
+            dirs (dict): The listings visited during the current refresh.
+
+        Returns:
+            dict: The listing with the sorted `dirs` and `files` of the directory.
+        """
+        path = os.path.join(self.dir_bids, rel)
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._dirs.get(rel)
+
+        if cached is None or cached['mtime'] != mtime:
+            subdirs, files = [], []
+
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.name.startswith('.'):
+                        continue
+
+                    (subdirs if entry.is_dir() else files).append(entry.name)
+
+            # a directory modified within the mtime granularity of the scan may change again unnoticed
+            racy = time.time_ns() - mtime < 2 * 10 ** 9
+            cached = {'mtime': None if racy else mtime, 'dirs': sorted(subdirs), 'files': sorted(files)}
+            self.rescanned += 1
+
+        dirs[rel] = cached
+        return cached
+
+    def refresh(self) -> 'BidsIndex':
+        """
+        Brings the index up to date with the dataset, rescanning only the directories that changed.
+
+        Returns:
+            BidsIndex: The index itself.
+        """
+        dirs = {}
+        table = {}
+        self.rescanned = 0
+
+        for subject in self._listdir('', dirs)['dirs']:
+            if not subject.startswith('sub-'):
+                continue
+
+            sub_listing = self._listdir(subject, dirs)
+            sessions = [s for s in sub_listing['dirs'] if s.startswith('ses-')]
+            containers = [(session, os.path.join(subject, session)) for session in sessions] or [(None, subject)]
+
+            for session, rel_ses in containers:
+                ses_table = table.setdefault(subject, {}).setdefault(session, {})
+                datatypes = self._listdir(rel_ses, dirs)['dirs'] if session else sub_listing['dirs']
+
+                for datatype in datatypes:
+                    rel_dt = os.path.join(rel_ses, datatype)
+                    ses_table[datatype] = [
+                        BidsFile(
+                            os.path.join(self.dir_bids, rel_dt, filename),
+                            subject,
+                            session,
+                            datatype,
+                            suffix,
+                            extension,
+                            entities
+                        )
+                        for filename in self._listdir(rel_dt, dirs)['files']
+                        for entities, suffix, extension in [parse_entities(filename)]
+                    ]
+
+        self._dirs = dirs
+        self.table = table
+        logging.debug(f'BIDS index refreshed, {self.rescanned} of {len(dirs)} directories rescanned')
+        return self
+
+    def subjects(self) -> List[str]:
+        """
+        Returns:
+            List[str]: The sorted subjects present in the dataset.
+        """
+        return sorted(self.table)
+
+    def sessions(self, subject: str) -> List[Optional[str]]:
+        """
+        Args:
+            subject (str): The subject label.
+
+        Returns:
+            List[Optional[str]]: The sorted sessions of the subject.
+        """
+        return sorted(self.table.get(subject, {}), key=lambda s: s or '')
+
+    def get(
+        self,
+        subject: str,
+        session: Optional[str] = None,
+        datatype: Optional[str] = None,
+        suffix: Optional[str] = None,
+        extension: Optional[str] = None,
+        **entities: str
+    ) -> List[BidsFile]:
+        """
+        Queries the files of a subject.
+
+        Args:
+            subject (str): The subject label.
+            session (Optional[str], optional): The session label. Defaults to None (all sessions).
+            datatype (Optional[str], optional): The datatype. Defaults to None (all datatypes).
+            suffix (Optional[str], optional): The BIDS suffix. Defaults to None (any suffix).
+            extension (Optional[str], optional): The file extension. Defaults to None (any extension).
+            **entities (str): Entities the files must have (e.g. run='01').
+
+        Returns:
+            List[BidsFile]: The matching files, sorted by path.
+        """
+        sessions = self.table.get(subject, {})
+        out = []
+
+        for ses, datatypes in sessions.items():
+            if session is not None and ses != session:
+                continue
+
+            for dt, files in datatypes.items():
+                if datatype is not None and dt != datatype:
+                    continue
+
+                out.extend(
+                    f for f in files
+                    if (suffix is None or f.suffix == suffix)
+                    and (extension is None or f.extension == extension)
+                    and all(f.entities.get(k) == v for k, v in entities.items())
+                )
+
+        return sorted(out, key=lambda f: f.path)
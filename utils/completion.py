@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+from typing import List, Optional
+
+from utils.bids import BidsIndex
+from utils.cost import bold_runs
+from utils.sidecars import file_digest
+
+
+def input_fingerprint(index: BidsIndex, subject: str, sessions: List[str], options: str) -> str:
+    """
+    Fingerprint the inputs of a subject together with the fMRIPrep options.
+
+    NIfTI and other binary files contribute their path, size and modification time; JSON sidecars contribute their content, so that rewriting a sidecar with the same values does not change the fingerprint.
+
+    Args:
+        index (BidsIndex): The BIDS index.
+        subject (str): The subject.
+        sessions (List[str]): The sessions to consider.
+        options (str): The fMRIPrep image and options that affect the outputs.
+
+    Returns:
+        str: The hexadecimal fingerprint.
+
+    """
+    h = hashlib.sha256(options.encode())
+
+    for session in sessions:
+        for f in index.get(subject, session):
+            if f.extension == '.json':
+                h.update(f'{f.path}:{file_digest(f.path)}\n'.encode())
+            else:
+                st = os.stat(f.path)
+                h.update(f'{f.path}:{st.st_size}:{st.st_mtime_ns}\n'.encode())
+
+    return h.hexdigest()
+
+
+def output_dir(dir_deriv: str, subject: str) -> Optional[str]:
+    """
+    Find the fMRIPrep output directory holding the report of a subject.
+
+    Both `<dir_deriv>/fmriprep` and `<dir_deriv>` itself (fMRIPrep's BIDS output layout) are searched.
+
+    Args:
+        dir_deriv (str): The derivatives directory.
+        subject (str): The subject.
+
+    Returns:
+        Optional[str]: The output directory, or None if there is no report.
+
+    """
+    for candidate in (os.path.join(dir_deriv, 'fmriprep'), dir_deriv):
+        if os.path.exists(os.path.join(candidate, f'{subject}.html')):
+            return candidate
+
+    return None
+
+
+def missing_outputs(index: BidsIndex, dir_deriv: str, subject: str, sessions: List[str]) -> List[str]:
+    """
+    List what is missing from the fMRIPrep outputs of a subject: the HTML report and a preprocessed BOLD file for every run.
+
+    Args:
+        index (BidsIndex): The BIDS index.
+        dir_deriv (str): The derivatives directory.
+        subject (str): The subject.
+        sessions (List[str]): The sessions to check.
+
+    Returns:
+        List[str]: A description of every missing output, empty if the outputs are complete.
+
+    """
+    dir_out = output_dir(dir_deriv, subject)
+
+    if dir_out is None:
+        return [f'{subject}.html']
+
+    missing = []
+    listings = {}
+
+    for run in bold_runs(index, subject, sessions):
+        dir_func = os.path.join(dir_out, subject, run.session or '', 'func')
+
+        if dir_func not in listings:
+            listings[dir_func] = os.listdir(dir_func) if os.path.isdir(dir_func) else []
+
+        prefix = os.path.basename(run.path).split('_bold')[0] + '_'
+
+        if not any(name.startswith(prefix) and name.endswith('desc-preproc_bold.nii.gz') for name in listings[dir_func]):
+            missing.append(f'{prefix}*desc-preproc_bold.nii.gz')
+
+    return missing
+
+
+def stamp_paths(dir_stamps: str, subject: str) -> tuple[str, str]:
+    """
+    Get the paths of the stamp of a subject, as written when its script is generated and once it succeeded.
+
+    Args:
+        dir_stamps (str): The directory of the stamps.
+        subject (str): The subject.
+
+    Returns:
+        tuple[str, str]: The pending and the final stamp path.
+
+    """
+    return os.path.join(dir_stamps, f'{subject}.pending.json'), os.path.join(dir_stamps, f'{subject}.json')
+
+
+def write_pending_stamp(dir_stamps: str, subject: str, fingerprint: str):
+    """
+    Write the stamp that the generated script promotes to the final stamp when fMRIPrep succeeds.
+
+    Args:
+        dir_stamps (str): The directory of the stamps.
+        subject (str): The subject.
+        fingerprint (str): The input fingerprint of the subject.
+    """
+    pending, _ = stamp_paths(dir_stamps, subject)
+
+    with open(pending, 'w') as f:
+        json.dump({'subject': subject, 'fingerprint': fingerprint}, f)
+
+
+def completion_status(
+    index: BidsIndex,
+    dir_deriv: str,
+    dir_stamps: str,
+    subject: str,
+    sessions: List[str],
+    options: str,
+    stamp: Optional[str] = None
+) -> Optional[str]:
+    """
+    Check whether a subject's derivatives are complete and were computed from its current inputs and options.
+
+    Args:
+        index (BidsIndex): The BIDS index.
+        dir_deriv (str): The derivatives directory.
+        dir_stamps (str): The directory of the stamps.
+        subject (str): The subject.
+        sessions (List[str]): The sessions to check.
+        options (str): The fMRIPrep image and options that affect the outputs.
+        stamp (Optional[str], optional): The name of the stamp (e.g. sub-01_ses-01 for a job of one session). Defaults to the subject.
+
+    Returns:
+        Optional[str]: None if the subject is up to date, otherwise the reason it has to be processed.
+
+    """
+    missing = missing_outputs(index, dir_deriv, subject, sessions)
+
+    if missing:
+        return f'missing {len(missing)} outputs (e.g. {missing[0]})'
+
+    _, stamp_path = stamp_paths(dir_stamps, stamp or subject)
+
+    if not os.path.exists(stamp_path):
+        return 'no stamp of a successful run'
+
+    with open(stamp_path, 'r') as f:
+        recorded = json.load(f).get('fingerprint')
+
+    if recorded != input_fingerprint(index, subject, sessions, options):
+        return 'inputs or options changed'
+
+    return None
@@ -0,0 +1,221 @@
+import re
+import shlex
+from typing import Dict, List, Tuple
+
+
+SUBMIT_KEYS = ('executable', 'request_cpus', 'request_memory', 'request_disk', 'log', 'output', 'error')
+
+
+def render_submit(jobs: List[Dict[str, str]], dir_log: str, queue: bool = True) -> str:
+    """
+    Render an HTCondor submit description for fMRIPrep jobs.
+
+    Every job is a dictionary with the `subject`, `script`, `cpus`, `memory_mb` and `disk_mb` of one subject.
+    With `queue`, the jobs are listed in a single `queue ... from` statement; without it, the description expects the same macros from a DAG `VARS` line.
+
+    Args:
+        jobs (List[Dict[str, str]]): The jobs to queue.
+        dir_log (str): The directory for the job logs.
+        queue (bool, optional): Whether to queue the jobs in the description itself. Defaults to True.
+
+    Returns:
+        str: The submit description.
+
+    """
+    out = 'universe = vanilla\n' +\
+        'getenv = True\n' +\
+        'executable = $(script)\n' +\
+        'request_cpus = $(cpus)\n' +\
+        'request_memory = $(memory_mb)M\n' +\
+        'request_disk = $(disk_mb)M\n' +\
+        f'log = {dir_log}/fmriprep.log\n' +\
+        f'output = {dir_log}/$(subject).out\n' +\
+        f'error = {dir_log}/$(subject).err\n\n'
+
+    if not queue:
+        return out + 'queue\n'
+
+    rows = ''.join(
+        f'    {job["subject"]}, {job["script"]}, {job["cpus"]}, {job["memory_mb"]}, {job["disk_mb"]}\n'
+        for job in jobs
+    )
+    return out + f'queue subject, script, cpus, memory_mb, disk_mb from (\n{rows})\n'
+
+
+def render_dag(groups: List[List[Dict[str, str]]], submit_path: str) -> str:
+    """
+    Render a DAGMan file that runs the jobs of every group in sequence and the groups side by side.
+
+    Args:
+        groups (List[List[Dict[str, str]]]): The jobs of every group, in execution order.
+        submit_path (str): The submit description shared by all nodes (see `render_submit` with `queue=False`).
+
+    Returns:
+        str: The DAG description.
+
+    """
+    out = ''
+
+    for group in groups:
+        for job in group:
+            node = job['subject']
+            out += f'JOB {node} {submit_path}\n'
+            out += f'VARS {node} ' + ' '.join(
+                f'{key}="{job[key]}"' for key in ('subject', 'script', 'cpus', 'memory_mb', 'disk_mb')
+            ) + '\n'
+
+    for group in groups:
+        for parent, child in zip(group, group[1:]):
+            out += f'PARENT {parent["subject"]} CHILD {child["subject"]}\n'
+
+    return out
+
+
+def _expand(value: str, macros: Dict[str, str]) -> str:
+    return re.sub(r'\$\((\w+)\)', lambda m: macros.get(m.group(1), m.group(0)), value)
+
+
+def parse_submit(text: str, macros: Dict[str, str] = None) -> List[Dict[str, str]]:
+    """
+    Expand a submit description into the job ads it would queue, without a Condor pool.
+
+    Supports the `key = value` commands, the plain `queue [N]` statement and `queue <vars> from ( ... )`.
+    Macros (`$(name)`) are substituted from the queue variables and `macros` (e.g. the VARS of a DAG node).
+
+    Args:
+        text (str): The submit description.
+        macros (Dict[str, str], optional): Extra macro values. Defaults to None.
+
+    Returns:
+        List[Dict[str, str]]: One dictionary of expanded commands per queued job.
+
+    Raises:
+        ValueError: If the description is malformed or a job lacks a required command or leaves a macro unresolved.
+
+    """
+    commands = {}
+    jobs = []
+    lines = iter(text.splitlines())
+
+    for line in lines:
+        line = line.strip()
+
+        if not line or line.startswith('#'):
+            continue
+
+        if line.split()[0].lower() == 'queue':
+            match = re.match(r'queue\s+(.+?)\s+from\s*\(\s*$', line, re.IGNORECASE)
+
+            if match:
+                names = [name.strip() for name in match.group(1).split(',')]
+                rows = []
+
+                for row in lines:
+                    if row.strip() == ')':
+                        break
+
+                    rows.append([value.strip() for value in row.split(',')])
+                else:
+                    raise ValueError('Unterminated "queue ... from (" statement')
+
+                for row in rows:
+                    if len(row) != len(names):
+                        raise ValueError(f'Expected {len(names)} values in queue row, got {row}')
+
+                    jobs.append({**(macros or {}), **dict(zip(names, row))})
+            else:
+                count = line.split()[1:] or ['1']
+                jobs.extend(dict(macros or {}) for _ in range(int(count[0])))
+
+            continue
+
+        key, sep, value = line.partition('=')
+
+        if not sep:
+            raise ValueError(f'Invalid submit command: {line}')
+
+        commands[key.strip().lower()] = value.strip()
+
+    ads = []
+
+    for job in jobs:
+        ad = {key: _expand(value, job) for key, value in commands.items()}
+        missing = [key for key in SUBMIT_KEYS if key not in ad]
+        unresolved = [key for key, value in ad.items() if '$(' in value]
+
+        if missing:
+            raise ValueError(f'Job is missing submit commands: {missing}')
+
+        if unresolved:
+            raise ValueError(f'Unresolved macros in submit commands: {unresolved}')
+
+        ads.append(ad)
+
+    return ads
+
+
+def parse_dag(text: str) -> Tuple[Dict[str, Tuple[str, Dict[str, str]]], List[Tuple[str, str]]]:
+    """
+    Parse the JOB, VARS and PARENT/CHILD statements of a DAGMan file and check that it is acyclic.
+
+    Args:
+        text (str): The DAG description.
+
+    Returns:
+        Tuple[Dict[str, Tuple[str, Dict[str, str]]], List[Tuple[str, str]]]: The submit file and VARS of every node, and the (parent, child) edges.
+
+    Raises:
+        ValueError: If a statement is malformed, refers to an unknown node or the graph has a cycle.
+
+    """
+    nodes = {}
+    edges = []
+
+    for line in text.splitlines():
+        tokens = shlex.split(line, comments=True)
+
+        if not tokens:
+            continue
+
+        keyword = tokens[0].upper()
+
+        if keyword == 'JOB':
+            nodes[tokens[1]] = (tokens[2], {})
+        elif keyword == 'VARS':
+            if tokens[1] not in nodes:
+                raise ValueError(f'VARS for unknown node {tokens[1]}')
+
+            nodes[tokens[1]][1].update(token.split('=', 1) for token in tokens[2:])
+        elif keyword == 'PARENT':
+            split = [t.upper() for t in tokens].index('CHILD')
+            edges.extend((p, c) for p in tokens[1:split] for c in tokens[split + 1:])
+        else:
+            raise ValueError(f'Unsupported DAG statement: {line}')
+
+    for parent, child in edges:
+        if parent not in nodes or child not in nodes:
+            raise ValueError(f'Edge {parent} -> {child} refers to an unknown node')
+
+    indegree = {node: 0 for node in nodes}
+    children = {node: [] for node in nodes}
+
+    for parent, child in edges:
+        children[parent].append(child)
+        indegree[child] += 1
+
+    ready = [node for node, degree in indegree.items() if degree == 0]
+    visited = 0
+
+    while ready:
+        visited += 1
+
+        for child in children[ready.pop()]:
+            indegree[child] -= 1
+
+            if indegree[child] == 0:
+                ready.append(child)
+
+    if visited != len(nodes):
+        raise ValueError('The DAG has a cycle')
+
+    return nodes, edges
@@ -0,0 +1,88 @@
+import heapq
+import os
+from typing import Dict, List
+
+from utils.bids import BidsIndex
+
+
+# rough fMRIPrep resource model
+BASE_CPUS = 4
+MAX_CPUS = 16
+RUNS_PER_CPU = 4
+BASE_MEMORY_MB = 8000
+MEMORY_MB_PER_INPUT_MB = 4
+BASE_DISK_MB = 20000
+DISK_MB_PER_INPUT_MB = 20
+
+NIFTI_EXTENSIONS = ('.nii', '.nii.gz')
+
+
+def bold_runs(index: BidsIndex, subject: str, sessions: List[str] = None) -> list:
+    """
+    Get the BOLD NIfTI files of a subject.
+
+    Args:
+        index (BidsIndex): The BIDS index.
+        subject (str): The subject.
+        sessions (List[str], optional): The sessions to consider. Defaults to all sessions of the subject.
+
+    Returns:
+        list: The BidsFile of every BOLD run.
+
+    """
+    return [
+        f
+        for session in sessions or index.sessions(subject)
+        for f in index.get(subject, session, 'func', suffix='bold')
+        if f.extension in NIFTI_EXTENSIONS
+    ]
+
+
+def estimate_subject_resources(index: BidsIndex, subject: str, sessions: List[str] = None) -> Dict[str, int]:
+    """
+    Estimate the resources an fMRIPrep job needs from the subject's BOLD runs.
+
+    The CPU count grows with the number of runs (which fMRIPrep processes in parallel), memory and scratch disk grow with the input size.
+
+    Args:
+        index (BidsIndex): The BIDS index.
+        subject (str): The subject.
+        sessions (List[str], optional): The sessions to consider. Defaults to all sessions of the subject.
+
+    Returns:
+        Dict[str, int]: The `cpus`, `memory_mb` and `disk_mb` of the job.
+
+    """
+    runs = bold_runs(index, subject, sessions)
+    size_mb = sum(os.path.getsize(f.path) for f in runs) / 1024 ** 2
+    return {
+        'cpus': min(MAX_CPUS, BASE_CPUS + len(runs) // RUNS_PER_CPU),
+        'memory_mb': int(BASE_MEMORY_MB + MEMORY_MB_PER_INPUT_MB * size_mb),
+        'disk_mb': int(BASE_DISK_MB + DISK_MB_PER_INPUT_MB * size_mb)
+    }
+
+
+def balance_groups(costs: Dict[str, float], n_groups: int) -> List[List[str]]:
+    """
+    Assign subjects to groups so that the most loaded group finishes as early as possible.
+
+    Uses the longest-processing-time heuristic: subjects are taken from the most to the least expensive and each is added to the currently least loaded group.
+    Ties are broken by subject name, so the result is deterministic.
+
+    Args:
+        costs (Dict[str, float]): The estimated cost of every subject.
+        n_groups (int): The number of groups.
+
+    Returns:
+        List[List[str]]: The non-empty groups, each sorted, ordered by their first subject.
+
+    """
+    heap = [(0.0, i) for i in range(max(1, min(n_groups, len(costs))))]
+    groups = [[] for _ in heap]
+
+    for subject in sorted(costs, key=lambda s: (-costs[s], s)):
+        load, i = heapq.heappop(heap)
+        groups[i].append(subject)
+        heapq.heappush(heap, (load + costs[subject], i))
+
+    return sorted((sorted(group) for group in groups if group), key=lambda g: g[0])
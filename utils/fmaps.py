@@ -1,18 +1,128 @@
-from typing import Dict, List
+from bisect import bisect_right
+import json
+from typing import Dict, List, Tuple
 
 
-def get_fmap_by_run_num(val: str, dictionary: Dict[str, List[str]]) -> str:
+def invert_fmap_dict(dictionary: Dict[str, List[str]]) -> Dict[str, str]:
     """
-    Get the fmap number based on the run number.
+    Build the run -> fmap lookup of an fmap -> runs mapping.
 
     Args:
-        val (str): The run number.
-        dictionary (Dict[str, List[str]]): A dictionary containing mapping of run numbers to fmap numbers.
+        dictionary (Dict[str, List[str]]): A dictionary containing mapping of fmap numbers to run numbers.
 
     Returns:
-        str: The corresponding fmap number.
+        Dict[str, str]: The fmap number of every run number.
 
+    Raises:
+        ValueError: If a run is mapped to more than one fmap.
+
+    """
+    lookup = {}
+
+    for fmap, runs in dictionary.items():
+        for run in runs:
+            if lookup.get(run, fmap) != fmap:
+                raise ValueError(f'Run {run} is mapped to fmaps {lookup[run]} and {fmap}')
+
+            lookup[run] = fmap
+
+    return lookup
+
+
+def load_fmap_overrides(path: str) -> Dict[str, Dict[str, str]]:
+    """
+    Load a file of manual fmap -> runs mappings.
+
+    The file is JSON, or YAML if PyYAML is installed, and maps a key to an fmap -> runs mapping (e.g. {"sub-01_ses-02": {"01": ["01", "02"]}}).
+    The key is a subject and session (sub-01_ses-02), a subject (sub-01) or `*` for all subjects; the most specific key that maps a run wins.
+
+    Args:
+        path (str): The path of the override file.
+
+    Returns:
+        Dict[str, Dict[str, str]]: The run -> fmap lookup of every key.
+
+    Raises:
+        ImportError: If the file is YAML and PyYAML is not installed.
+        ValueError: If an fmap or run number is not a string.
+
+    """
+    with open(path, 'r') as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError(f'Reading {path} needs PyYAML (pip install pyyaml), or write the overrides as JSON')
+
+            overrides = yaml.safe_load(f) or {}
+        else:
+            overrides = json.load(f)
+
+    for key, mapping in overrides.items():
+        if not all(isinstance(label, str) for fmap, runs in mapping.items() for label in [fmap, *runs]):
+            raise ValueError(f'Fmap and run numbers of {key} in {path} must be quoted BIDS labels (e.g. "01")')
+
+    return {key: invert_fmap_dict(mapping) for key, mapping in overrides.items()}
+
+
+def acquisition_seconds(value: str) -> float:
+    """
+    Convert a BIDS `AcquisitionTime` (hh:mm:ss[.000000]) to seconds since midnight.
+
+    Args:
+        value (str): The acquisition time.
+
+    Returns:
+        float: The seconds since midnight.
+
+    """
+    hours, minutes, seconds = value.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def match_fmaps(
+    bolds: Dict[str, Tuple[float, str]],
+    fmaps: Dict[str, List[Tuple[float, str]]]
+) -> Dict[str, str]:
     """
-    for k, v in dictionary.items():
-        if val in v:
-            return k
\ No newline at end of file
+    Assign every BOLD run to the nearest preceding compatible fmap.
+
+    An fmap is compatible with a run if one of its images is phase-encoded along the same axis (e.g. j- and j).
+    The start times of the compatible fmaps are kept in a sorted array per axis and every run is placed with a bisection, so matching takes O((runs + fmaps) log fmaps).
+    A run acquired before all compatible fmaps gets the first one after it.
+
+    Args:
+        bolds (Dict[str, Tuple[float, str]]): The acquisition time (seconds) and phase encoding direction of every run number.
+        fmaps (Dict[str, List[Tuple[float, str]]]): The acquisition time and phase encoding direction of the images of every fmap number.
+
+    Returns:
+        Dict[str, str]: The fmap number of every run number.
+
+    Raises:
+        ValueError: If there is no compatible fmap for a run.
+
+    """
+    by_axis = {}
+
+    for fmap, images in fmaps.items():
+        start = min(time for time, _ in images)
+
+        for axis in {direction.rstrip('-') for _, direction in images}:
+            by_axis.setdefault(axis, []).append((start, fmap))
+
+    for entries in by_axis.values():
+        entries.sort()
+
+    starts = {axis: [start for start, _ in entries] for axis, entries in by_axis.items()}
+    lookup = {}
+
+    for run, (time, direction) in bolds.items():
+        axis = direction.rstrip('-')
+
+        if axis not in by_axis:
+            raise ValueError(f'No fmap phase-encoded along {axis} for run {run}')
+
+        i = bisect_right(starts[axis], time) - 1
+        lookup[run] = by_axis[axis][max(i, 0)][1]
+
+    return lookup
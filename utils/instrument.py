@@ -0,0 +1,66 @@
+"""
+Runs a command and appends its wall time, CPU time, peak memory and exit status to a JSON lines file.
+"""
+import argparse
+import json
+import os
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+
+def run_instrumented(command: list[str], subject: str, metrics: str) -> int:
+    """
+    Run a command and append its resource usage to a JSON lines file.
+
+    SIGINT and SIGTERM are forwarded to the command, so the record is still written when the job is stopped.
+
+    Args:
+        command (list[str]): The command to run.
+        subject (str): Subject ID.
+        metrics (str): The JSON lines file to append the record to.
+
+    Returns:
+        int: The exit status of the command (128 + signal number if it was killed by a signal).
+
+    """
+    start = time.time()
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    proc = subprocess.Popen(command)
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda signum, frame: proc.send_signal(signum))
+
+    returncode = proc.wait()
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    exit_status = returncode if returncode >= 0 else 128 - returncode
+    record = {
+        'subject': subject,
+        'host': socket.gethostname(),
+        'start': start,
+        'wall_s': time.time() - start,
+        'user_s': after.ru_utime - before.ru_utime,
+        'sys_s': after.ru_stime - before.ru_stime,
+        'max_rss_kb': after.ru_maxrss,
+        'exit_status': exit_status
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(metrics)), exist_ok=True)
+
+    with open(metrics, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+    return exit_status
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs a command and records its runtime and memory use.')
+    parser.add_argument('--metrics', required=True, help='JSON lines file to append the record to')
+    parser.add_argument('--subject', required=True, help='subject ID of the record')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='the command to run, after --')
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    sys.exit(run_instrumented(command, args.subject, args.metrics))
@@ -0,0 +1,204 @@
+"""
+Keeps the state of the fMRIPrep jobs of a project in an SQLite database, updated by the generated scripts through its command line.
+"""
+import argparse
+import os
+import socket
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    stage TEXT NOT NULL,
+    label TEXT NOT NULL,
+    state TEXT NOT NULL,
+    queued REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    host TEXT,
+    exit_status INTEGER,
+    runs INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (stage, label)
+)
+'''
+STATES = ('queued', 'running', 'done', 'failed')
+
+
+class Ledger:
+    """
+    The queued, running, done and failed fMRIPrep jobs of a project, keyed by stage (e.g. fmriprep_anat, fmriprep) and job label (e.g. sub-01 or sub-01_ses-01).
+
+    The database is opened in WAL mode and every change is one short transaction, so many jobs can update it concurrently; WAL needs shared memory between the writers, so the ledger has to live on a local filesystem or one with working POSIX locks.
+    """
+    def __init__(self, path: str, timeout: float = 60):
+        """
+        Opens the ledger, creating the database if needed.
+
+        Args:
+            path (str): The SQLite database file.
+            timeout (float, optional): Seconds to wait for the lock of a concurrent writer. Defaults to 60.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(SCHEMA)
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        self.conn.close()
+
+    def _write(self, sql: str, params) -> int:
+        """
+        Runs one statement in its own write transaction.
+
+        Args:
+            sql (str): The statement.
+            params: The parameters, or a list of parameter tuples to run the statement for each.
+
+        Returns:
+            int: The number of changed rows.
+        """
+        self.conn.execute('BEGIN IMMEDIATE')
+
+        try:
+            if isinstance(params, list):
+                cursor = self.conn.executemany(sql, params)
+            else:
+                cursor = self.conn.execute(sql, params)
+
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+
+        return cursor.rowcount
+
+    def register(self, labels: List[str], stage: str) -> int:
+        """
+        Queues jobs; jobs that are running keep their state.
+
+        Args:
+            labels (List[str]): The job labels.
+            stage (str): The stage the jobs belong to (e.g. fmriprep).
+
+        Returns:
+            int: The number of jobs queued.
+        """
+        now = time.time()
+        return self._write(
+            'INSERT INTO jobs (stage, label, state, queued) VALUES (?, ?, \'queued\', ?) '
+            'ON CONFLICT(stage, label) DO UPDATE SET state = \'queued\', queued = excluded.queued '
+            'WHERE jobs.state != \'running\'',
+            [(stage, label, now) for label in labels]
+        )
+
+    def start(self, stage: str, label: str, host: Optional[str] = None):
+        """
+        Marks a job as running, registering it if needed.
+
+        Args:
+            stage (str): The stage of the job.
+            label (str): The job label.
+            host (Optional[str], optional): The host running the job. Defaults to None (this host).
+        """
+        now = time.time()
+        self._write(
+            'INSERT INTO jobs (stage, label, state, queued, started, host, runs) VALUES (?, ?, \'running\', ?, ?, ?, 1) '
+            'ON CONFLICT(stage, label) DO UPDATE SET state = \'running\', started = excluded.started, host = excluded.host, '
+            'finished = NULL, exit_status = NULL, runs = jobs.runs + 1',
+            (stage, label, now, now, host or socket.gethostname())
+        )
+
+    def finish(self, stage: str, label: str, exit_status: int):
+        """
+        Marks a job as done (exit status 0) or failed.
+
+        A job whose start was not recorded (e.g. the ledger was locked at the time) gets the finish time as its start.
+
+        Args:
+            stage (str): The stage of the job.
+            label (str): The job label.
+            exit_status (int): The exit status of the job.
+        """
+        now = time.time()
+        self._write(
+            'UPDATE jobs SET state = ?, finished = ?, started = COALESCE(started, ?), exit_status = ? WHERE stage = ? AND label = ?',
+            ('done' if exit_status == 0 else 'failed', now, now, exit_status, stage, label)
+        )
+
+    def jobs(self, state: Optional[str] = None) -> List[Dict]:
+        """
+        Args:
+            state (Optional[str], optional): Only return the jobs in this state. Defaults to None (all jobs).
+
+        Returns:
+            List[Dict]: The jobs, sorted by stage and label.
+        """
+        if state is None:
+            rows = self.conn.execute('SELECT * FROM jobs ORDER BY stage, label')
+        else:
+            rows = self.conn.execute('SELECT * FROM jobs WHERE state = ? ORDER BY stage, label', (state,))
+
+        return [dict(row) for row in rows]
+
+    def summary(self, window_h: float = 24, now: Optional[float] = None) -> Dict:
+        """
+        Summarises the backlog, the jobs in flight and the recent completion rate.
+
+        The rate counts the jobs done within the last `window_h` hours over the time since the first of them started (at most the window; the whole window when no start was recorded); the ETA divides the queued and running jobs by it.
+
+        Args:
+            window_h (float, optional): The window of the completion rate in hours. Defaults to 24.
+            now (Optional[float], optional): The current time. Defaults to None (time.time()).
+
+        Returns:
+            Dict: The job count per state, the running and failed jobs, the rate in jobs per hour and the ETA in hours (None without a rate).
+        """
+        now = time.time() if now is None else now
+        since = now - window_h * 3600
+        counts = dict.fromkeys(STATES, 0)
+        counts.update({row[0]: row[1] for row in self.conn.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state')})
+        recent, first = self.conn.execute(
+            'SELECT COUNT(*), MIN(started) FROM jobs WHERE state = \'done\' AND finished >= ?',
+            (since,)
+        ).fetchone()
+        # MIN skips the jobs whose start was never recorded
+        span_start = since if first is None else max(first, since)
+        span_h = (now - span_start) / 3600 if recent else 0
+        rate = recent / span_h if span_h > 0 else None
+        remaining = counts['queued'] + counts['running']
+
+        return {
+            'counts': counts,
+            'running': self.jobs('running'),
+            'failed': self.jobs('failed'),
+            'done_in_window': recent,
+            'window_h': window_h,
+            'jobs_per_hour': rate,
+            'eta_h': remaining / rate if rate else (0.0 if not remaining else None)
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Records the start and end of an fMRIPrep job in the project ledger.')
+    parser.add_argument('--ledger', required=True, help='the SQLite ledger file')
+    parser.add_argument('--stage', required=True, help='the stage of the job (e.g. fmriprep)')
+    parser.add_argument('action', choices=['start', 'finish'], help='the event to record')
+    parser.add_argument('label', help='the job label (e.g. sub-01)')
+    parser.add_argument('--status', type=int, default=0, help='exit status of the job, for finish')
+    args = parser.parse_args()
+    ledger = Ledger(args.ledger)
+
+    if args.action == 'start':
+        ledger.start(args.stage, args.label)
+    else:
+        ledger.finish(args.stage, args.label, args.status)
+
+    ledger.close()
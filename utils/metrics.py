@@ -0,0 +1,116 @@
+import json
+import logging
+import math
+from typing import Dict, List
+
+
+def load_records(path: str) -> List[dict]:
+    """
+    Load the run records of a JSON lines metrics file.
+
+    Lines that are not complete JSON objects, such as a last line cut short by a job killed while appending its record, are skipped.
+
+    Args:
+        path (str): The metrics file.
+
+    Returns:
+        List[dict]: The run records.
+
+    """
+    records = []
+
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+
+            if not line.startswith('{'):
+                continue
+
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logging.warning(f'Skipping malformed record in {path}: {line}')
+
+    return records
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Compute a percentile with linear interpolation between the closest ranks.
+
+    Args:
+        values (List[float]): The values.
+        q (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile, or NaN if there are no values.
+
+    """
+    if not values:
+        return math.nan
+
+    values = sorted(values)
+    rank = (len(values) - 1) * q / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarise(records: List[dict]) -> Dict[str, float]:
+    """
+    Summarise the throughput, runtime and memory use of fMRIPrep runs.
+
+    Throughput counts the successful runs over the span from the first start to the last end.
+
+    Args:
+        records (List[dict]): The run records.
+
+    Returns:
+        Dict[str, float]: The summary statistics.
+
+    """
+    succeeded = [r for r in records if r.get('exit_status') == 0]
+    walls = [r['wall_s'] for r in succeeded]
+    span_h = 0.0
+
+    if records:
+        span_h = (max(r['start'] + r['wall_s'] for r in records) - min(r['start'] for r in records)) / 3600
+
+    return {
+        'runs': len(records),
+        'succeeded': len(succeeded),
+        'failed': len(records) - len(succeeded),
+        'subjects': len({r['subject'] for r in succeeded}),
+        'span_h': span_h,
+        'subjects_per_hour': len(succeeded) / span_h if span_h > 0 else math.nan,
+        'runtime_p50_h': percentile(walls, 50) / 3600,
+        'runtime_p95_h': percentile(walls, 95) / 3600,
+        'cpu_h': sum(r['user_s'] + r['sys_s'] for r in records) / 3600,
+        'peak_memory_mb': max((r['max_rss_kb'] for r in records), default=0) / 1024
+    }
+
+
+def summarise_attempts(records: List[dict]) -> Dict[str, dict]:
+    """
+    Summarise the attempts of resumable runs per job.
+
+    Args:
+        records (List[dict]): The attempt records (see `utils.bash.retry_block`).
+
+    Returns:
+        Dict[str, dict]: The number of `attempts` and `failures`, the `hosts` of the failures and whether the last attempt `succeeded`, keyed by job label and sorted by label.
+
+    """
+    summary = {}
+
+    for record in sorted(records, key=lambda r: r['start']):
+        job = summary.setdefault(record['subject'], {'attempts': 0, 'failures': 0, 'hosts': [], 'succeeded': False})
+        job['attempts'] += 1
+        job['succeeded'] = record['exit_status'] == 0
+
+        if not job['succeeded']:
+            job['failures'] += 1
+
+            if record['host'] not in job['hosts']:
+                job['hosts'].append(record['host'])
+
+    return dict(sorted(summary.items()))
@@ -0,0 +1,130 @@
+from dataclasses import dataclass
+import gzip
+import math
+import mmap
+import struct
+from typing import Tuple
+
+
+NIFTI1_HEADER_SIZE = 348
+NIFTI2_HEADER_SIZE = 540
+
+
+@dataclass(frozen=True)
+class NiftiHeader:
+    """
+    The fields of a NIfTI-1 or NIfTI-2 header that describe the size of the image.
+
+    Attributes:
+        version (int): 1 or 2.
+        shape (Tuple[int, ...]): The image dimensions (e.g. (x, y, z, t)).
+        datatype (int): The NIfTI datatype code.
+        bitpix (int): Bits per voxel.
+        zooms (Tuple[float, ...]): The voxel sizes (and repetition time) of the dimensions.
+        vox_offset (int): The byte offset of the data in the uncompressed file.
+    """
+    version: int
+    shape: Tuple[int, ...]
+    datatype: int
+    bitpix: int
+    zooms: Tuple[float, ...]
+    vox_offset: int
+
+    @property
+    def voxels(self) -> int:
+        """
+        Returns:
+            int: The number of voxels of one volume.
+        """
+        return math.prod(self.shape[:3])
+
+    @property
+    def volumes(self) -> int:
+        """
+        Returns:
+            int: The number of volumes (1 for 3D images).
+        """
+        return math.prod(self.shape[3:])
+
+    @property
+    def data_bytes(self) -> int:
+        """
+        Returns:
+            int: The size of the uncompressed image data.
+        """
+        return self.voxels * self.volumes * self.bitpix // 8
+
+
+def parse_header(data: bytes) -> NiftiHeader:
+    """
+    Parse a NIfTI-1 or NIfTI-2 header in either byte order.
+
+    Args:
+        data (bytes): At least the first 348 (NIfTI-1) or 540 (NIfTI-2) bytes of the file.
+
+    Returns:
+        NiftiHeader: The header.
+
+    Raises:
+        ValueError: If the data is not a NIfTI header.
+    """
+    for endian in '<>':
+        if len(data) < 4:
+            break
+
+        sizeof_hdr, = struct.unpack_from(f'{endian}i', data, 0)
+
+        if sizeof_hdr == NIFTI1_HEADER_SIZE and len(data) >= NIFTI1_HEADER_SIZE:
+            dim = struct.unpack_from(f'{endian}8h', data, 40)
+            datatype, bitpix = struct.unpack_from(f'{endian}2h', data, 70)
+            pixdim = struct.unpack_from(f'{endian}8f', data, 76)
+            vox_offset, = struct.unpack_from(f'{endian}f', data, 108)
+            version = 1
+        elif sizeof_hdr == NIFTI2_HEADER_SIZE and len(data) >= NIFTI2_HEADER_SIZE:
+            datatype, bitpix = struct.unpack_from(f'{endian}2h', data, 12)
+            dim = struct.unpack_from(f'{endian}8q', data, 16)
+            pixdim = struct.unpack_from(f'{endian}8d', data, 104)
+            vox_offset, = struct.unpack_from(f'{endian}q', data, 168)
+            version = 2
+        else:
+            continue
+
+        ndim = dim[0]
+
+        if not 1 <= ndim <= 7:
+            raise ValueError(f'Invalid number of dimensions in NIfTI header: {ndim}')
+
+        return NiftiHeader(
+            version,
+            tuple(int(d) for d in dim[1:ndim + 1]),
+            datatype,
+            bitpix,
+            tuple(float(p) for p in pixdim[1:ndim + 1]),
+            int(vox_offset)
+        )
+
+    raise ValueError('Not a NIfTI-1 or NIfTI-2 header')
+
+
+def read_header(path: str) -> NiftiHeader:
+    """
+    Read the header of a NIfTI file without reading its data.
+
+    Uncompressed files are memory-mapped and only the header pages are touched; for gzipped files only the first block is decompressed.
+
+    Args:
+        path (str): The path of a .nii or .nii.gz file.
+
+    Returns:
+        NiftiHeader: The header.
+
+    Raises:
+        ValueError: If the file is not a NIfTI file.
+    """
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rb') as f:
+            return parse_header(f.read(NIFTI2_HEADER_SIZE))
+
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return parse_header(m[:NIFTI2_HEADER_SIZE])
@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+from typing import Any, Callable, Dict, Hashable, Iterable, Tuple
+
+
+def run_parallel(
+    func: Callable[..., Any],
+    tasks: Iterable[Tuple[Hashable, tuple]],
+    jobs: int = 1
+) -> Tuple[Dict[Hashable, list], Dict[Hashable, list]]:
+    """
+    Run a function over a set of tasks in a thread pool.
+
+    Every task is a `(key, args)` pair, where `key` groups the results and errors (e.g. a subject) and `args` are passed to `func`.
+    Exceptions are not raised but collected per key, so that one failing task does not stop the others.
+
+    Args:
+        func (Callable[..., Any]): The function to call for every task.
+        tasks (Iterable[Tuple[Hashable, tuple]]): The `(key, args)` pairs to process.
+        jobs (int, optional): The number of worker threads. Defaults to 1.
+
+    Returns:
+        Tuple[Dict[Hashable, list], Dict[Hashable, list]]: The results and the errors, both grouped by key.
+    """
+    results = {}
+    errors = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = {
+            executor.submit(func, *args): key
+            for key, args in tasks
+        }
+
+        for future in as_completed(futures):
+            key = futures[future]
+
+            try:
+                results.setdefault(key, []).append(future.result())
+            except Exception as e:
+                logging.debug(f'Task for {key} failed: {e!r}')
+                errors.setdefault(key, []).append(e)
+
+    return results, errors
@@ -2,61 +2,6 @@ from typing import List
 import re
 
 
-def parse_subject_range(subject_range: str) -> List[str]:
-    '''
-    Parse the subject range string into a list of subjects.
-
-    Args:
-        subject_range (str): A string containing the subject range.
-
-    Returns:
-        List[str]: A list of subjects.
-    '''
-    def extract_range(subject_range: str) -> List[int]:
-        '''
-        Extract numbers from a string.
-
-        Args:
-            subject_range (str): A string containing numbers.
-
-        Returns:
-            List[int]: A list of numbers.
-        '''
-        numbers = re.findall(r'\d+', subject_range)
-        out = [int(num) for num in numbers]
-
-        if len(out) != 2:
-            raise ValueError(f'Invalid range: {subject_range}')
-
-        return out
-
-    start, end = extract_range(subject_range)
-    return [f'sub-{i:02d}' for i in range(start, end + 1)]
-
-
-def parse_subjects_subset(arr: list[str], pattern: str) -> list[str]:
-    """
-    Filters and expands a list of subjects based on a regex pattern.
-
-    For each item in `arr`, if it matches `pattern`, it's expanded using `parse_subject_range`.
-    Otherwise, it's added directly to the output list.
-
-    Args:
-        arr (list[str]): List of subject strings or ranges.
-        pattern (str): Regex pattern to identify subject ranges.
-
-    Returns:
-        list[str]: Expanded list of individual subjects.
-    """
-    out = []
-    for item in arr:
-        if re.match(pattern, item):
-            out.extend(parse_subject_range(item))
-        else:
-            out.append(item)
-    return out
-
-
 def find_in_string(string: str, pattern: str) -> str:
     """
     Find a pattern in a string.
@@ -79,3 +24,28 @@ def find_in_string(string: str, pattern: str) -> str:
         raise ValueError(f'Could not find {pattern} in {string}')
 
 
+def group_name(group: List[str]) -> str:
+    """
+    Build a compact name for a group of subjects.
+
+    Consecutive subject numbers are collapsed into ranges, so contiguous groups keep the `sub-01:03` form and non-contiguous groups read like `sub-01:03_07_09:10`.
+    Groups of per-session jobs (e.g. sub-01_ses-01) get their sessions appended, as in `sub-01:02_ses-01_ses-02`.
+
+    Args:
+        group (List[str]): The subjects (or subject-session jobs) of the group.
+
+    Returns:
+        str: The group name.
+
+    """
+    nums = sorted({find_in_string(subject, r'sub-(\d+)') for subject in group}, key=int)
+    sessions = sorted({session for subject in group for session in re.findall(r'_(ses-[^_]+)', subject)})
+    ranges = []
+
+    for num in nums:
+        if ranges and int(num) == int(ranges[-1][-1]) + 1:
+            ranges[-1][1:] = [num]
+        else:
+            ranges.append([num])
+
+    return 'sub-' + '_'.join(':'.join(r) for r in ranges) + ''.join(f'_{session}' for session in sessions)
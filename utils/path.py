@@ -1,5 +1,16 @@
+import hashlib
+import json
 import logging
 import os
+import tempfile
+import time
+
+
+# the permissions of generated scripts (a+rwx)
+SCRIPT_MODE = 0o777
+# the process umask, applied to the temporary files of new files
+UMASK = os.umask(0)
+os.umask(UMASK)
 
 
 def join_or_make(a: str, *args: str) -> str:
@@ -23,6 +34,39 @@ def join_or_make(a: str, *args: str) -> str:
     return a
 
 
+def write_atomic(path: str, text: str, mode: int = None) -> None:
+    """
+    Write a text file atomically.
+
+    The text is written to a hidden temporary file next to `path` which then replaces `path` with `os.replace`, so readers never see a partially written file.
+    The permissions of an existing file are kept unless `mode` is given.
+
+    Args:
+        path (str): The path of the file to write.
+        text (str): The content of the file.
+        mode (int, optional): The permissions of the file. Defaults to None (those of the existing file, or the default for new files).
+
+    """
+    dirname, basename = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=f'.{basename}.', suffix='.tmp')
+
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        elif os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        else:
+            os.chmod(tmp_path, 0o666 & ~UMASK)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
 def save_script(savepath: str, script: str) -> None:
     """
     Save a script to a file.
@@ -32,12 +76,96 @@ def save_script(savepath: str, script: str) -> None:
         script (str): The script to save.
 
     """
-    with open(savepath, 'w') as f:
-        f.write(script)
-
+    write_atomic(savepath, script, SCRIPT_MODE)
     logging.info(f'Script written to {savepath}')
 
-    try:
-        os.system(f'chmod a+rwx {savepath}')
-    except Exception as e:
-        logging.error(f'Error changing permissions:\n{e}')
\ No newline at end of file
+
+class ScriptWriter:
+    """
+    Writes generated scripts into a directory as they are rendered, all or nothing.
+
+    Every script goes to a hidden temporary file in the target directory as soon as it is written, so the scripts are not held in memory.
+    When the writer is closed without an error, the temporary files are renamed into place and a manifest listing the scripts is written; on an error they are removed, so no partial output is left behind.
+
+    Use as a context manager:
+
+        with ScriptWriter(dir_code, 'fmriprep_sequence_manifest.json') as writer:
+            for subject, script in bashgen.stream():
+                writer.write(f'run_fmriprep_{subject}.sh', script, subjects=[subject])
+    """
+    def __init__(self, directory: str, manifest: str):
+        """
+        Initializes the ScriptWriter.
+
+        Args:
+            directory (str): The directory to write the scripts to.
+            manifest (str): The file name of the manifest, in `directory`.
+        """
+        self.directory = directory
+        self.manifest = os.path.join(directory, manifest)
+        self._staged = []
+
+    def __enter__(self) -> 'ScriptWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+    def write(self, filename: str, script: str, **info) -> str:
+        """
+        Writes a script to a temporary file that is renamed into place by `commit`.
+
+        Args:
+            filename (str): The file name of the script, in the directory of the writer.
+            script (str): The script.
+            **info: Additional fields of the manifest entry (e.g. subjects=['sub-01']).
+
+        Returns:
+            str: The final path of the script.
+        """
+        path = os.path.join(self.directory, filename)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f'.{filename}.', suffix='.tmp')
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(script)
+
+            os.chmod(tmp_path, SCRIPT_MODE)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        entry = {'path': path, 'sha256': hashlib.sha256(script.encode()).hexdigest(), **info}
+        self._staged.append((tmp_path, entry))
+        logging.debug(f'Script staged for {path}')
+        return path
+
+    def commit(self):
+        """
+        Renames the written scripts into place and writes the manifest.
+        """
+        for tmp_path, entry in self._staged:
+            os.replace(tmp_path, entry['path'])
+            logging.info(f'Script written to {entry["path"]}')
+
+        manifest = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'scripts': [entry for _, entry in self._staged]
+        }
+        write_atomic(self.manifest, json.dumps(manifest, indent=4))
+        logging.info(f'{len(self._staged)} scripts listed in {self.manifest}')
+        self._staged = []
+
+    def discard(self):
+        """
+        Removes the written scripts without putting them in place.
+        """
+        for tmp_path, _ in self._staged:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+        logging.error(f'Generation failed, discarded {len(self._staged)} written scripts')
+        self._staged = []
\ No newline at end of file
@@ -0,0 +1,169 @@
+from dataclasses import dataclass
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from utils.bids import BidsIndex, BidsFile
+from utils.cost import NIFTI_EXTENSIONS
+from utils.nifti import read_header
+
+
+# rough fMRIPrep compute model, in CPU-hours
+CPU_HOURS_BASE = 4.0
+CPU_HOURS_PER_RUN = 0.5
+CPU_HOURS_PER_GIGAVOXEL = 10.0
+
+# rough fMRIPrep disk model: float32 copies of every BOLD voxel in the working directory and in the derivatives
+WORK_BASE_MB = 2000
+WORK_COPIES = 6
+OUTPUT_BASE_MB = 200
+OUTPUT_COPIES = 2
+
+# the images fMRIPrep reads, as (datatype, suffix)
+PROFILED = (('func', 'bold'), ('fmap', 'epi'), ('anat', 'T1w'))
+
+
+@dataclass(frozen=True)
+class ImageProfile:
+    """
+    The size of an image, from its NIfTI header.
+
+    Attributes:
+        file (BidsFile): The image.
+        voxels (int): The number of voxels of one volume (0 if the header is unreadable).
+        volumes (int): The number of volumes (0 if the header is unreadable).
+        data_bytes (int): The size of the uncompressed data (0 if the header is unreadable).
+        file_bytes (int): The size of the file.
+    """
+    file: BidsFile
+    voxels: int
+    volumes: int
+    data_bytes: int
+    file_bytes: int
+
+
+def profile_image(f: BidsFile) -> ImageProfile:
+    """
+    Profile an image from its NIfTI header, without reading its data.
+
+    Args:
+        f (BidsFile): The image.
+
+    Returns:
+        ImageProfile: The profile, with zero voxels if the header is unreadable.
+    """
+    file_bytes = os.path.getsize(f.path)
+
+    try:
+        header = read_header(f.path)
+    except (OSError, ValueError) as e:
+        logging.warning(f'Could not read the NIfTI header of {f.path}: {e}')
+        return ImageProfile(f, 0, 0, 0, file_bytes)
+
+    return ImageProfile(f, header.voxels, header.volumes, header.data_bytes, file_bytes)
+
+
+def profile_subject(index: BidsIndex, subject: str, sessions: List[str] = None) -> List[ImageProfile]:
+    """
+    Profile the BOLD, field map and T1w images of a subject.
+
+    Args:
+        index (BidsIndex): The BIDS index.
+        subject (str): The subject.
+        sessions (List[str], optional): The sessions to consider. Defaults to all sessions of the subject.
+
+    Returns:
+        List[ImageProfile]: The profile of every image.
+    """
+    return [
+        profile_image(f)
+        for session in sessions or index.sessions(subject)
+        for datatype, suffix in PROFILED
+        for f in index.get(subject, session, datatype, suffix=suffix)
+        if f.extension in NIFTI_EXTENSIONS
+    ]
+
+
+def subject_plan(subject: str, profiles: List[ImageProfile]) -> Dict[str, float]:
+    """
+    Estimate the compute and disk a subject needs from the profiles of its images.
+
+    Args:
+        subject (str): The subject (or subject-session job).
+        profiles (List[ImageProfile]): The profiles of its images (see `profile_subject`).
+
+    Returns:
+        Dict[str, float]: The `subject`, `runs`, `volumes`, `gigavoxels` (BOLD voxels times volumes, in billions), `input_gb`, `data_gb`, `cpu_hours`, `work_gb` (peak working directory) and `output_gb` (derivatives) of the subject, and the number of `unreadable` headers.
+    """
+    bolds = [p for p in profiles if p.file.suffix == 'bold']
+    gigavoxels = sum(p.voxels * p.volumes for p in bolds) / 1e9
+    return {
+        'subject': subject,
+        'runs': len(bolds),
+        'volumes': sum(p.volumes for p in bolds),
+        'gigavoxels': gigavoxels,
+        'input_gb': sum(p.file_bytes for p in profiles) / 1024 ** 3,
+        'data_gb': sum(p.data_bytes for p in profiles) / 1024 ** 3,
+        'cpu_hours': CPU_HOURS_BASE + CPU_HOURS_PER_RUN * len(bolds) + CPU_HOURS_PER_GIGAVOXEL * gigavoxels,
+        'work_gb': WORK_BASE_MB / 1024 + WORK_COPIES * 4 * gigavoxels * 1e9 / 1024 ** 3,
+        'output_gb': OUTPUT_BASE_MB / 1024 + OUTPUT_COPIES * 4 * gigavoxels * 1e9 / 1024 ** 3,
+        'unreadable': sum(p.voxels == 0 for p in profiles)
+    }
+
+
+def group_plan(name: str, plans: List[Dict[str, float]], concurrent: int = 1) -> Dict[str, float]:
+    """
+    Sum up the plans of the subjects of a group.
+
+    Args:
+        name (str): The name of the group.
+        plans (List[Dict[str, float]]): The plans of its subjects (see `subject_plan`).
+        concurrent (int, optional): How many subjects of the group run at the same time. Defaults to 1.
+
+    Returns:
+        Dict[str, float]: The `subjects`, `cpu_hours`, `output_gb` and `work_gb` (peak working directory of the concurrently running subjects) of the group.
+    """
+    work = sorted((p['work_gb'] for p in plans), reverse=True)
+    return {
+        'group': name,
+        'subjects': [p['subject'] for p in plans],
+        'cpu_hours': sum(p['cpu_hours'] for p in plans),
+        'output_gb': sum(p['output_gb'] for p in plans),
+        'work_gb': sum(work[:concurrent])
+    }
+
+
+def cohort_plan(
+    index: BidsIndex,
+    units: Dict[str, Tuple[str, List[str]]],
+    groups: Optional[Dict[str, List[str]]] = None,
+    concurrent: int = 1
+) -> dict:
+    """
+    Build the plan report of a cohort: the estimated CPU-hours and disk footprint per subject, per group and in total.
+
+    Args:
+        index (BidsIndex): The BIDS index.
+        units (Dict[str, Tuple[str, List[str]]]): The subject and sessions of every job, keyed by its label.
+        groups (Optional[Dict[str, List[str]]], optional): The labels of every group. Defaults to None (every job on its own).
+        concurrent (int, optional): How many jobs of a group run at the same time. Defaults to 1.
+
+    Returns:
+        dict: The `subjects`, `groups` and `total` plans; the total `work_gb` assumes all groups run at the same time.
+    """
+    subjects = {
+        label: subject_plan(label, profile_subject(index, subject, sessions))
+        for label, (subject, sessions) in units.items()
+    }
+    groups = groups or {label: [label] for label in units}
+    group_plans = [
+        group_plan(name, [subjects[label] for label in labels], concurrent)
+        for name, labels in groups.items()
+    ]
+    total = {
+        key: sum(p[key] for p in subjects.values())
+        for key in ('runs', 'volumes', 'gigavoxels', 'input_gb', 'data_gb', 'cpu_hours', 'output_gb', 'unreadable')
+    }
+    total['subjects'] = len(subjects)
+    total['work_gb'] = sum(g['work_gb'] for g in group_plans)
+    return {'subjects': list(subjects.values()), 'groups': group_plans, 'total': total}
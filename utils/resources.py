@@ -0,0 +1,65 @@
+import os
+
+
+def machine_cpus() -> int:
+    """
+    Get the number of CPU cores available to this process.
+
+    Returns:
+        int: The number of cores.
+
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def machine_memory_mb() -> int:
+    """
+    Get the physical memory of the machine.
+
+    Returns:
+        int: The memory in MB.
+
+    """
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 1024 ** 2
+
+
+# share of the machine's memory handed to fMRIPrep, the rest is left to the OS and the container runtime
+MEMORY_HEADROOM = 0.9
+# fMRIPrep's own default cap for --omp-nthreads
+MAX_OMP_NTHREADS = 8
+
+
+def compute_budget(
+    cpus: int = None,
+    memory_mb: int = None,
+    concurrent: int = 1,
+    low_mem_threshold_mb: int = None
+) -> dict:
+    """
+    Split a machine between fMRIPrep invocations running side by side.
+
+    Args:
+        cpus (int, optional): The cores of the machine. Defaults to None (no thread budget).
+        memory_mb (int, optional): The memory of the machine, in MB. Defaults to None (no memory budget).
+        concurrent (int, optional): How many fMRIPrep invocations run at the same time. Defaults to 1.
+        low_mem_threshold_mb (int, optional): Enable `--low-mem` when the memory per invocation is below this. Defaults to None (never).
+
+    Returns:
+        dict: The `nthreads`, `omp_nthreads`, `mem_mb` and `low_mem` of every invocation (None when not budgeted).
+
+    """
+    concurrent = max(1, concurrent)
+    budget = {'nthreads': None, 'omp_nthreads': None, 'mem_mb': None, 'low_mem': False}
+
+    if cpus:
+        budget['nthreads'] = max(1, cpus // concurrent)
+        budget['omp_nthreads'] = max(1, min(budget['nthreads'] - 1, MAX_OMP_NTHREADS))
+
+    if memory_mb:
+        budget['mem_mb'] = int(memory_mb * MEMORY_HEADROOM / concurrent)
+        budget['low_mem'] = bool(low_mem_threshold_mb and budget['mem_mb'] < low_mem_threshold_mb)
+
+    return budget
@@ -0,0 +1,217 @@
+from dataclasses import dataclass
+import json
+import logging
+import os
+import signal
+import subprocess
+import time
+from typing import Dict, List, Optional
+
+
+@dataclass
+class Job:
+    """
+    A command to run with its estimated footprint.
+
+    Attributes:
+        name (str): A unique name, used for the log file.
+        command (List[str]): The command to run.
+        cpus (int): The CPU cores the job needs.
+        memory_mb (int): The memory the job needs, in MB.
+    """
+    name: str
+    command: List[str]
+    cpus: int = 1
+    memory_mb: int = 0
+
+
+class LocalRunner:
+    """
+    Runs jobs as local processes within a CPU-core and memory budget.
+
+    Jobs are started in order; a job is admitted as soon as its footprint fits in what the running jobs leave of the budget, so smaller jobs may overtake one that does not fit yet.
+    A job larger than the whole budget is run alone. The output of every job is streamed to `<dir_log>/<name>.log` and the exit codes are recorded in `<dir_log>/exit_codes.json`.
+    """
+    def __init__(self, cpus: int, memory_mb: int, dir_log: str, poll_interval: float = 1.0, grace_period: float = 30.0):
+        """
+        Initializes the LocalRunner.
+
+        Args:
+            cpus (int): The CPU cores the jobs may use in total.
+            memory_mb (int): The memory the jobs may use in total, in MB.
+            dir_log (str): The directory for the job logs and exit codes.
+            poll_interval (float, optional): Seconds between checks of the running jobs. Defaults to 1.0.
+            grace_period (float, optional): Seconds the jobs get to exit after SIGTERM before they are killed. Defaults to 30.0.
+        """
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+        self.dir_log = dir_log
+        os.makedirs(dir_log, exist_ok=True)
+        self.poll_interval = poll_interval
+        self.grace_period = grace_period
+        self.exit_codes: Dict[str, Optional[int]] = {}
+        self._running: Dict[str, tuple] = {}
+
+    def fits(self, job: Job) -> bool:
+        """
+        Checks whether a job fits next to the running jobs.
+
+        Args:
+            job (Job): The job to check.
+
+        Returns:
+            bool: True if the job can be started now.
+        """
+        if not self._running:
+            return True
+
+        used_cpus = sum(j.cpus for j, _, _ in self._running.values())
+        used_memory = sum(j.memory_mb for j, _, _ in self._running.values())
+        return used_cpus + job.cpus <= self.cpus and used_memory + job.memory_mb <= self.memory_mb
+
+    def start(self, job: Job):
+        """
+        Starts a job in its own session, with its output streamed to its log file.
+
+        Args:
+            job (Job): The job to start.
+
+        Raises:
+            ValueError: If a job of the same name is running.
+        """
+        if job.name in self._running:
+            raise ValueError(f'{job.name} is already running')
+
+        if job.cpus > self.cpus or job.memory_mb > self.memory_mb:
+            logging.warning(f'{job.name} needs more than the whole budget, running it alone')
+
+        log = open(os.path.join(self.dir_log, f'{job.name}.log'), 'w')
+        proc = subprocess.Popen(job.command, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+        self._running[job.name] = (job, proc, log)
+        logging.info(f'Started {job.name} (pid {proc.pid}, {job.cpus} cpus, {job.memory_mb} MB)')
+
+    def reap(self):
+        """
+        Records the exit codes of the jobs that finished.
+        """
+        for name, (job, proc, log) in list(self._running.items()):
+            if proc.poll() is not None:
+                self.finish(name, proc.returncode)
+
+    def finish(self, name: str, returncode: Optional[int]):
+        """
+        Records the exit code of a job and closes its log.
+
+        Args:
+            name (str): The name of the job.
+            returncode (Optional[int]): The exit code, or None if the job never ran.
+        """
+        if name in self._running:
+            _, _, log = self._running.pop(name)
+            log.close()
+
+        self.exit_codes[name] = returncode
+
+        if returncode is None:
+            logging.warning(f'{name} was not started')
+        else:
+            logging.log(logging.INFO if returncode == 0 else logging.ERROR, f'{name} finished with exit code {returncode}')
+
+        self.save()
+
+    def save(self):
+        with open(os.path.join(self.dir_log, 'exit_codes.json'), 'w') as f:
+            json.dump(self.exit_codes, f, indent=4)
+
+    def terminate(self):
+        """
+        Sends SIGTERM to the process groups of the running jobs and kills those still alive after the grace period.
+        """
+        for _, proc, _ in self._running.values():
+            try:
+                os.killpg(proc.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + self.grace_period
+
+        for name, (_, proc, _) in list(self._running.items()):
+            try:
+                proc.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                logging.warning(f'Killing {name}')
+                os.killpg(proc.pid, signal.SIGKILL)
+                proc.wait()
+
+            self.finish(name, proc.returncode)
+
+    @property
+    def running(self) -> int:
+        """
+        Returns:
+            int: The number of running jobs.
+        """
+        return len(self._running)
+
+    def step(self, pending: List[Job]) -> List[Job]:
+        """
+        Records the jobs that finished and starts the pending jobs that fit, without waiting.
+
+        A job is not started while a job of the same name runs, as they would share the log file (and, for generated scripts, the working directory).
+
+        Args:
+            pending (List[Job]): The jobs waiting to run, in order of priority.
+
+        Returns:
+            List[Job]: The jobs still waiting.
+        """
+        self.reap()
+        pending = list(pending)
+
+        for job in [job for job in pending if self.fits(job)]:
+            if job.name not in self._running and self.fits(job):
+                pending.remove(job)
+                self.start(job)
+
+        return pending
+
+    def run(self, jobs: List[Job]) -> Dict[str, Optional[int]]:
+        """
+        Runs all jobs within the budget and waits for them.
+
+        On Ctrl-C (or SIGTERM) the running jobs are terminated, and the jobs that never started are recorded with no exit code.
+
+        Args:
+            jobs (List[Job]): The jobs to run, in order of priority.
+
+        Returns:
+            Dict[str, Optional[int]]: The exit code of every job.
+
+        Raises:
+            KeyboardInterrupt: If the run was interrupted, after the jobs have been cleaned up.
+        """
+        pending = list(jobs)
+
+        def interrupt(signum, frame):
+            raise KeyboardInterrupt
+
+        previous = signal.signal(signal.SIGTERM, interrupt)
+
+        try:
+            while pending or self._running:
+                pending = self.step(pending)
+
+                if self._running:
+                    time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            logging.warning(f'Interrupted, terminating {len(self._running)} running jobs')
+            self.terminate()
+
+            for job in pending:
+                self.finish(job.name, None)
+
+            raise
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+
+        return self.exit_codes
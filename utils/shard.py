@@ -0,0 +1,65 @@
+import argparse
+from typing import Dict, List
+
+from utils.subjects import subject_key
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """
+    Parse a shard given as `i/N` on the command line.
+
+    Args:
+        value (str): The shard (e.g. 2/4 for the second of four shards).
+
+    Returns:
+        tuple[int, int]: The shard number (starting at 1) and the number of shards.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is not `i/N` with 1 <= i <= N.
+
+    """
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid shard {value!r}, expected i/N (e.g. 1/4)')
+
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f'invalid shard {value!r}, i must be between 1 and N')
+
+    return index, count
+
+
+def assign_shards(units: List[str], count: int) -> Dict[str, int]:
+    """
+    Deal jobs round-robin to shards, in the order of their subject numbers (see `utils.subjects.subject_key`).
+
+    The assignment only depends on the jobs requested, so every node given the same subjects and sessions agrees on it without talking to the others.
+
+    Args:
+        units (List[str]): The job labels.
+        count (int): The number of shards.
+
+    Returns:
+        Dict[str, int]: The shard (starting at 1) of every job.
+
+    """
+    return {unit: k % count + 1 for k, unit in enumerate(sorted(units, key=subject_key))}
+
+
+def shard_order(units: List[str], shards: Dict[str, int], index: int, count: int) -> List[str]:
+    """
+    Order jobs for the worker of a shard: the jobs of its own shard first, then those of the following shards in turn.
+
+    Workers of different shards thus start on different jobs, and steal from different shards once their own is done.
+
+    Args:
+        units (List[str]): The job labels.
+        shards (Dict[str, int]): The shard of every job (see `assign_shards`).
+        index (int): The shard of the worker.
+        count (int): The number of shards.
+
+    Returns:
+        List[str]: The jobs, own shard first.
+
+    """
+    return sorted(units, key=lambda unit: ((shards[unit] - index) % count, subject_key(unit)))
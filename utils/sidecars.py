@@ -0,0 +1,214 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+from utils.path import write_atomic
+
+
+def file_digest(path: str) -> str:
+    """
+    Compute the SHA-256 digest of a file.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        str: The hexadecimal digest.
+
+    """
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def update_json(path: str, fields: Dict[str, str]) -> bool:
+    """
+    Set fields in a JSON file, writing it only if a value differs.
+
+    Args:
+        path (str): The path of the JSON file.
+        fields (Dict[str, str]): The fields to set.
+
+    Returns:
+        bool: True if the file was rewritten, False if it already held the values.
+
+    """
+    with open(path, 'r') as f:
+        data = json.load(f)
+
+    if all(data.get(k) == v for k, v in fields.items()):
+        return False
+
+    data.update(fields)
+    write_atomic(path, json.dumps(data, indent=4))
+    return True
+
+
+class PatchStats:
+    """
+    Thread-safe counters of the sidecars checked, skipped and rewritten while patching.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+        self.rewritten = 0
+
+    def add(self, checked: int = 0, skipped: int = 0, rewritten: int = 0):
+        with self._lock:
+            self.checked += checked
+            self.skipped += skipped
+            self.rewritten += rewritten
+
+    def __str__(self) -> str:
+        return f'{self.checked} checked, {self.skipped} skipped, {self.rewritten} rewritten'
+
+
+class SidecarManifest:
+    """
+    A manifest of the sidecars patched per subject/session.
+
+    For every key (e.g. sub-01/ses-01) the manifest stores a digest of the requested field values and, per file, its modification time, size and content hash after patching.
+    A key whose requested values did not change and whose files still have the recorded content can be skipped without opening its sidecars.
+    """
+    def __init__(self, path: str):
+        """
+        Initializes the SidecarManifest and loads it from `path` if it exists.
+
+        Args:
+            path (str): The path of the manifest file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+            except ValueError as e:
+                logging.warning(f'Ignoring unreadable sidecar manifest {path}: {e}')
+
+    @staticmethod
+    def _fields_digest(updates: Dict[str, Dict[str, str]]) -> str:
+        return hashlib.sha256(json.dumps(updates, sort_keys=True).encode()).hexdigest()
+
+    @staticmethod
+    def _file_state(path: str) -> list:
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size, file_digest(path)]
+
+    def is_current(self, key: str, updates: Dict[str, Dict[str, str]]) -> bool:
+        """
+        Checks whether the sidecars of a key still hold the recorded content for the requested values.
+
+        The content hash of a file is only recomputed when its modification time or size changed.
+
+        Args:
+            key (str): The manifest key.
+            updates (Dict[str, Dict[str, str]]): The requested fields per sidecar path.
+
+        Returns:
+            bool: True if the sidecars need no patching.
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+
+        if entry is None or entry['fields'] != self._fields_digest(updates) or set(entry['files']) != set(updates):
+            return False
+
+        for path, (mtime, size, digest) in entry['files'].items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+
+            if (st.st_mtime_ns, st.st_size) != (mtime, size) and file_digest(path) != digest:
+                return False
+
+        return True
+
+    def record(self, key: str, updates: Dict[str, Dict[str, str]]):
+        """
+        Records the current state of the sidecars of a key.
+
+        Args:
+            key (str): The manifest key.
+            updates (Dict[str, Dict[str, str]]): The fields that were applied per sidecar path.
+        """
+        entry = {
+            'fields': self._fields_digest(updates),
+            'files': {path: self._file_state(path) for path in updates}
+        }
+
+        with self._lock:
+            self.entries[key] = entry
+
+    def save(self):
+        """
+        Writes the manifest to disk.
+        """
+        with self._lock:
+            write_atomic(self.path, json.dumps(self.entries))
+
+
+class SidecarCache:
+    """
+    A persistent cache of fields read from JSON sidecars.
+
+    The fields of a file are kept together with its modification time and size, and the file is only parsed again when one of them changed.
+    """
+    def __init__(self, path: str):
+        """
+        Initializes the SidecarCache and loads it from `path` if it exists.
+
+        Args:
+            path (str): The path of the cache file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+            except ValueError as e:
+                logging.warning(f'Ignoring unreadable sidecar cache {path}: {e}')
+
+    def get(self, path: str, fields: Tuple[str, ...]) -> Dict[str, Any]:
+        """
+        Reads fields of a sidecar, from the cache if the file did not change.
+
+        Args:
+            path (str): The path of the sidecar.
+            fields (Tuple[str, ...]): The fields to read.
+
+        Returns:
+            Dict[str, Any]: The value of every field, None for fields the sidecar does not have.
+        """
+        st = os.stat(path)
+
+        with self._lock:
+            entry = self.entries.get(path)
+
+        if entry is None or (entry['mtime'], entry['size']) != (st.st_mtime_ns, st.st_size) or not set(fields) <= set(entry['fields']):
+            with open(path, 'r') as f:
+                data = json.load(f)
+
+            cached = entry['fields'] if entry and (entry['mtime'], entry['size']) == (st.st_mtime_ns, st.st_size) else {}
+            entry = {'mtime': st.st_mtime_ns, 'size': st.st_size, 'fields': {**cached, **{k: data.get(k) for k in fields}}}
+
+            with self._lock:
+                self.entries[path] = entry
+
+        return {k: entry['fields'][k] for k in fields}
+
+    def save(self):
+        """
+        Writes the cache to disk.
+        """
+        with self._lock:
+            write_atomic(self.path, json.dumps(self.entries))
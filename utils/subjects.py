@@ -0,0 +1,269 @@
+from bisect import bisect_right
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+# sub-<start>[:[sub-]<end>[:<step>]], e.g. sub-0001, sub-0001:1000 or sub-01:20:2
+SUBJECT_SPEC = re.compile(r'sub-(\d+)(?::(?:sub-)?(\d+)(?::(\d+))?)?')
+
+
+class SubjectSet:
+    """
+    A set of subjects stored as sorted, disjoint intervals of subject numbers.
+
+    Union, intersection and difference work on the intervals, so contiguous ranges of thousands of subjects are never materialised; the labels are only generated when the set is iterated.
+    A stepped range (e.g. sub-01:20:2) holds one interval per subject, so its size grows with the number of subjects it selects.
+    Subjects whose label is not a number (e.g. sub-pilot) are kept as they are next to the intervals.
+    Membership compares numbers, so sub-7 is in a set holding sub-007.
+    """
+    def __init__(self, intervals: Iterable[Tuple[int, int]] = (), width: int = 2, labels: Iterable[str] = ()):
+        """
+        Initializes the SubjectSet.
+
+        Args:
+            intervals (Iterable[Tuple[int, int]], optional): Inclusive (first, last) subject numbers, in any order and possibly overlapping. Defaults to ().
+            width (int, optional): The zero-padding width of the generated labels. Defaults to 2.
+            labels (Iterable[str], optional): Subjects without a subject number. Defaults to ().
+        """
+        self.intervals = merge_intervals(intervals)
+        self.width = width
+        self.labels = frozenset(labels)
+        self._starts = [lo for lo, _ in self.intervals]
+
+    @classmethod
+    def parse(cls, specs: Iterable[str]) -> 'SubjectSet':
+        """
+        Parses subjects and subject ranges.
+
+        A range is `sub-<first>:<last>` or `sub-<first>:<last>:<step>` and includes both ends; `sub-0001:sub-1000` is accepted too.
+        The zero-padding width is inferred from the first subject numbers written with leading zeros (e.g. 4 for sub-0001:1000), or 1 if there are none.
+
+        Args:
+            specs (Iterable[str]): The subjects and ranges (e.g. ['sub-0001:0500', 'sub-0700', 'sub-pilot']).
+
+        Returns:
+            SubjectSet: The subjects.
+
+        Raises:
+            ValueError: If a range is empty or has a step below 1, or if the specs are zero-padded to different widths.
+        """
+        intervals, labels, widths = [], [], set()
+
+        for spec in specs:
+            match = SUBJECT_SPEC.fullmatch(spec)
+
+            if not match:
+                if not spec.startswith('sub-'):
+                    raise ValueError(f'Invalid subject: {spec}')
+
+                labels.append(spec)
+                continue
+
+            first, last, step = match.groups()
+            start, end, step = int(first), int(last or first), int(step or 1)
+
+            if end < start or step < 1:
+                raise ValueError(f'Invalid range: {spec}')
+
+            if first.startswith('0'):
+                widths.add(len(first))
+
+            if step == 1:
+                intervals.append((start, end))
+            else:
+                intervals.extend((i, i) for i in range(start, end + 1, step))
+
+        if len(widths) > 1:
+            raise ValueError(f'Subjects zero-padded to different widths {sorted(widths)}: {" ".join(specs)}')
+
+        return cls(intervals, widths.pop() if widths else 1, labels)
+
+    @classmethod
+    def from_subjects(cls, subjects: Iterable[str]) -> 'SubjectSet':
+        """
+        Builds the set of single subject labels, such as the subjects of a dataset.
+
+        Unlike `parse`, ranges are not expanded and labels zero-padded to different widths are accepted; the widest padding is kept.
+
+        Args:
+            subjects (Iterable[str]): The subject labels (e.g. ['sub-01', 'sub-02']).
+
+        Returns:
+            SubjectSet: The subjects.
+        """
+        intervals, labels, width = [], [], 1
+
+        for subject in subjects:
+            match = re.fullmatch(r'sub-(\d+)', subject)
+
+            if match:
+                intervals.append((int(match.group(1)), int(match.group(1))))
+                width = max(width, len(match.group(1)) if match.group(1).startswith('0') else 1)
+            else:
+                labels.append(subject)
+
+        return cls(intervals, width, labels)
+
+    def _has_number(self, num: int) -> bool:
+        i = bisect_right(self._starts, num) - 1
+        return i >= 0 and num <= self.intervals[i][1]
+
+    def __contains__(self, subject: str) -> bool:
+        match = re.fullmatch(r'sub-(\d+)', subject)
+        return self._has_number(int(match.group(1))) if match else subject in self.labels
+
+    def __len__(self) -> int:
+        return sum(hi - lo + 1 for lo, hi in self.intervals) + len(self.labels)
+
+    def __bool__(self) -> bool:
+        return bool(self.intervals or self.labels)
+
+    def __iter__(self) -> Iterator[str]:
+        for lo, hi in self.intervals:
+            for num in range(lo, hi + 1):
+                yield f'sub-{num:0{self.width}d}'
+
+        yield from sorted(self.labels)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, SubjectSet):
+            return NotImplemented
+
+        return self.intervals == other.intervals and self.labels == other.labels
+
+    def __or__(self, other: 'SubjectSet') -> 'SubjectSet':
+        return SubjectSet(self.intervals + other.intervals, max(self.width, other.width), self.labels | other.labels)
+
+    def __and__(self, other: 'SubjectSet') -> 'SubjectSet':
+        intervals, i, j = [], 0, 0
+
+        while i < len(self.intervals) and j < len(other.intervals):
+            (lo_a, hi_a), (lo_b, hi_b) = self.intervals[i], other.intervals[j]
+
+            if max(lo_a, lo_b) <= min(hi_a, hi_b):
+                intervals.append((max(lo_a, lo_b), min(hi_a, hi_b)))
+
+            if hi_a < hi_b:
+                i += 1
+            else:
+                j += 1
+
+        return SubjectSet(intervals, self.width, self.labels & other.labels)
+
+    def __sub__(self, other: 'SubjectSet') -> 'SubjectSet':
+        intervals, j = [], 0
+
+        for lo, hi in self.intervals:
+            # skip the removed intervals that end before this one
+            while j < len(other.intervals) and other.intervals[j][1] < lo:
+                j += 1
+
+            k = j
+
+            while k < len(other.intervals) and other.intervals[k][0] <= hi:
+                cut_lo, cut_hi = other.intervals[k]
+
+                if cut_lo > lo:
+                    intervals.append((lo, cut_lo - 1))
+
+                lo = cut_hi + 1
+                k += 1
+
+            if lo <= hi:
+                intervals.append((lo, hi))
+
+        return SubjectSet(intervals, self.width, self.labels - other.labels)
+
+    def __str__(self) -> str:
+        parts = [
+            f'sub-{lo:0{self.width}d}' if lo == hi else f'sub-{lo:0{self.width}d}:{hi:0{self.width}d}'
+            for lo, hi in self.intervals
+        ]
+        return ' '.join(parts + sorted(self.labels))
+
+    def __repr__(self) -> str:
+        return f'SubjectSet({str(self)!r})'
+
+    def resolve(self, present: Iterable[str]) -> Tuple[List[str], 'SubjectSet']:
+        """
+        Matches the set against the subjects present in a dataset.
+
+        Subjects are matched by number, so the labels found keep the zero-padding of the dataset.
+
+        Args:
+            present (Iterable[str]): The subjects of the dataset (e.g. `BidsIndex.subjects()`).
+
+        Returns:
+            Tuple[List[str], SubjectSet]: The present subjects in the set, sorted by subject number (see `subject_key`), and the subjects of the set that are not present.
+        """
+        found = sorted((subject for subject in present if subject in self), key=subject_key)
+        return found, self - SubjectSet.from_subjects(found)
+
+    def head(self, n: int) -> List[str]:
+        """
+        Args:
+            n (int): The number of subjects.
+
+        Returns:
+            List[str]: The first `n` subjects, without expanding the rest of the set.
+        """
+        out = []
+
+        for subject in self:
+            if len(out) == n:
+                break
+
+            out.append(subject)
+
+        return out
+
+
+def subject_key(label: str) -> Tuple[int, int, str, str]:
+    """
+    Sort key ordering subjects (or job labels such as sub-2_ses-01) by subject number, so sub-2 comes before sub-10 however the labels are padded.
+
+    Subjects whose label is not a number come last, in alphabetical order.
+
+    Args:
+        label (str): The subject or job label.
+
+    Returns:
+        Tuple[int, int, str, str]: The key.
+    """
+    match = re.match(r'sub-(\d+)(.*)', label)
+    return (0, int(match.group(1)), match.group(2), label) if match else (1, 0, '', label)
+
+
+def merge_intervals(intervals: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Sorts intervals and merges the ones that overlap or touch.
+
+    Args:
+        intervals (Iterable[Tuple[int, int]]): Inclusive (first, last) intervals.
+
+    Returns:
+        List[Tuple[int, int]]: The sorted, disjoint intervals.
+    """
+    merged = []
+
+    for lo, hi in sorted(intervals):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+
+    return merged
+
+
+def parse_selection(subjects: Iterable[str], exclude: Optional[Iterable[str]] = None) -> SubjectSet:
+    """
+    Parses the subjects to include and to exclude into one set.
+
+    Args:
+        subjects (Iterable[str]): The subjects and ranges to include.
+        exclude (Optional[Iterable[str]], optional): The subjects and ranges to leave out. Defaults to None.
+
+    Returns:
+        SubjectSet: The selected subjects.
+    """
+    return SubjectSet.parse(subjects) - SubjectSet.parse(exclude or [])
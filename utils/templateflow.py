@@ -0,0 +1,58 @@
+import os
+from typing import List
+
+from utils.anat import standard_spaces
+
+
+# where the TemplateFlow cache is bound in the container
+TEMPLATEFLOW_HOME = '/templateflow'
+# templates fMRIPrep uses whatever the output spaces (registration of the carpet plot, brain extraction)
+INTERNAL_TEMPLATES = ['MNI152NLin2009cAsym', 'OASIS30ANTs']
+
+
+def required_templates(options: str) -> List[str]:
+    """
+    Get the TemplateFlow templates fMRIPrep needs for a set of options.
+
+    Args:
+        options (str): The fMRIPrep options (e.g. '--use-aroma --output-spaces T1w MNI152NLin6Asym').
+
+    Returns:
+        List[str]: The template names.
+
+    """
+    templates = list(INTERNAL_TEMPLATES)
+
+    if '--use-aroma' in options.split():
+        templates.append('MNI152NLin6Asym')
+
+    for space in standard_spaces(options):
+        if space not in templates:
+            templates.append(space)
+
+    return templates
+
+
+def missing_templates(cache: str, templates: List[str]) -> List[str]:
+    """
+    List the templates that are not in a TemplateFlow cache.
+
+    Args:
+        cache (str): The TemplateFlow home directory.
+        templates (List[str]): The template names.
+
+    Returns:
+        List[str]: The templates without a downloaded image in their `tpl-<name>` directory.
+
+    """
+    missing = []
+
+    for template in templates:
+        dir_tpl = os.path.join(cache, f'tpl-{template}')
+        names = os.listdir(dir_tpl) if os.path.isdir(dir_tpl) else []
+
+        # TemplateFlow creates an empty placeholder for every file and downloads it on first use
+        if not any(name.endswith('.nii.gz') and os.path.getsize(os.path.join(dir_tpl, name)) > 0 for name in names):
+            missing.append(template)
+
+    return missing
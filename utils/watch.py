@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from utils.bids import BidsIndex
+from utils.path import write_atomic
+
+
+# the datatypes whose sidecars the generator patches, and the suffix of their images
+WATCHED = {'func': 'bold', 'fmap': 'epi'}
+
+
+def subject_snapshot(index: BidsIndex, subject: str, sessions: List[str]) -> Tuple[Optional[str], str, float]:
+    """
+    Checks whether the functional and field map data of a subject are complete, and takes a snapshot of their files.
+
+    A session is complete when it has at least one `*_bold.json` and one `*_epi.json`, every such sidecar parses as JSON, and every sidecar has its NIfTI image next to it.
+
+    Args:
+        index (BidsIndex): The BIDS index, refreshed.
+        subject (str): The subject.
+        sessions (List[str]): The sessions the subject needs.
+
+    Returns:
+        Tuple[Optional[str], str, float]: The reason the data are incomplete (None if complete), a digest of the path, size and modification time of the files, and the latest modification time.
+    """
+    files, reason = [], None
+
+    for session in sessions:
+        for datatype, suffix in WATCHED.items():
+            found = index.get(subject, session, datatype)
+            sidecars = [f for f in found if f.suffix == suffix and f.extension == '.json']
+            images = {f.path[:-len(f.extension)] for f in found if f.suffix == suffix and f.extension in ('.nii', '.nii.gz')}
+            files.extend(found)
+
+            if reason:
+                continue
+
+            if not sidecars:
+                reason = f'no {suffix} sidecars in {session}/{datatype}'
+            elif any(f.path[:-len(f.extension)] not in images for f in sidecars):
+                reason = f'{suffix} images missing in {session}/{datatype}'
+            else:
+                for f in sidecars:
+                    try:
+                        with open(f.path, 'r') as fp:
+                            json.load(fp)
+                    except (OSError, ValueError):
+                        reason = f'{os.path.basename(f.path)} is not readable yet'
+                        break
+
+    snapshot = []
+
+    for f in files:
+        try:
+            stat = os.stat(f.path)
+        except FileNotFoundError:
+            return f'{os.path.basename(f.path)} disappeared', '', 0.0
+
+        snapshot.append((f.path, stat.st_size, stat.st_mtime_ns))
+
+    snapshot.sort()
+    digest = hashlib.sha256(json.dumps(snapshot).encode()).hexdigest()
+    return reason, digest, max((mtime for _, _, mtime in snapshot), default=0) / 1e9
+
+
+class StabilityTracker:
+    """
+    Decides when the files of a subject have stopped changing, and remembers the files the subjects were enqueued with.
+
+    A subject is stable once its snapshot has stayed the same for the quiet period, as seen by the watcher, or once it is unchanged between two polls and its newest file is older than the quiet period.
+    The first rule does not trust the clocks of the machines writing the files, the second avoids waiting a whole quiet period for data that were already complete when the watcher started.
+    The state is saved to a JSON file, so a restarted watcher (or one run from cron) neither enqueues a subject twice nor forgets how long it has been quiet.
+    """
+    def __init__(self, quiet_period: float, path: str = None):
+        """
+        Initializes the StabilityTracker and loads its state from `path` if it exists.
+
+        Args:
+            quiet_period (float): Seconds without writes after which the data of a subject count as stable.
+            path (str, optional): The path of the state file. Defaults to None (keep the state in memory).
+        """
+        self.quiet_period = quiet_period
+        self.path = path
+        self.seen: Dict[str, list] = {}
+        self.enqueued: Dict[str, str] = {}
+
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    state = json.load(f)
+
+                self.seen, self.enqueued = state['seen'], state['enqueued']
+            except (ValueError, KeyError) as e:
+                logging.warning(f'Ignoring unreadable watch state {path}: {e}')
+
+    def save(self):
+        """
+        Writes the state file.
+        """
+        if self.path:
+            write_atomic(self.path, json.dumps({'seen': self.seen, 'enqueued': self.enqueued}, indent=4))
+
+    def update(self, key: str, snapshot: str, newest: float, now: float) -> bool:
+        """
+        Records the current snapshot of a subject.
+
+        Args:
+            key (str): The subject.
+            snapshot (str): The snapshot of its files (see `subject_snapshot`).
+            newest (float): The latest modification time of its files.
+            now (float): The current time.
+
+        Returns:
+            bool: True if the files are stable.
+        """
+        previous = self.seen.get(key)
+
+        if previous is None or previous[0] != snapshot:
+            self.seen[key] = [snapshot, now]
+            return False
+
+        return now - previous[1] >= self.quiet_period or now - newest >= self.quiet_period
+
+    def forget(self, key: str):
+        """
+        Drops the snapshot of a subject, e.g. while its data are incomplete.
+
+        Args:
+            key (str): The subject.
+        """
+        self.seen.pop(key, None)
+
+    def mark_enqueued(self, key: str, snapshot: str):
+        """
+        Records that a subject was enqueued with the given files.
+
+        Args:
+            key (str): The subject.
+            snapshot (str): The snapshot of its files.
+        """
+        self.seen.pop(key, None)
+        self.enqueued[key] = snapshot
+
+    def is_enqueued(self, key: str, snapshot: str) -> bool:
+        """
+        Args:
+            key (str): The subject.
+            snapshot (str): The snapshot of its files.
+
+        Returns:
+            bool: True if the subject was enqueued with these files.
+        """
+        return self.enqueued.get(key) == snapshot